@@ -0,0 +1,103 @@
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+processName = "ksbenchsleep"
+
+def countCgroupProcesses(path):
+    total = 0
+    for directory, _, _ in os.walk(path):
+        with open(os.path.join(directory, "cgroup.procs")) as procsFile:
+            total += len(procsFile.read().split())
+    return total
+
+def spawnProcessTree(cgroupPath, binDir, processCount, fanout):
+    parents = processCount // (fanout + 1)
+    children = fanout
+    env = dict(os.environ, PATH=f"{binDir}:{os.environ.get('PATH', '')}")
+    script = f"for i in $(seq {children}); do {processName} 1000 & done; wait"
+
+    def joinCgroup():
+        with open(os.path.join(cgroupPath, "cgroup.procs"), "w") as procsFile:
+            procsFile.write(str(os.getpid()))
+
+    spawned = [subprocess.Popen(["sh", "-c", script], env=env, preexec_fn=joinCgroup)
+               for _ in range(parents)]
+
+    expected = parents * (children + 1)
+    deadline = time.monotonic() + 30
+    while countCgroupProcesses(cgroupPath) < expected:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Process tree did not start in time")
+        time.sleep(0.01)
+    return spawned, expected
+
+def timeToZeroSurvivors(cgroupPath, target, timeout):
+    killswitch.processesToKill = [target]
+    killswitch.resolveCgroupTargets()
+
+    start = time.perf_counter()
+    killswitch.killProcess(timeout)
+    while countCgroupProcesses(cgroupPath) > 0:
+        if time.perf_counter() - start > timeout:
+            return None
+        time.sleep(0.0005)
+    return time.perf_counter() - start
+
+def runBenchmark(cgroupRoot, processCount, fanout, rounds, timeout):
+    killswitch.cgroupRoot = cgroupRoot
+    killswitch.logMessage = lambda message: None
+    parentPath = os.path.join(killswitch.getCgroupRoot(), f"usb-killswitch-bench-{os.getpid()}")
+    binDir = tempfile.mkdtemp(prefix="ksbench")
+    os.symlink(shutil.which("sleep"), os.path.join(binDir, processName))
+
+    results = {"pkill by name": [], "cgroup freeze+kill": []}
+    try:
+        for _ in range(rounds):
+            for mode in results:
+                os.mkdir(parentPath)
+                try:
+                    spawned, expected = spawnProcessTree(parentPath, binDir, processCount, fanout)
+                    target = processName if mode == "pkill by name" else f"cgroup:{parentPath}"
+                    elapsed = timeToZeroSurvivors(parentPath, target, timeout)
+                    results[mode].append(elapsed)
+
+                    # Clean up whatever survived so the next round starts empty
+                    with open(os.path.join(parentPath, "cgroup.kill"), "w") as killFile:
+                        killFile.write("1")
+                    for process in spawned:
+                        process.wait()
+                finally:
+                    while countCgroupProcesses(parentPath) > 0:
+                        time.sleep(0.01)
+                    os.rmdir(parentPath)
+    finally:
+        shutil.rmtree(binDir)
+
+    print(f"Time to zero surviving processes, {expected} process tree, {rounds} rounds")
+    for mode, timings in results.items():
+        finished = [timing for timing in timings if timing is not None]
+        if not finished:
+            print(f"  {mode:20} survivors left after {timeout}s in every round")
+            continue
+        print(f"  {mode:20} median {statistics.median(finished) * 1000:8.2f} ms  "
+              f"min {min(finished) * 1000:8.2f} ms  max {max(finished) * 1000:8.2f} ms  "
+              f"timeouts {len(timings) - len(finished)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare pkill and cgroup.kill for a process tree (needs root and cgroup v2)")
+    parser.add_argument("--cgroup-root", default="/sys/fs/cgroup")
+    parser.add_argument("--processes", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=19, help="children per shell parent")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+    runBenchmark(args.cgroup_root, args.processes, args.fanout, args.rounds, args.timeout)
@@ -6,12 +6,40 @@ import time
 import platform
 import os
 import sys
+import ctypes
+import fcntl
+import struct
+import socket
+import http.server
+import socketserver
+import selectors
+import select
+import glob
+import hmac
+import hashlib
+import ipaddress
+import shutil
+import stat
+import shlex
+import re
+import queue
+import sqlite3
+import zipfile
+import json
+import marshal
+import importlib
+import importlib.util
+import codecs
+import locale
 
 usbIdentifier = "K"
 selectedTasks = []
 customCommands = []
 fileToDelete = ""
 processesToKill = []
+fscryptDirectories = []
+fscryptBusyDirectories = []
+blockDevicesToWipe = []
 monitoring = False
 usbMonitoring = False
 osType = "Linux"
@@ -28,6 +56,160 @@ identifierRemoved = False
 systemVolumesCache = []
 nonSystemVolumesCache = []
 lastCacheUpdate = 0
+volumeCacheLock = threading.Lock()
+shutdownSync = True
+shutdownDryRun = False
+lockdownBudget = 120
+sysrqEmergencyEnabled = False
+sysrqTriggerPath = "/proc/sysrq-trigger"
+sysrqDryRunPath = "/tmp/usb-killswitch-sysrq-dry-run"
+sysrqStepDelay = 1
+shutdownReserve = 10
+lowPriorityCutoff = 4
+minimumTaskBudget = 1
+lockdownDeadline = 0
+lockdownBudgetReport = []
+metricsPort = 0
+metricsSocketPath = ""
+metricsTextfileDir = ""
+metricsTextfileInterval = 15
+metricsServer = None
+metricsServerAddress = None
+metricsTextfileThread = None
+metricsLock = threading.Lock()
+metricsCounters = {}
+metricsGauges = {}
+metricsHistograms = {}
+usbAuthorizationGate = False
+usbSysfsRoot = "/sys"
+usbAuthorizedDefaults = {}
+inheritedUsbAuthorizedDefaults = {}
+usbAllowlist = set()
+# CPython's socket module does not export the kobject uevent netlink family
+NETLINK_KOBJECT_UEVENT = 15
+lockdownLock = threading.Lock()
+eventTriggerLinkLoss = False
+eventTriggerPowerLoss = False
+eventTriggerLidClose = False
+eventTriggerInterfaces = []
+eventSourcesThread = None
+linkStates = {}
+mainsStates = {}
+peerTriggerEnabled = False
+peerSecret = ""
+peerDestinations = ["239.77.77.77"]
+peerPort = 47474
+peerMaxAge = 5
+peerSendCopies = 3
+peerNodeId = os.urandom(8)
+peerSeenNonces = {}
+peerListenerThread = None
+peerMagic = b"USBKS1"
+peerHeaderFormat = "!6s8s16sd"
+cgroupRoot = "/sys/fs/cgroup"
+cgroupTargetPrefixes = ("unit:", "slice:", "cgroup:")
+cgroupKillPaths = {}
+selfCgroupPath = "/proc/self/cgroup"
+preflightReport = []
+preflightProbeSize = 4 * 1024 * 1024
+assumedZeroOutThroughput = 100 * 1024 * 1024
+assumedSwapInThroughput = 200 * 1024 * 1024
+assumedShutdownTierLatencies = {"reboot(2) syscall": 0.05, "logind D-Bus": 0.2, "sudo command": 1}
+shutdownTierLatencies = None
+swapsPath = "/proc/swaps"
+deviceHistoryPath = "/var/lib/usb-killswitch/device-history.sqlite3"
+deviceHistoryRetentionDays = 365
+deviceHistoryMaxEvents = 100000
+deviceHistoryBatchSize = 256
+deviceHistoryCoalesceDelay = 0.05
+deviceHistoryCompactInterval = 6 * 3600
+deviceHistoryQueue = queue.Queue()
+deviceHistoryThread = None
+deviceHistoryOpenPath = ""
+knownDevices = {}
+actionRegistry = {}
+actionEntryPointGroup = "usb_killswitch.actions"
+dispatchTable = []
+ramResidentImage = False
+ramImageVariable = "USB_KILLSWITCH_RAM_IMAGE"
+restoreSettingsVariable = "USB_KILLSWITCH_RESTORE_FD"
+runningFromRamImage = os.environ.get(ramImageVariable) == "1"
+triggerPathModules = ["encodings.idna", "encodings.punycode", "stringprep", "unicodedata"]
+settingsWidgetNames = [
+    "usbIdentifierEntry", "veracryptTimeoutEntry", "usbTimeoutEntry", "shredPassesEntry", "lockdownBudgetEntry",
+    "sysrqEmergencyVar", "shutdownModeVar", "shutdownSyncVar", "shutdownDryRunVar", "volumesEntry",
+    "wipeDevicesEntry", "fileEntry", "fscryptEntry", "metricsPortEntry", "metricsSocketEntry",
+    "metricsTextfileEntry", "usbAuthorizationGateVar", "linkLossVar", "powerLossVar", "lidCloseVar",
+    "interfacesEntry", "peerTriggerVar", "peerSecretEntry", "peerDestinationsEntry", "peerPortEntry",
+    "deviceHistoryPathEntry", "deviceHistoryRetentionEntry", "ramResidentVar"
+]
+volumeInventory = {}
+volumeInventoryVersion = 0
+volumeInventoryLock = threading.Lock()
+volumeInventoryThread = None
+volumeInventoryInterval = 30
+fstabCache = (None, (set(), set()))
+histogramBuckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+metricsHelp = {
+    "usb_killswitch_armed": ("gauge", "Whether the monitor is armed"),
+    "usb_killswitch_detection_cycle_seconds": ("histogram", "Time spent on one detection cycle"),
+    "usb_killswitch_devices_seen": ("gauge", "Devices seen in the last USB change check"),
+    "usb_killswitch_triggers": ("counter", "Killswitch triggers"),
+    "usb_killswitch_last_trigger_timestamp_seconds": ("gauge", "Unix time of the last trigger"),
+    "usb_killswitch_action_duration_seconds": ("histogram", "Time spent running a trigger action"),
+    "usb_killswitch_action_budget_seconds": ("gauge", "Budget allotted to the action in the last trigger"),
+    "usb_killswitch_action_outcomes": ("counter", "Trigger action outcomes"),
+    "usb_killswitch_wipe_throughput_bytes_per_second": ("gauge", "Throughput of the last block device wipe"),
+    "usb_killswitch_peer_datagrams": ("counter", "Peer trigger datagrams received by result"),
+    "usb_killswitch_peer_network_seconds": ("histogram", "Peer send to receive time, includes clock offset"),
+    "usb_killswitch_dispatch_seconds": ("histogram", "Time from detection to the start of the lockdown"),
+    "usb_killswitch_preflight_predicted_seconds": ("gauge", "Predicted action duration from the arm-time preflight"),
+    "usb_killswitch_sanitize_step_seconds": ("histogram", "Time spent on one memory and swap sanitization step")
+}
+
+FS_IOC_GET_ENCRYPTION_POLICY = 0x400C6615
+FS_IOC_GET_ENCRYPTION_POLICY_EX = 0xC0096616
+FS_IOC_REMOVE_ENCRYPTION_KEY = 0xC0406618
+FS_IOC_REMOVE_ENCRYPTION_KEY_ALL_USERS = 0xC0406619
+FSCRYPT_KEY_SPEC_TYPE_DESCRIPTOR = 1
+FSCRYPT_KEY_SPEC_TYPE_IDENTIFIER = 2
+FSCRYPT_KEY_REMOVAL_STATUS_FLAG_FILES_BUSY = 0x1
+RTMGRP_LINK = 1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+IFLA_IFNAME = 3
+IFF_LOWER_UP = 0x10000
+EV_SW = 5
+SW_LID = 0
+EVIOCGBIT_EV_SW = 0x80084525
+inputEventFormat = "llHHi"
+BLKGETSIZE64 = 0x80081272
+BLKDISCARD = 0x1277
+BLKSECDISCARD = 0x127D
+BLKZEROOUT = 0x127F
+zeroOutChunkSize = 256 * 1024 * 1024
+DRM_IOCTL_MODE_GETRESOURCES = 0xC04064A0
+DRM_IOCTL_MODE_GETCONNECTOR = 0xC05064A7
+DRM_IOCTL_MODE_GETPROPERTY = 0xC04064AA
+DRM_IOCTL_MODE_SETPROPERTY = 0xC01064AB
+DRM_MODE_DPMS_OFF = 3
+DPMS_MODE_OFF = 3
+lockVerifyTimeout = 2
+KEYCTL_SEARCH = 10
+KEYCTL_INVALIDATE = 21
+KEY_SPEC_SESSION_KEYRING = -3
+KEY_SPEC_USER_KEYRING = -4
+keyctlSyscallNumbers = {"x86_64": 250, "aarch64": 219, "i386": 288, "i686": 288, "armv7l": 311}
+
+LINUX_REBOOT_CMD_POWER_OFF = 0x4321FEDC
+CAP_SYS_BOOT = 22
+MCL_CURRENT = 1
+
+try:
+    libc = ctypes.CDLL(None, use_errno=True)
+except OSError:
+    libc = None
 
 def getCurrentUsbDevices():
     devices = []
@@ -49,8 +231,10 @@ def checkUsbChanges():
     global usbDevices
     try:
         currentDevices = getCurrentUsbDevices()
+        metricSet("usb_killswitch_devices_seen", len(currentDevices))
         if set(currentDevices) != set(usbDevices):
             usbDevices = currentDevices
+            requestDeviceSnapshot("usb_change")
             return True
         return False
     except Exception as e:
@@ -86,83 +270,746 @@ def getMountedUsbVolumes():
         logMessage(f"Error getting mounted USB volumes: {str(e)}")
     return mountedVolumes
 
-def isSystemVolume(device, mountPoint):
-    global systemVolumesCache, nonSystemVolumesCache, lastCacheUpdate
+def decodeMountField(field):
+    # mountinfo and fstab escape spaces and tabs as octal, udev link names use \x hex escapes
+    field = re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field)
+    return re.sub(r"\\x([0-9a-fA-F]{2})", lambda match: chr(int(match.group(1), 16)), field)
+
+def readDiskLinks(directory):
+    links = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return links
+    for name in names:
+        links[os.path.realpath(os.path.join(directory, name))] = decodeMountField(name)
+    return links
+
+def getFstabEntries():
+    global fstabCache
     
-    cacheAge = time.time() - lastCacheUpdate
-    if cacheAge < 60:  # Cache valid for 60 seconds, I should reconsider this
-        if device in systemVolumesCache or mountPoint in systemVolumesCache:
-            return True
-        if device in nonSystemVolumesCache and mountPoint in nonSystemVolumesCache:
-            return False
+    try:
+        modified = os.stat("/etc/fstab").st_mtime_ns
+    except OSError:
+        return set(), set()
+    if fstabCache[0] == modified:
+        return fstabCache[1]
     
+    paths = set()
+    links = set()
+    with open("/etc/fstab") as fstabFile:
+        for line in fstabFile:
+            fields = line.split("#", 1)[0].split()
+            if len(fields) < 2:
+                continue
+            source = decodeMountField(fields[0])
+            paths.add(decodeMountField(fields[1]))
+            key, _, value = source.partition("=")
+            if key in ("UUID", "LABEL", "PARTUUID", "PARTLABEL") and value:
+                # Resolved on lookup, the device behind a UUID can change while the cache is kept
+                links.add(os.path.join(f"/dev/disk/by-{key.lower()}", value.strip('"')))
+            else:
+                paths.add(source)
+    fstabCache = (modified, (paths, links))
+    return paths, links
+
+def isFstabVolume(device, mountPoint):
+    paths, links = getFstabEntries()
+    if device in paths or mountPoint in paths:
+        return True
+    resolved = os.path.realpath(device)
+    return any(os.path.realpath(link) == resolved for link in links)
+
+def classifyVolume(device, mountPoint):
     criticalMounts = ['/', '/boot', '/home', '/var', '/usr', '/etc', '/bin', '/sbin']
     if mountPoint in criticalMounts:
-        systemVolumesCache.append(device)
-        systemVolumesCache.append(mountPoint)
-        lastCacheUpdate = time.time()
         return True
     
     # Check if it's listed in fstab (permanent mounts)
     try:
-        fstabResult = subprocess.run(["grep", device, "/etc/fstab"], 
-                                     capture_output=True, text=True, timeout=5)
-        if fstabResult.returncode == 0 and fstabResult.stdout.strip():
-            systemVolumesCache.append(device)
-            systemVolumesCache.append(mountPoint)
-            lastCacheUpdate = time.time()
+        if isFstabVolume(device, mountPoint):
             return True
     except:
         pass
     
     try:
         if any(fs in mountPoint for fs in ['nfs', 'cifs', 'smb']):
-            systemVolumesCache.append(device)
-            systemVolumesCache.append(mountPoint)
-            lastCacheUpdate = time.time()
             return True
             
         if ('/media/' in mountPoint or '/run/media/' in mountPoint) and '/dev/sd' in device:
-            nonSystemVolumesCache.append(device)
-            nonSystemVolumesCache.append(mountPoint)
-            lastCacheUpdate = time.time()
             return False
     except:
         pass
     
     # If uncertain, assume it's a system volume. Maybe I should take the opposite approach.
-    systemVolumesCache.append(device)
-    systemVolumesCache.append(mountPoint)
-    lastCacheUpdate = time.time()
     return True
 
+def isSystemVolume(device, mountPoint):
+    global lastCacheUpdate
+    
+    # The inventory thread, the GUI and the lockdown all go through here, the caches are only touched under the lock
+    with volumeCacheLock:
+        cacheAge = time.time() - lastCacheUpdate
+        if cacheAge < 60:  # Cache valid for 60 seconds, I should reconsider this
+            if device in systemVolumesCache or mountPoint in systemVolumesCache:
+                return True
+            if device in nonSystemVolumesCache and mountPoint in nonSystemVolumesCache:
+                return False
+    
+    system = classifyVolume(device, mountPoint)
+    with volumeCacheLock:
+        (systemVolumesCache if system else nonSystemVolumesCache).extend((device, mountPoint))
+        lastCacheUpdate = time.time()
+    return system
+
 def updateVolumeCache():
     global systemVolumesCache, nonSystemVolumesCache, lastCacheUpdate
     
     try:
-        systemVolumesCache = []
-        nonSystemVolumesCache = []
-        
+        # Classified into new lists and swapped in at once, so readers never see a half-built cache
+        systemVolumes = []
+        nonSystemVolumes = []
         mountedVolumes = getMountedUsbVolumes()
         for device, mountPoint in mountedVolumes:
-            isSystemVolume(device, mountPoint)
-            
-        lastCacheUpdate = time.time()
+            (systemVolumes if classifyVolume(device, mountPoint) else nonSystemVolumes).extend((device, mountPoint))
+        
+        with volumeCacheLock:
+            systemVolumesCache = systemVolumes
+            nonSystemVolumesCache = nonSystemVolumes
+            lastCacheUpdate = time.time()
         logMessage("Volume cache updated")
     except Exception as e:
         logMessage(f"Error updating volume cache: {str(e)}")
 
-def dismountUsbVolumes():
+def scanVolumeInventory():
+    labels = readDiskLinks("/dev/disk/by-label")
+    uuids = readDiskLinks("/dev/disk/by-uuid")
+    volumes = {}
+    with open("/proc/self/mountinfo") as mountinfoFile:
+        for line in mountinfoFile:
+            fields = line.split()
+            separator = fields.index("-")
+            device = decodeMountField(fields[separator + 2])
+            # Only block devices can be dismounted from the picker, and bind mounts keep their first mount point
+            if not device.startswith("/dev/") or device in volumes:
+                continue
+            mountPoint = decodeMountField(fields[4])
+            resolved = os.path.realpath(device)
+            label = labels.get(resolved, "")
+            try:
+                size = int(readSysfsValue(os.path.join("/sys/class/block", os.path.basename(resolved), "size"), "0")) * 512
+            except ValueError:
+                size = 0
+            volumes[device] = {
+                "device": device,
+                "mountPoint": mountPoint,
+                "label": label,
+                "uuid": uuids.get(resolved, ""),
+                "size": size,
+                "fstype": fields[separator + 1],
+                "system": isSystemVolume(device, mountPoint),
+                "identifier": usbIdentifier in (label, os.path.basename(mountPoint))
+            }
+    return volumes
+
+def refreshVolumeInventory():
+    global volumeInventory, volumeInventoryVersion
+    
+    volumes = scanVolumeInventory()
+    with volumeInventoryLock:
+        if volumes != volumeInventory or volumeInventoryVersion == 0:
+            volumeInventory = volumes
+            volumeInventoryVersion += 1
+
+def monitorVolumeInventory():
+    poller = select.poll()
+    with open("/proc/self/mounts") as mountsFile:
+        # The kernel flags the mount table with POLLPRI whenever something is mounted or unmounted
+        poller.register(mountsFile, select.POLLPRI | select.POLLERR)
+        while True:
+            try:
+                refreshVolumeInventory()
+            except Exception as e:
+                logMessage(f"Error updating volume inventory: {str(e)}")
+            if poller.poll(volumeInventoryInterval * 1000):
+                # Mounting a multi-partition stick is a burst of changes, scan once they settle
+                time.sleep(0.1)
+
+def startVolumeInventory():
+    global volumeInventoryThread
+    
+    if volumeInventoryThread is not None and volumeInventoryThread.is_alive():
+        return
+    volumeInventoryThread = threading.Thread(target=monitorVolumeInventory)
+    volumeInventoryThread.daemon = True
+    volumeInventoryThread.start()
+
+def readSysfsValue(path, default=""):
+    try:
+        with open(path) as sysfsFile:
+            return sysfsFile.read().strip()
+    except OSError:
+        return default
+
+def writeSysfsValue(path, value):
+    with open(path, "w") as sysfsFile:
+        sysfsFile.write(value)
+
+def getUsbDeviceIdentity(devicePath):
+    return (readSysfsValue(os.path.join(devicePath, "idVendor")),
+            readSysfsValue(os.path.join(devicePath, "idProduct")),
+            readSysfsValue(os.path.join(devicePath, "serial")))
+
+def listUsbDevicePaths():
+    devicesDir = os.path.join(usbSysfsRoot, "bus/usb/devices")
+    try:
+        names = os.listdir(devicesDir)
+    except OSError:
+        return []
+    # Interfaces (1-2:1.0) carry no descriptors of their own, only devices and root hubs do
+    return [os.path.join(devicesDir, name) for name in names
+            if ":" not in name and os.path.exists(os.path.join(devicesDir, name, "idVendor"))]
+
+def armUsbAuthorizationGate():
+    global usbAllowlist, usbAuthorizedDefaults, inheritedUsbAuthorizedDefaults
+    
+    usbAllowlist = {getUsbDeviceIdentity(path) for path in listUsbDevicePaths()}
+    usbAuthorizedDefaults = {}
+    for path in listUsbDevicePaths():
+        if not os.path.basename(path).startswith("usb"):
+            continue
+        controlPath = os.path.join(path, "authorized_default")
+        try:
+            # After a re-exec the controllers are still closed, the values to restore come from the old process
+            usbAuthorizedDefaults[controlPath] = inheritedUsbAuthorizedDefaults.get(controlPath) or readSysfsValue(controlPath, "1")
+            writeSysfsValue(controlPath, "0")
+        except OSError as e:
+            logMessage(f"Failed to close USB authorization on {path}: {str(e)}")
+    inheritedUsbAuthorizedDefaults = {}
+    logMessage(f"USB authorization gate closed on {len(usbAuthorizedDefaults)} controllers, {len(usbAllowlist)} devices allowlisted.")
+
+def disarmUsbAuthorizationGate():
+    global usbAuthorizedDefaults
+    
+    for controlPath, value in usbAuthorizedDefaults.items():
+        try:
+            writeSysfsValue(controlPath, value)
+        except OSError as e:
+            logMessage(f"Failed to restore {controlPath}: {str(e)}")
+    if usbAuthorizedDefaults:
+        logMessage("USB authorization defaults restored.")
+    usbAuthorizedDefaults = {}
+
+def parseUevent(data):
+    fields = data.split(b"\0")
+    event = {}
+    for field in fields[1:]:
+        key, separator, value = field.partition(b"=")
+        if separator:
+            event[key.decode(errors="replace")] = value.decode(errors="replace")
+    return event
+
+def handleUsbUevent(event):
+    if event.get("ACTION") != "add" or event.get("SUBSYSTEM") != "usb" or event.get("DEVTYPE") != "usb_device":
+        return False
+    
+    devicePath = os.path.join(usbSysfsRoot, event.get("DEVPATH", "").lstrip("/"))
+    identity = getUsbDeviceIdentity(devicePath)
+    if identity in usbAllowlist:
+        try:
+            writeSysfsValue(os.path.join(devicePath, "authorized"), "1")
+            logMessage(f"Authorized allowlisted USB device {identity[0]}:{identity[1]}")
+        except OSError as e:
+            logMessage(f"Failed to authorize USB device {devicePath}: {str(e)}")
+        return False
+    
+    logMessage(f"Unauthorized USB device {identity[0]}:{identity[1]} held inert at {event.get('DEVPATH')}")
+    return True
+
+def openUsbUeventSocket():
+    ueventSocket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    try:
+        ueventSocket.bind((0, 1))
+        ueventSocket.settimeout(1)
+    except OSError:
+        ueventSocket.close()
+        raise
+    return ueventSocket
+
+def monitorUsbUevents(ueventSocket):
+    try:
+        with ueventSocket:
+            while usbMonitoring:
+                try:
+                    data = ueventSocket.recv(65536)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    logMessage(f"Error reading uevent: {str(e)}")
+                    continue
+                try:
+                    if handleUsbUevent(parseUevent(data)):
+                        logMessage("USB authorization gate blocked a new device. Executing tasks...")
+                        recordTrigger("usb_gate")
+                        executeTasks()
+                except Exception as e:
+                    logMessage(f"Error in USB uevent monitoring: {str(e)}")
+    except Exception as e:
+        logMessage(f"USB uevent monitoring failed: {str(e)}")
+    finally:
+        # With the monitor gone nothing authorizes allowlisted devices, so do not leave the controllers closed
+        if usbMonitoring and usbAuthorizedDefaults:
+            logMessage("USB uevent monitor stopped while armed, reopening the authorization gate.")
+            disarmUsbAuthorizationGate()
+
+deviceHistorySchema = """
+CREATE TABLE IF NOT EXISTS devices (
+    vendor TEXT NOT NULL,
+    product TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    description TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    seen_count INTEGER NOT NULL,
+    PRIMARY KEY (vendor, product, serial)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS device_events (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    action TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    product TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    port TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS device_events_device ON device_events (vendor, product, serial, timestamp);
+CREATE INDEX IF NOT EXISTS device_events_time ON device_events (timestamp);
+CREATE INDEX IF NOT EXISTS devices_last_seen ON devices (last_seen);
+"""
+
+def openDeviceHistory(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    # auto_vacuum only takes effect before the first table is created
+    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(deviceHistorySchema)
+    return connection
+
+def loadKnownDevices(connection):
+    global knownDevices
+    
+    knownDevices = {(vendor, product, serial): (description, firstSeen, lastSeen, count)
+                    for vendor, product, serial, description, firstSeen, lastSeen, count
+                    in connection.execute("SELECT vendor, product, serial, description, first_seen, last_seen, seen_count FROM devices")}
+
+def snapshotUsbDevices():
+    snapshot = {}
+    for path in listUsbDevicePaths():
+        port = os.path.basename(path)
+        # Root hubs are the controllers themselves, not devices that come and go
+        if port.startswith("usb"):
+            continue
+        description = " ".join(value for value in (readSysfsValue(os.path.join(path, "manufacturer")),
+                                                   readSysfsValue(os.path.join(path, "product"))) if value)
+        snapshot[port] = (getUsbDeviceIdentity(path), description)
+    return snapshot
+
+def diffUsbSnapshots(previous, current, timestamp, source):
+    rows = []
+    if previous is None:
+        for port, (identity, description) in current.items():
+            rows.append((timestamp, "present", *identity, port, source, description))
+        return rows
+    for port, (identity, description) in previous.items():
+        if current.get(port, (None,))[0] != identity:
+            rows.append((timestamp, "departed", *identity, port, source, description))
+    for port, (identity, description) in current.items():
+        if previous.get(port, (None,))[0] != identity:
+            rows.append((timestamp, "arrived", *identity, port, source, description))
+    return rows
+
+def writeDeviceEvents(connection, rows):
+    with connection:
+        connection.executemany(
+            "INSERT INTO device_events (timestamp, action, vendor, product, serial, port, source) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [row[:7] for row in rows])
+        connection.executemany(
+            "INSERT INTO devices (vendor, product, serial, description, first_seen, last_seen, seen_count) VALUES (?, ?, ?, ?, ?, ?, 1) "
+            "ON CONFLICT (vendor, product, serial) DO UPDATE SET last_seen = MAX(last_seen, excluded.last_seen), "
+            "seen_count = seen_count + 1, description = CASE WHEN excluded.description != '' THEN excluded.description ELSE description END",
+            [(vendor, product, serial, description, timestamp, timestamp)
+             for timestamp, action, vendor, product, serial, _, _, description in rows if action != "departed"])
+    
+    for timestamp, action, vendor, product, serial, _, _, description in rows:
+        if action == "departed":
+            continue
+        identity = (vendor, product, serial)
+        known = knownDevices.get(identity)
+        if known is None:
+            knownDevices[identity] = (description, timestamp, timestamp, 1)
+        else:
+            knownDevices[identity] = (description or known[0], known[1], max(known[2], timestamp), known[3] + 1)
+
+def compactDeviceHistory(connection):
+    cutoff = time.time() - deviceHistoryRetentionDays * 86400
+    with connection:
+        removed = connection.execute("DELETE FROM device_events WHERE timestamp < ?", (cutoff,)).rowcount
+        removed += connection.execute(
+            "DELETE FROM device_events WHERE id <= (SELECT id FROM device_events ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (deviceHistoryMaxEvents,)).rowcount
+        forgotten = connection.execute("DELETE FROM devices WHERE last_seen < ?", (cutoff,)).rowcount
+    connection.execute("PRAGMA incremental_vacuum")
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if forgotten:
+        loadKnownDevices(connection)
+    if removed or forgotten:
+        logMessage(f"Device history compacted: {removed} events and {forgotten} devices past retention removed.")
+
+def deviceHistoryWriter(connection):
+    previous = None
+    nextCompaction = time.monotonic()
+    try:
+        while True:
+            try:
+                items = [deviceHistoryQueue.get(timeout=max(nextCompaction - time.monotonic(), 0))]
+            except queue.Empty:
+                items = []
+            # A hub or a flapping cable produces bursts of events, they are written as one transaction
+            while items and len(items) < deviceHistoryBatchSize:
+                try:
+                    items.append(deviceHistoryQueue.get(timeout=deviceHistoryCoalesceDelay))
+                except queue.Empty:
+                    break
+            
+            snapshotRequests = [item for item in items if isinstance(item, tuple)]
+            if snapshotRequests:
+                timestamp = min(item[0] for item in snapshotRequests)
+                source = ",".join(sorted({item[1] for item in snapshotRequests}))
+                current = snapshotUsbDevices()
+                rows = diffUsbSnapshots(previous, current, timestamp, source)
+                previous = current
+                if rows:
+                    writeDeviceEvents(connection, rows)
+            
+            if "compact" in items or time.monotonic() >= nextCompaction:
+                compactDeviceHistory(connection)
+                nextCompaction = time.monotonic() + deviceHistoryCompactInterval
+            
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if "stop" in items:
+                return
+    except Exception as e:
+        logMessage(f"Error in device history writer: {str(e)}")
+    finally:
+        connection.close()
+
+def monitorDeviceUevents(writerThread):
+    try:
+        ueventSocket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+        ueventSocket.bind((0, 1))
+        ueventSocket.settimeout(1)
+    except OSError as e:
+        logMessage(f"Error opening device history uevent socket, only monitor checks are recorded: {str(e)}")
+        return
+    
+    with ueventSocket:
+        while writerThread.is_alive():
+            try:
+                event = parseUevent(ueventSocket.recv(65536))
+            except socket.timeout:
+                continue
+            except OSError as e:
+                logMessage(f"Error reading device history uevent: {str(e)}")
+                time.sleep(1)
+                continue
+            if event.get("SUBSYSTEM") == "usb" and event.get("DEVTYPE") == "usb_device" and event.get("ACTION") in ("add", "remove"):
+                requestDeviceSnapshot("uevent")
+
+def requestDeviceSnapshot(source):
+    if deviceHistoryThread is not None:
+        deviceHistoryQueue.put((time.time(), source))
+
+def flushDeviceHistory(timeout):
+    if deviceHistoryThread is None or not deviceHistoryThread.is_alive():
+        return False
+    flushed = threading.Event()
+    deviceHistoryQueue.put(flushed)
+    return flushed.wait(timeout)
+
+def startDeviceHistory():
+    global deviceHistoryThread, deviceHistoryOpenPath
+    
+    if deviceHistoryThread is not None and deviceHistoryThread.is_alive():
+        if deviceHistoryOpenPath == deviceHistoryPath:
+            requestDeviceSnapshot("arm")
+            return
+        deviceHistoryQueue.put("stop")
+        deviceHistoryThread.join(timeout=5)
+    deviceHistoryThread = None
+    if not deviceHistoryPath:
+        return
+    
+    try:
+        connection = openDeviceHistory(deviceHistoryPath)
+        loadKnownDevices(connection)
+    except (OSError, sqlite3.Error) as e:
+        logMessage(f"Error opening device history {deviceHistoryPath}: {str(e)}")
+        return
+    
+    deviceHistoryOpenPath = deviceHistoryPath
+    # The connection is only used by the writer thread from here on
+    deviceHistoryThread = threading.Thread(target=deviceHistoryWriter, args=(connection,))
+    deviceHistoryThread.daemon = True
+    deviceHistoryThread.start()
+    requestDeviceSnapshot("arm")
+    ueventThread = threading.Thread(target=monitorDeviceUevents, args=(deviceHistoryThread,))
+    ueventThread.daemon = True
+    ueventThread.start()
+    logMessage(f"Device history recording to {deviceHistoryPath} ({len(knownDevices)} known devices).")
+
+def parseDeviceIdentity(text):
+    parts = text.strip().split(":", 2)
+    if len(parts) < 2 or not parts[0].strip() or not parts[1].strip():
+        return None
+    # Vendor and product IDs are lower case hex in sysfs, serial numbers are case sensitive
+    return (parts[0].strip().lower(), parts[1].strip().lower(), parts[2].strip() if len(parts) == 3 else "")
+
+def queryDeviceHistory(query, parameters=()):
+    connection = sqlite3.connect(f"file:{deviceHistoryPath}?mode=ro", uri=True, timeout=5)
+    try:
+        return connection.execute(query, parameters).fetchall()
+    finally:
+        connection.close()
+
+def lookupDevice(identity):
+    if deviceHistoryThread is not None and deviceHistoryThread.is_alive():
+        return knownDevices.get(identity)
+    rows = queryDeviceHistory(
+        "SELECT description, first_seen, last_seen, seen_count FROM devices WHERE vendor = ? AND product = ? AND serial = ?",
+        identity)
+    return rows[0] if rows else None
+
+def getDeviceEvents(identity=None, limit=500):
+    if identity is None:
+        return queryDeviceHistory(
+            "SELECT timestamp, action, vendor, product, serial, port, source FROM device_events ORDER BY timestamp DESC LIMIT ?",
+            (limit,))
+    return queryDeviceHistory(
+        "SELECT timestamp, action, vendor, product, serial, port, source FROM device_events "
+        "WHERE vendor = ? AND product = ? AND serial = ? ORDER BY timestamp DESC LIMIT ?",
+        (*identity, limit))
+
+def parseLinkMessages(data):
+    links = []
+    offset = 0
+    while offset + 16 <= len(data):
+        length, messageType = struct.unpack_from("<IH", data, offset)
+        if length < 16:
+            break
+        if messageType in (RTM_NEWLINK, RTM_DELLINK) and length >= 32:
+            flags = struct.unpack_from("<I", data, offset + 24)[0]
+            name = None
+            attributeOffset = offset + 32
+            while attributeOffset + 4 <= offset + length:
+                attributeLength, attributeType = struct.unpack_from("<HH", data, attributeOffset)
+                if attributeLength < 4:
+                    break
+                if attributeType == IFLA_IFNAME:
+                    name = data[attributeOffset + 4:attributeOffset + attributeLength].rstrip(b"\0").decode(errors="replace")
+                attributeOffset += (attributeLength + 3) & ~3
+            links.append((messageType, name, flags))
+        offset += (length + 3) & ~3
+    return links
+
+def snapshotLinkStates():
+    global linkStates
+    
+    linkStates = {}
+    for interfacePath in glob.glob("/sys/class/net/*"):
+        name = os.path.basename(interfacePath)
+        if name != "lo":
+            linkStates[name] = readSysfsValue(os.path.join(interfacePath, "carrier"), "0") == "1"
+
+def handleLinkEvent(messageType, name, flags):
+    monitored = eventTriggerInterfaces or [interface for interface, up in linkStates.items() if up]
+    wasUp = linkStates.get(name, False)
+    isUp = messageType == RTM_NEWLINK and bool(flags & IFF_LOWER_UP)
+    linkStates[name] = isUp
+    
+    if name in monitored and wasUp and not isUp:
+        logMessage(f"Network link lost on {name}")
+        return True
+    return False
+
+def snapshotMainsStates():
+    global mainsStates
+    
+    mainsStates = {}
+    for supplyPath in glob.glob("/sys/class/power_supply/*"):
+        if readSysfsValue(os.path.join(supplyPath, "type")) == "Mains":
+            mainsStates[os.path.basename(supplyPath)] = readSysfsValue(os.path.join(supplyPath, "online")) == "1"
+
+def handlePowerUevent(event):
+    if event.get("SUBSYSTEM") != "power_supply" or event.get("POWER_SUPPLY_TYPE", "Mains") != "Mains":
+        return False
+    
+    name = event.get("POWER_SUPPLY_NAME") or os.path.basename(event.get("DEVPATH", ""))
+    if name not in mainsStates:
+        return False
+    online = event.get("POWER_SUPPLY_ONLINE")
+    if online is None:
+        online = readSysfsValue(os.path.join("/sys", event.get("DEVPATH", "").lstrip("/"), "online"))
+    
+    wasOnline = mainsStates[name]
+    mainsStates[name] = online == "1"
+    if wasOnline and online != "1":
+        logMessage(f"AC power lost on {name}")
+        return True
+    return False
+
+def openLidSwitches():
+    switches = []
+    for eventPath in glob.glob("/dev/input/event*"):
+        try:
+            inputFd = os.open(eventPath, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            continue
+        try:
+            switchBits = bytearray(8)
+            fcntl.ioctl(inputFd, EVIOCGBIT_EV_SW, switchBits, True)
+            if switchBits[0] & (1 << SW_LID):
+                switches.append(inputFd)
+                continue
+        except OSError:
+            pass
+        os.close(inputFd)
+    return switches
+
+def handleInputEvents(data):
+    eventSize = struct.calcsize(inputEventFormat)
+    for offset in range(0, len(data) - eventSize + 1, eventSize):
+        _, _, eventType, code, value = struct.unpack_from(inputEventFormat, data, offset)
+        if eventType == EV_SW and code == SW_LID and value == 1:
+            logMessage("Laptop lid closed")
+            return True
+    return False
+
+def openEventSources(selector):
+    opened = []
+    
+    # Each source is opened on its own, so one that cannot be armed never takes the others down with it
+    if eventTriggerLinkLoss:
+        linkSocket = None
+        try:
+            linkSocket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            linkSocket.bind((0, RTMGRP_LINK))
+            linkSocket.setblocking(False)
+            snapshotLinkStates()
+            selector.register(linkSocket, selectors.EVENT_READ, "network_link")
+            opened.append(linkSocket)
+        except Exception as e:
+            logMessage(f"Error opening rtnetlink socket: {str(e)}")
+            if linkSocket is not None:
+                linkSocket.close()
+    
+    if eventTriggerPowerLoss:
+        powerSocket = None
+        try:
+            powerSocket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            powerSocket.bind((0, 1))
+            powerSocket.setblocking(False)
+            snapshotMainsStates()
+            selector.register(powerSocket, selectors.EVENT_READ, "ac_power")
+            opened.append(powerSocket)
+        except Exception as e:
+            logMessage(f"Error opening power uevent socket: {str(e)}")
+            if powerSocket is not None:
+                powerSocket.close()
+    
+    if eventTriggerLidClose:
+        try:
+            switches = openLidSwitches()
+        except Exception as e:
+            logMessage(f"Error opening lid switches: {str(e)}")
+            switches = []
+        if not switches:
+            logMessage("No lid switch found under /dev/input")
+        for inputFd in switches:
+            selector.register(inputFd, selectors.EVENT_READ, "lid")
+            opened.append(inputFd)
+    
+    return opened
+
+def readEventSource(source, kind):
+    if kind == "lid":
+        return handleInputEvents(os.read(source, 4096))
+    data = source.recv(65536)
+    if kind == "network_link":
+        return any(handleLinkEvent(*link) for link in parseLinkMessages(data))
+    return handlePowerUevent(parseUevent(data))
+
+def monitorEventSources():
+    selector = selectors.DefaultSelector()
+    opened = openEventSources(selector)
+    if opened:
+        logMessage("Event trigger sources armed.")
+    
+    try:
+        while opened and (monitoring or usbMonitoring):
+            for key, _ in selector.select(timeout=1):
+                try:
+                    triggered = readEventSource(key.fileobj, key.data)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except Exception as e:
+                    logMessage(f"Error reading {key.data} event: {str(e)}")
+                    continue
+                
+                if triggered:
+                    logMessage(f"{key.data} event detected. Executing tasks...")
+                    recordTrigger(key.data)
+                    executeTasks()
+    except Exception as e:
+        logMessage(f"Error in event trigger monitoring: {str(e)}")
+    finally:
+        for source in opened:
+            selector.unregister(source)
+            if isinstance(source, int):
+                os.close(source)
+            else:
+                source.close()
+        selector.close()
+
+def startEventSources():
+    global eventSourcesThread
+    
+    if not (eventTriggerLinkLoss or eventTriggerPowerLoss or eventTriggerLidClose):
+        return
+    if eventSourcesThread is not None and eventSourcesThread.is_alive():
+        return
+    eventSourcesThread = threading.Thread(target=monitorEventSources)
+    eventSourcesThread.daemon = True
+    eventSourcesThread.start()
+
+def dismountUsbVolumes(timeout=None):
+    timeout = timeout or usbTimeout
     try:
         logMessage("Attempting to dismount USB volumes...")
         dismountThread = threading.Thread(target=dismountUsbVolumesTask)
         dismountThread.daemon = True
         dismountThread.start()
         
-        dismountThread.join(timeout=usbTimeout)
+        dismountThread.join(timeout=timeout)
         
         if dismountThread.is_alive():
-            logMessage(f"USB volume dismounting taking too long (>{usbTimeout}s). Proceeding with next actions.")
+            logMessage(f"USB volume dismounting taking too long (>{timeout:.0f}s). Proceeding with next actions.")
             return False
         return True
     except Exception as e:
@@ -199,41 +1046,157 @@ def dismountVolume(device, mountPoint):
     except (subprocess.SubprocessError, subprocess.TimeoutExpired) as e:
         logMessage(f"Error dismounting {mountPoint}: {str(e)}")
 
-def dismountVeracryptVolumes():
+def dismountVeracryptVolumes(timeout=None):
+    timeout = timeout or veracryptTimeout
     try:
         logMessage("Attempting to dismount VeraCrypt volumes...")
-        dismountThread = threading.Thread(target=dismountVeracryptTask)
+        dismountThread = threading.Thread(target=dismountVeracryptTask, args=(timeout,))
         dismountThread.daemon = True
         dismountThread.start()
         
-        dismountThread.join(timeout=veracryptTimeout)
+        dismountThread.join(timeout=timeout)
         
         if dismountThread.is_alive():
-            logMessage(f"VeraCrypt dismount taking too long (>{veracryptTimeout}s). Proceeding with next actions.")
+            logMessage(f"VeraCrypt dismount taking too long (>{timeout:.0f}s). Proceeding with next actions.")
             return False
         return True
     except Exception as e:
         logMessage(f"Error during VeraCrypt dismount: {str(e)}")
         return False
 
-def dismountVeracryptTask():
+def dismountVeracryptTask(timeout):
     try:
-        subprocess.run("veracrypt -d", shell=True, timeout=veracryptTimeout-2)
+        subprocess.run("veracrypt -d", shell=True, timeout=max(1, timeout-2))
         logMessage("VeraCrypt volumes dismounted successfully.")
     except (subprocess.SubprocessError, subprocess.TimeoutExpired) as e:
         logMessage(f"Error in VeraCrypt dismount task: {str(e)}")
 
-def killProcess():
+def getCgroupRoot():
+    # Hybrid hierarchies mount cgroup v2 under unified/
+    if not os.path.exists(os.path.join(cgroupRoot, "cgroup.controllers")):
+        unifiedRoot = os.path.join(cgroupRoot, "unified")
+        if os.path.exists(os.path.join(unifiedRoot, "cgroup.controllers")):
+            return unifiedRoot
+    return cgroupRoot
+
+def isCgroupTarget(target):
+    return target.startswith(cgroupTargetPrefixes)
+
+def getOwnCgroup():
+    # The cgroup v2 entry is the one with hierarchy id 0 and no controllers
+    for line in readSysfsValue(selfCgroupPath).splitlines():
+        hierarchy, _, rest = line.partition(":")
+        controllers, _, path = rest.partition(":")
+        if hierarchy == "0" and not controllers:
+            return os.path.join(getCgroupRoot(), path.lstrip("/")).rstrip("/")
+    return None
+
+def containsOwnCgroup(path):
+    # Freezing our own cgroup or an ancestor would freeze the lockdown and the watchdog with it
+    ownCgroup = getOwnCgroup()
+    path = os.path.normpath(path)
+    return ownCgroup is not None and (ownCgroup == path or ownCgroup.startswith(path + "/"))
+
+def resolveCgroupTarget(target):
+    kind, _, value = target.partition(":")
+    value = value.strip()
+    root = getCgroupRoot()
+    
+    if kind == "cgroup":
+        path = value if value.startswith(root) else os.path.join(root, value.lstrip("/"))
+        return [path] if os.path.isdir(path) else []
+    
+    matches = []
+    for directory, subdirectories, _ in os.walk(root):
+        for name in list(subdirectories):
+            if name == value:
+                matches.append(os.path.join(directory, name))
+                subdirectories.remove(name)
+    return matches
+
+def resolveCgroupTargets():
+    global cgroupKillPaths
+    
+    cgroupKillPaths = {}
+    for target in processesToKill:
+        if not isCgroupTarget(target):
+            continue
+        paths = resolveCgroupTarget(target)
+        for path in [path for path in paths if containsOwnCgroup(path)]:
+            logMessage(f"Kill target {target} contains the killswitch's own cgroup {path}, it will be skipped")
+            paths.remove(path)
+        cgroupKillPaths[target] = paths
+        if paths:
+            logMessage(f"Kill target {target} resolved to {', '.join(paths)}")
+        else:
+            logMessage(f"Kill target {target} did not match any cgroup yet")
+
+def killCgroupFallback(path):
+    for directory, _, _ in os.walk(path, topdown=False):
+        for pid in readSysfsValue(os.path.join(directory, "cgroup.procs")).split():
+            try:
+                os.kill(int(pid), 9)
+            except (OSError, ValueError):
+                pass
+
+def killCgroupTargets(targets, deadline):
+    paths = []
+    for target in targets:
+        targetPaths = [path for path in cgroupKillPaths.get(target, []) if os.path.isdir(path)]
+        paths.extend(targetPaths or resolveCgroupTarget(target))
+    for path in [path for path in paths if containsOwnCgroup(path)]:
+        logMessage(f"Refusing to freeze and kill cgroup {path}, the killswitch itself runs inside it")
+        paths.remove(path)
+    if not paths:
+        logMessage(f"No cgroups found for kill targets: {', '.join(targets)}")
+        return
+    
+    # Freeze every group first so nothing can respawn or escape while the kills land
+    for path in paths:
+        try:
+            writeSysfsValue(os.path.join(path, "cgroup.freeze"), "1")
+        except OSError as e:
+            logMessage(f"Failed to freeze cgroup {path}: {str(e)}")
+    
+    for path in paths:
+        try:
+            writeSysfsValue(os.path.join(path, "cgroup.kill"), "1")
+        except OSError:
+            # cgroup.kill needs Linux 5.14, older kernels get one SIGKILL per process
+            killCgroupFallback(path)
+    
+    for path in paths:
+        while "populated 1" in readSysfsValue(os.path.join(path, "cgroup.events")) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if "populated 1" in readSysfsValue(os.path.join(path, "cgroup.events")):
+            logMessage(f"Processes still alive in cgroup {path}")
+        else:
+            logMessage(f"Cgroup {path} terminated successfully.")
+
+def killProcess(timeout=None):
     if not processesToKill:
         return
-        
+    
+    deadline = time.monotonic() + (timeout or 5 * len(processesToKill))
+    cgroupTargets = [process for process in processesToKill if isCgroupTarget(process)]
+    if cgroupTargets:
+        try:
+            killCgroupTargets(cgroupTargets, deadline)
+        except Exception as e:
+            logMessage(f"Error terminating cgroup targets: {str(e)}")
+    
     for process in processesToKill:
-        if not process.strip():
+        if not process.strip() or isCgroupTarget(process):
             continue
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logMessage(f"Process budget exhausted before terminating: {process}")
+            return False
             
         try:
             logMessage(f"Attempting to terminate process: {process}")
-            result = subprocess.run(f"pkill -9 {process}", shell=True, capture_output=True, timeout=5)
+            result = subprocess.run(f"pkill -9 {process}", shell=True, capture_output=True, timeout=min(5, remaining))
             if result.returncode != 0:
                 logMessage(f"Failed to terminate process: {result.stderr.decode()}")
             else:
@@ -241,31 +1204,715 @@ def killProcess():
         except (subprocess.SubprocessError, subprocess.TimeoutExpired) as e:
             logMessage(f"Error terminating process {process}: {str(e)}")
 
-def shutdownSystem():
+def hasCapability(capability):
     try:
-        logMessage("Shutdown will run last after all other processes are complete.")
-        logMessage(f"Initiating system {shutdownMode} shutdown...")
+        with open("/proc/self/status") as statusFile:
+            for line in statusFile:
+                if line.startswith("CapEff:"):
+                    return bool(int(line.split()[1], 16) & (1 << capability))
+    except (OSError, ValueError):
+        pass
+    return False
+
+def getSystemBusPath():
+    address = os.environ.get("DBUS_SYSTEM_BUS_ADDRESS", "unix:path=/run/dbus/system_bus_socket")
+    for part in address.split(";"):
+        if part.startswith("unix:path="):
+            return part[len("unix:path="):]
+    return "/run/dbus/system_bus_socket"
+
+def dbusAlign(buffer, alignment):
+    buffer.extend(b"\0" * (-len(buffer) % alignment))
+
+def dbusAppend(buffer, typeCode, value):
+    if typeCode in "so":
+        data = value.encode()
+        dbusAlign(buffer, 4)
+        buffer.extend(struct.pack("<I", len(data)) + data + b"\0")
+    elif typeCode == "g":
+        data = value.encode()
+        buffer.extend(struct.pack("<B", len(data)) + data + b"\0")
+    elif typeCode in "bu":
+        dbusAlign(buffer, 4)
+        buffer.extend(struct.pack("<I", int(value)))
+    elif typeCode == "y":
+        buffer.extend(struct.pack("<B", value))
+    else:
+        raise ValueError(f"Unsupported D-Bus type: {typeCode}")
+
+dbusAlignments = {"y": 1, "g": 1, "v": 1, "n": 2, "q": 2, "b": 4, "u": 4, "i": 4, "h": 4, "s": 4, "o": 4, "a": 4,
+                  "x": 8, "t": 8, "d": 8, "(": 8, "{": 8}
+
+def dbusTypeEnd(signature, index):
+    if signature[index] == "a":
+        return dbusTypeEnd(signature, index + 1)
+    if signature[index] in "({":
+        index += 1
+        while signature[index] not in ")}":
+            index = dbusTypeEnd(signature, index)
+    return index + 1
+
+def dbusSplitSignature(signature):
+    types = []
+    index = 0
+    while index < len(signature):
+        end = dbusTypeEnd(signature, index)
+        types.append(signature[index:end])
+        index = end
+    return types
+
+def dbusRead(data, offset, typeCode):
+    if typeCode[0] == "a":
+        offset += -offset % 4
+        length = struct.unpack_from("<I", data, offset)[0]
+        offset += 4 + (-(offset + 4) % dbusAlignments[typeCode[1]])
+        end = offset + length
+        values = []
+        while offset < end:
+            value, offset = dbusRead(data, offset, typeCode[1:])
+            values.append(value)
+        return (dict(values) if typeCode[1] == "{" else values), offset
+    if typeCode[0] in "({":
+        offset += -offset % 8
+        values = []
+        for memberType in dbusSplitSignature(typeCode[1:-1]):
+            value, offset = dbusRead(data, offset, memberType)
+            values.append(value)
+        return tuple(values), offset
+    if typeCode == "v":
+        signature, offset = dbusRead(data, offset, "g")
+        return dbusRead(data, offset, signature)
+    if typeCode in ("s", "o"):
+        offset += -offset % 4
+        length = struct.unpack_from("<I", data, offset)[0]
+        return data[offset + 4:offset + 4 + length].decode(errors="replace"), offset + 5 + length
+    if typeCode == "g":
+        length = data[offset]
+        return data[offset + 1:offset + 1 + length].decode(), offset + 2 + length
+    if typeCode in ("n", "q"):
+        offset += -offset % 2
+        return struct.unpack_from("<h" if typeCode == "n" else "<H", data, offset)[0], offset + 2
+    if typeCode in ("b", "u", "i", "h"):
+        offset += -offset % 4
+        value = struct.unpack_from("<i" if typeCode == "i" else "<I", data, offset)[0]
+        return (bool(value) if typeCode == "b" else value), offset + 4
+    if typeCode in ("x", "t", "d"):
+        offset += -offset % 8
+        return struct.unpack_from({"x": "<q", "t": "<Q", "d": "<d"}[typeCode], data, offset)[0], offset + 8
+    if typeCode == "y":
+        return data[offset], offset + 1
+    raise ValueError(f"Unsupported D-Bus type: {typeCode}")
+
+def dbusBuildMethodCall(serial, destination, path, interface, member, signature="", args=()):
+    body = bytearray()
+    for typeCode, value in zip(signature, args):
+        dbusAppend(body, typeCode, value)
+    
+    headerFields = [(1, "o", path), (2, "s", interface), (3, "s", member), (6, "s", destination)]
+    if signature:
+        headerFields.append((8, "g", signature))
+    
+    fields = bytearray()
+    for code, typeCode, value in headerFields:
+        dbusAlign(fields, 8)
+        fields.append(code)
+        dbusAppend(fields, "g", typeCode)
+        dbusAppend(fields, typeCode, value)
+    
+    message = bytearray(struct.pack("<cBBBII", b"l", 1, 0, 1, len(body), serial))
+    message.extend(struct.pack("<I", len(fields)) + fields)
+    dbusAlign(message, 8)
+    return bytes(message + body)
+
+def receiveExact(sock, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("D-Bus connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+def dbusReceiveMessage(sock):
+    fixed = receiveExact(sock, 16)
+    if fixed[0:1] != b"l":
+        raise ConnectionError("Big-endian D-Bus messages are not supported")
+    messageType = fixed[1]
+    bodyLength, _, fieldsLength = struct.unpack_from("<III", fixed, 4)
+    fields = receiveExact(sock, fieldsLength + (-(16 + fieldsLength) % 8))
+    body = receiveExact(sock, bodyLength)
+    
+    headers = {}
+    offset = 0
+    while offset < fieldsLength:
+        offset += -offset % 8
+        code = fields[offset]
+        typeCode, offset = dbusRead(fields, offset + 1, "g")
+        headers[code], offset = dbusRead(fields, offset, typeCode)
+    
+    values = []
+    offset = 0
+    for typeCode in dbusSplitSignature(headers.get(8, "")):
+        value, offset = dbusRead(body, offset, typeCode)
+        values.append(value)
+    return messageType, headers, values
+
+def dbusCallSystemBus(destination, path, interface, member, signature="", args=(), timeout=2):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(getSystemBusPath())
+        sock.sendall(b"\0AUTH EXTERNAL " + str(os.geteuid()).encode().hex().encode() + b"\r\n")
+        if not sock.recv(256).startswith(b"OK"):
+            raise ConnectionError("D-Bus authentication rejected")
+        sock.sendall(b"BEGIN\r\n")
+        
+        sock.sendall(dbusBuildMethodCall(1, "org.freedesktop.DBus", "/org/freedesktop/DBus",
+                                         "org.freedesktop.DBus", "Hello"))
+        sock.sendall(dbusBuildMethodCall(2, destination, path, interface, member, signature, args))
         
+        while True:
+            messageType, headers, values = dbusReceiveMessage(sock)
+            if headers.get(5) != 2:
+                continue
+            if messageType == 3:
+                errorText = values[0] if values else ""
+                raise RuntimeError(f"{headers.get(4)}: {errorText}")
+            return values
+
+def powerOffWithSyscall():
+    if libc is None or not hasCapability(CAP_SYS_BOOT):
+        return False
+    
+    if shutdownSync:
+        libc.sync()
+    if libc.reboot(LINUX_REBOOT_CMD_POWER_OFF) != 0:
+        logMessage(f"reboot(2) failed: {os.strerror(ctypes.get_errno())}")
+    return False
+
+def powerOffWithLogind():
+    try:
+        dbusCallSystemBus("org.freedesktop.login1", "/org/freedesktop/login1",
+                          "org.freedesktop.login1.Manager", "PowerOff", "b", (False,))
+        logMessage("Power off requested through logind.")
+        return True
+    except Exception as e:
+        # A malformed reply breaks the hand-rolled parser in ways other than OSError, the fallback must still run
+        logMessage(f"logind power off failed: {str(e)}")
+        return False
+
+def powerOffWithCommand():
+    try:
         if shutdownMode == "forced":
             subprocess.run("sudo poweroff -f", shell=True, timeout=10)
         else:
             subprocess.run("sudo shutdown -h now", shell=True, timeout=10)
-            
+        return True
     except (subprocess.SubprocessError, subprocess.TimeoutExpired) as e:
         logMessage(f"Failed to shutdown system: {str(e)}")
+        return False
 
-def deleteFiles():
+def measureShutdownTiers():
+    latencies = {}
+    
+    if libc is not None and hasCapability(CAP_SYS_BOOT):
+        start = time.perf_counter()
+        if shutdownSync:
+            libc.sync()
+        # An invalid command still goes through the capability check but never powers off
+        libc.reboot(1)
+        latencies["reboot(2) syscall"] = time.perf_counter() - start
+    else:
+        latencies["reboot(2) syscall"] = None
+    
+    start = time.perf_counter()
+    try:
+        dbusCallSystemBus("org.freedesktop.login1", "/org/freedesktop/login1",
+                          "org.freedesktop.login1.Manager", "CanPowerOff")
+        latencies["logind D-Bus"] = time.perf_counter() - start
+    except (OSError, RuntimeError, ValueError):
+        latencies["logind D-Bus"] = None
+    
+    start = time.perf_counter()
+    try:
+        subprocess.run("sudo -n true", shell=True, capture_output=True, timeout=10)
+        latencies["sudo command"] = time.perf_counter() - start
+    except (subprocess.SubprocessError, subprocess.TimeoutExpired):
+        latencies["sudo command"] = None
+    
+    return latencies
+
+def predictShutdownTiers():
+    # Only checks which tiers are usable, measuring would sync the disks and run sudo
+    return {
+        "reboot(2) syscall": assumedShutdownTierLatencies["reboot(2) syscall"]
+            if libc is not None and hasCapability(CAP_SYS_BOOT) else None,
+        "logind D-Bus": assumedShutdownTierLatencies["logind D-Bus"]
+            if os.path.exists(getSystemBusPath()) else None,
+        "sudo command": assumedShutdownTierLatencies["sudo command"] if shutil.which("sudo") else None
+    }
+
+def reportShutdownLatency():
+    global shutdownTierLatencies
+    
+    shutdownTierLatencies = measureShutdownTiers()
+    for tier, latency in shutdownTierLatencies.items():
+        if latency is None:
+            logMessage(f"Shutdown tier '{tier}' unavailable")
+        else:
+            logMessage(f"Shutdown tier '{tier}' latency: {latency * 1000000:.0f} us")
+
+def runShutdownTier(tier, powerOff):
+    # Whatever goes wrong in one tier, control has to fall through to the next one
+    try:
+        return powerOff()
+    except Exception as e:
+        logMessage(f"Shutdown tier '{tier}' failed: {str(e)}")
+        return False
+
+def shutdownSystem():
+    try:
+        logMessage("Shutdown will run last after all other processes are complete.")
+        logMessage(f"Initiating system {shutdownMode} shutdown...")
+        
+        if shutdownDryRun:
+            logMessage("Shutdown dry run enabled, measuring tiers without powering off.")
+            reportShutdownLatency()
+            return
+        
+        if shutdownMode == "forced" and runShutdownTier("reboot(2) syscall", powerOffWithSyscall):
+            return
+        if (shutdownMode != "forced" or os.geteuid() != 0) and runShutdownTier("logind D-Bus", powerOffWithLogind):
+            return
+        runShutdownTier("sudo command", powerOffWithCommand)
+    except Exception as e:
+        logMessage(f"Failed to shutdown system: {str(e)}")
+
+def getFscryptKeySpecifier(directoryFd):
+    try:
+        policy = bytearray(struct.pack("<Q", 24) + bytes(24))
+        fcntl.ioctl(directoryFd, FS_IOC_GET_ENCRYPTION_POLICY_EX, policy, True)
+        version = policy[8]
+    except OSError:
+        # Kernels before 5.4 only know the v1 ioctl
+        policy = bytearray(8) + bytearray(12)
+        fcntl.ioctl(directoryFd, FS_IOC_GET_ENCRYPTION_POLICY, memoryview(policy)[8:], True)
+        version = 0
+    
+    if version == 2:
+        return FSCRYPT_KEY_SPEC_TYPE_IDENTIFIER, bytes(policy[16:32])
+    return FSCRYPT_KEY_SPEC_TYPE_DESCRIPTOR, bytes(policy[12:20])
+
+def invalidateFscryptKeyringKey(descriptor):
+    syscallNumber = keyctlSyscallNumbers.get(platform.machine())
+    if libc is None or syscallNumber is None:
+        return False
+    
+    # Legacy v1 keys live in a keyring as logon keys named <prefix>:<descriptor>
+    for prefix in ("fscrypt", "ext4", "f2fs"):
+        description = f"{prefix}:{descriptor.hex()}".encode()
+        for keyring in (KEY_SPEC_SESSION_KEYRING, KEY_SPEC_USER_KEYRING):
+            keySerial = libc.syscall(syscallNumber, KEYCTL_SEARCH, ctypes.c_long(keyring),
+                                     b"logon", description, ctypes.c_long(0))
+            if keySerial > 0 and libc.syscall(syscallNumber, KEYCTL_INVALIDATE, ctypes.c_long(keySerial)) == 0:
+                return True
+    return False
+
+def findMountRoot(path):
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+def removeFscryptKey(directory):
+    directoryFd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        specType, keyBytes = getFscryptKeySpecifier(directoryFd)
+    finally:
+        os.close(directoryFd)
+    
+    # Holding the encrypted directory open would itself keep the key busy, so go through the mount root
+    rootFd = os.open(findMountRoot(directory), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        removeArg = bytearray(64)
+        struct.pack_into("<II", removeArg, 0, specType, 0)
+        removeArg[8:8 + len(keyBytes)] = keyBytes
+        request = FS_IOC_REMOVE_ENCRYPTION_KEY_ALL_USERS if os.geteuid() == 0 else FS_IOC_REMOVE_ENCRYPTION_KEY
+        try:
+            fcntl.ioctl(rootFd, request, removeArg, True)
+        except OSError as e:
+            if specType == FSCRYPT_KEY_SPEC_TYPE_DESCRIPTOR and invalidateFscryptKeyringKey(keyBytes):
+                logMessage(f"Invalidated keyring key for {directory}")
+                return True
+            raise e
+        
+        if struct.unpack_from("<I", removeArg, 40)[0] & FSCRYPT_KEY_REMOVAL_STATUS_FLAG_FILES_BUSY:
+            logMessage(f"Key removed for {directory}, but some files are still in use")
+            return False
+        logMessage(f"Encryption key removed for {directory}")
+        return True
+    finally:
+        os.close(rootFd)
+
+def dropPageCaches():
+    try:
+        if libc is not None:
+            libc.sync()
+        writeSysfsValue("/proc/sys/vm/drop_caches", "3")
+        return True
+    except OSError as e:
+        logMessage(f"Failed to drop page caches: {str(e)}")
+        return False
+
+def cryptoEraseDirectories(timeout=None):
+    global fscryptBusyDirectories
+    
+    fscryptBusyDirectories = []
+    completed = True
+    for directory in fscryptDirectories:
+        try:
+            if not removeFscryptKey(directory):
+                fscryptBusyDirectories.append(directory)
+                completed = False
+        except OSError as e:
+            completed = False
+            logMessage(f"Failed to crypto-erase {directory}: {str(e)}")
+    
+    dropPageCaches()
+    return completed
+
+def getMountedPartitions(device):
+    deviceName = os.path.basename(os.path.realpath(device))
+    blockDir = os.path.join("/sys/class/block", deviceName)
+    names = {deviceName}
+    try:
+        names.update(name for name in os.listdir(blockDir) if os.path.exists(os.path.join(blockDir, name, "partition")))
+    except OSError:
+        pass
+    
+    mounted = []
+    try:
+        with open("/proc/mounts") as mountsFile:
+            for line in mountsFile:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].startswith("/dev/") and os.path.basename(os.path.realpath(parts[0])) in names:
+                    mounted.append((parts[0], parts[1].replace("\\040", " ")))
+    except OSError:
+        pass
+    return mounted
+
+def planZeroOutRanges(size, chunkSize):
+    # Contiguous (offset, length) ranges covering the whole device, the last one cut short at the end
+    return [(offset, min(chunkSize, size - offset)) for offset in range(0, size, chunkSize)]
+
+def wipeBlockDevice(device, deadline, results):
+    start = time.monotonic()
+    try:
+        # O_EXCL on a block device fails while anything still has it mounted
+        deviceFd = os.open(device, os.O_WRONLY | os.O_EXCL)
+    except OSError as e:
+        logMessage(f"Cannot open {device} exclusively for wiping: {str(e)}")
+        results[device] = False
+        return
+    
+    try:
+        sizeBuffer = bytearray(8)
+        fcntl.ioctl(deviceFd, BLKGETSIZE64, sizeBuffer, True)
+        size = struct.unpack("<Q", sizeBuffer)[0]
+        
+        method = None
+        for name, request in (("secure discard", BLKSECDISCARD), ("discard", BLKDISCARD)):
+            try:
+                fcntl.ioctl(deviceFd, request, struct.pack("<QQ", 0, size))
+                method = name
+                break
+            except OSError:
+                continue
+        
+        if method is None:
+            # Zero-out is done in chunks so the deadline can still stop a slow device
+            method = "zero-out"
+            for offset, length in planZeroOutRanges(size, zeroOutChunkSize):
+                if time.monotonic() > deadline:
+                    logMessage(f"Wipe budget exhausted for {device} after {offset // (1024 * 1024)} MiB")
+                    results[device] = False
+                    return
+                fcntl.ioctl(deviceFd, BLKZEROOUT, struct.pack("<QQ", offset, length))
+        
+        elapsed = max(time.monotonic() - start, 1e-6)
+        throughput = size / elapsed
+        metricSet("usb_killswitch_wipe_throughput_bytes_per_second", throughput, (("device", device),))
+        logMessage(f"Wiped {device} with {method}: {size / (1024 * 1024):.0f} MiB in {elapsed:.2f}s ({throughput / (1024 * 1024):.0f} MiB/s)")
+        results[device] = True
+    except OSError as e:
+        logMessage(f"Failed to wipe {device}: {str(e)}")
+        results[device] = False
+    finally:
+        os.close(deviceFd)
+
+def wipeBlockDevices(timeout=None):
+    deadline = time.monotonic() + (timeout or 60)
+    results = {}
+    wipeThreads = []
+    
+    for device in blockDevicesToWipe:
+        # Normally the dismount task has already run, this only catches whatever it missed
+        for partition, mountPoint in getMountedPartitions(device):
+            dismountVolume(partition, mountPoint)
+        
+        wipeThread = threading.Thread(target=wipeBlockDevice, args=(device, deadline, results))
+        wipeThread.daemon = True
+        wipeThread.start()
+        wipeThreads.append(wipeThread)
+    
+    for wipeThread in wipeThreads:
+        wipeThread.join(timeout=max(0, deadline - time.monotonic()))
+    
+    return len(results) == len(blockDevicesToWipe) and all(results.values())
+
+def timeSanitizeStep(step, function, *args):
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        metricObserve("usb_killswitch_sanitize_step_seconds", elapsed, (("step", step.split(" ", 1)[0]),))
+        logMessage(f"Sanitize step '{step}': {elapsed * 1000:.1f} ms")
+
+def listSwapDevices():
+    swaps = []
+    try:
+        with open(swapsPath) as swapsFile:
+            for line in swapsFile.readlines()[1:]:
+                fields = line.split()
+                if len(fields) >= 4:
+                    swaps.append({"path": decodeMountField(fields[0]), "type": fields[1],
+                                  "size": int(fields[2]) * 1024, "used": int(fields[3]) * 1024})
+    except (OSError, ValueError) as e:
+        logMessage(f"Error reading {swapsPath}: {str(e)}")
+    return swaps
+
+def getCryptMapping(path):
+    name = os.path.basename(os.path.realpath(path))
+    if not name.startswith("dm-"):
+        return None
+    if not readSysfsValue(f"/sys/block/{name}/dm/uuid").startswith("CRYPT-"):
+        return None
+    return readSysfsValue(f"/sys/block/{name}/dm/name") or None
+
+def getSanitizeFilesystems():
+    paths = [os.path.dirname(os.path.abspath(path)) for path in fileToDelete.split("; ") if path] + fscryptDirectories
+    roots = {}
+    for path in paths:
+        while path and not os.path.exists(path):
+            path = os.path.dirname(path)
+        try:
+            root = findMountRoot(path)
+            roots.setdefault(os.stat(root).st_dev, root)
+        except OSError:
+            continue
+    return list(roots.values())
+
+def syncFilesystem(root, results):
+    try:
+        rootFd = os.open(root, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            if libc.syncfs(rootFd) != 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        finally:
+            os.close(rootFd)
+        results[f"syncfs {root}"] = True
+    except OSError as e:
+        logMessage(f"Failed to sync {root}: {str(e)}")
+        results[f"syncfs {root}"] = False
+
+def evictFiles():
+    evicted = 0
+    for filePath in [path for path in fileToDelete.split("; ") if path]:
+        try:
+            fileFd = os.open(os.path.abspath(filePath), os.O_RDONLY)
+        except OSError:
+            # Shredded and deleted files are already gone, their pages went with the inode
+            continue
+        try:
+            os.posix_fadvise(fileFd, 0, 0, os.POSIX_FADV_DONTNEED)
+            evicted += 1
+        finally:
+            os.close(fileFd)
+    return evicted
+
+def readSwapIdentity(path):
+    pageSize = os.sysconf("SC_PAGE_SIZE")
+    try:
+        with open(path, "rb") as swapFile:
+            header = swapFile.read(pageSize)
+    except OSError:
+        return None, None
+    if header[pageSize - 10:] not in (b"SWAPSPACE2", b"SWAP-SPACE"):
+        return None, None
+    uuid = header[1036:1052].hex()
+    label = header[1052:1068].split(b"\0", 1)[0].decode(errors="replace")
+    if uuid == "0" * 32:
+        return None, label or None
+    return f"{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}", label or None
+
+def buildRekeyCommands(mapping, table):
+    fields = table.split()
+    if len(fields) < 5 or fields[2] != "crypt":
+        return None
+    
+    oldKey = fields[4]
+    # Keyring references look like :64:logon:name, plain keys are hex
+    keyBytes = int(oldKey.split(":")[1]) if oldKey.startswith(":") else len(oldKey) // 2
+    fields[4] = os.urandom(keyBytes).hex()
+    # The new table goes through stdin so the key never shows up in a command line
+    return [(["dmsetup", "suspend", mapping], None),
+            (["dmsetup", "reload", mapping], " ".join(fields) + "\n"),
+            (["dmsetup", "resume", mapping], None)]
+
+def rekeyCryptSwap(mapping, deadline):
+    table = subprocess.run(["dmsetup", "table", "--showkeys", mapping], capture_output=True, text=True,
+                           timeout=max(deadline - time.monotonic(), 1))
+    commands = buildRekeyCommands(mapping, table.stdout) if table.returncode == 0 else None
+    if commands is None:
+        raise OSError(f"cannot read the crypt table of {mapping}: {table.stderr.strip()}")
+    
+    for command, tableInput in commands:
+        result = subprocess.run(command, input=tableInput, capture_output=True, text=True,
+                                timeout=max(deadline - time.monotonic(), 1))
+        if result.returncode != 0:
+            if command[1] == "reload":
+                subprocess.run(["dmsetup", "resume", mapping], capture_output=True, timeout=5)
+            raise OSError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+    return True
+
+def wipeSwapFile(path, deadline):
+    fileFd = os.open(path, os.O_WRONLY)
+    try:
+        size = os.fstat(fileFd).st_size
+        zeros = bytes(4 * 1024 * 1024)
+        offset = 0
+        # Written in place, punching holes would leave the old blocks on disk and make the file unusable as swap
+        while offset < size:
+            if time.monotonic() > deadline:
+                logMessage(f"Sanitize budget exhausted while zeroing {path} after {offset // (1024 * 1024)} MiB")
+                return False
+            offset += os.pwrite(fileFd, zeros[:min(len(zeros), size - offset)], offset)
+        os.fdatasync(fileFd)
+        return True
+    finally:
+        os.close(fileFd)
+
+def buildMkswapCommand(path, uuid, label):
+    # Keeping the UUID and label lets fstab and resume= entries find the swap again
+    return ["mkswap"] + (["-U", uuid] if uuid else []) + (["-L", label] if label else []) + [path]
+
+def reenableSwap(path, uuid, label):
+    result = subprocess.run(buildMkswapCommand(path, uuid, label), capture_output=True, text=True, timeout=30)
+    if result.returncode != 0:
+        raise OSError(f"mkswap failed: {result.stderr.strip()}")
+    if libc.swapon(path.encode(), 0) != 0:
+        raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    return True
+
+def sanitizeSwapDevice(swap, deadline, results):
+    path = swap["path"]
+    mapping = getCryptMapping(path)
+    uuid, label = readSwapIdentity(path)
+    try:
+        if timeSanitizeStep(f"swapoff {path}", libc.swapoff, path.encode()) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        
+        if mapping is not None:
+            completed = timeSanitizeStep(f"re-key {path} ({mapping})", rekeyCryptSwap, mapping, deadline)
+        elif swap["type"] == "file":
+            completed = timeSanitizeStep(f"zero {path}", wipeSwapFile, path, deadline)
+        else:
+            wipeResults = {}
+            timeSanitizeStep(f"wipe {path}", wipeBlockDevice, path, deadline, wipeResults)
+            completed = wipeResults.get(path, False)
+        
+        # Without a shutdown to follow, the machine keeps running with fresh (empty) swap
+        if completed and "Shutdown" not in selectedTasks:
+            timeSanitizeStep(f"swapon {path}", reenableSwap, path, uuid, label)
+        results[path] = completed
+    except (OSError, subprocess.SubprocessError) as e:
+        logMessage(f"Failed to sanitize swap {path}: {str(e)}")
+        results[path] = False
+
+def sanitizeMemoryAndSwap(timeout=None):
+    deadline = time.monotonic() + (timeout or estimateSanitizeTime())
+    if libc is None:
+        logMessage("Memory sanitization needs libc for syncfs and swapoff")
+        return False
+    logMessage("Sanitizing page cache and swap...")
+    results = {}
+    
+    def runInParallel(target, argumentLists):
+        workerThreads = []
+        for arguments in argumentLists:
+            workerThread = threading.Thread(target=target, args=arguments)
+            workerThread.daemon = True
+            workerThread.start()
+            workerThreads.append(workerThread)
+        for workerThread in workerThreads:
+            workerThread.join(timeout=max(deadline - time.monotonic(), 0))
+    
+    timeSanitizeStep("syncfs", runInParallel,
+                     lambda root: timeSanitizeStep(f"syncfs {root}", syncFilesystem, root, results),
+                     [(root,) for root in getSanitizeFilesystems()])
+    timeSanitizeStep("fadvise", evictFiles)
+    # Dropping the caches before swapoff also frees the memory the swapped out pages have to come back into
+    results["drop_caches"] = timeSanitizeStep("drop_caches", dropPageCaches)
+    
+    swaps = listSwapDevices()
+    timeSanitizeStep("swap", runInParallel, sanitizeSwapDevice, [(swap, deadline, results) for swap in swaps])
+    
+    completed = all(results.values()) and all(swap["path"] in results for swap in swaps)
+    logMessage(f"Memory and swap sanitization {'finished' if completed else 'incomplete'}: {len(swaps)} swap devices")
+    return completed
+
+def estimateSanitizeTime():
+    return 5 + 2 * preflightSanitizeMemory([])
+
+def preflightSanitizeMemory(warnings):
+    predicted = 0
+    for swap in listSwapDevices():
+        # Every used page has to be read back into memory before swapoff returns
+        devicePredicted = swap["used"] / assumedSwapInThroughput
+        if getCryptMapping(swap["path"]) is not None:
+            if not shutil.which("dmsetup"):
+                warnings.append(f"dmsetup not found, cannot re-key {swap['path']}")
+            devicePredicted += 0.2
+        elif swap["type"] == "file":
+            devicePredicted += swap["size"] / assumedZeroOutThroughput
+        elif readSysfsValue(os.path.join("/sys/class/block", os.path.basename(os.path.realpath(swap["path"])),
+                                         "queue/discard_max_bytes"), "0") != "0":
+            devicePredicted += 0.5
+        else:
+            devicePredicted += swap["size"] / assumedZeroOutThroughput
+        predicted = max(predicted, devicePredicted)
+    if "Shutdown" not in selectedTasks and listSwapDevices() and not shutil.which("mkswap"):
+        warnings.append("mkswap not found, swap stays off after sanitization")
+    return predicted + 0.5
+
+def deleteFiles(timeout=None):
     filePaths = fileToDelete.split("; ")
+    deadline = time.monotonic() + (timeout or 10 * len(filePaths))
     for filePath in filePaths:
         if not filePath:
             continue
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logMessage(f"Delete budget exhausted before deleting: {filePath}")
+            return False
             
         try:
             absoluteFilePath = os.path.abspath(filePath)
             if os.path.isfile(absoluteFilePath):
                 quotedFilePath = f'"{absoluteFilePath}"'
                 logMessage(f"Deleting file: {absoluteFilePath}")
-                result = subprocess.run(f"rm {quotedFilePath}", shell=True, capture_output=True, timeout=10)
+                result = subprocess.run(f"rm {quotedFilePath}", shell=True, capture_output=True, timeout=min(10, remaining))
                 if result.returncode != 0:
                     logMessage(f"Failed to delete file: {result.stderr.decode()}")
                 else:
@@ -275,138 +1922,1026 @@ def deleteFiles():
         except Exception as e:
             logMessage(f"Error deleting file {filePath}: {str(e)}")
 
-def overwriteFiles():
+def estimateShredTimeout(filePath):
+    try:
+        fileSizeMb = os.path.getsize(filePath) / (1024 * 1024)
+        estimatedTime = int(fileSizeMb * shredPasses)
+        return max(30, min(estimatedTime, 3600))
+    except OSError:
+        return max(30, shredPasses * 2)
+
+def overwriteFiles(timeout=None):
     filePaths = fileToDelete.split("; ")
+    deadline = time.monotonic() + timeout if timeout else None
+    completed = True
     for filePath in filePaths:
         if not filePath:
             continue
-        
-        try:
-            absoluteFilePath = os.path.abspath(filePath)
-            if os.path.isfile(absoluteFilePath):
-                quotedFilePath = f'"{absoluteFilePath}"'
-            
-                try:
-                    fileSizeBytes = os.path.getsize(absoluteFilePath)
-                    fileSizeMb = fileSizeBytes / (1024 * 1024)
-                    estimatedTime = int(fileSizeMb * shredPasses)
-                    timeout = max(30, min(estimatedTime, 3600))
-                except:
-                    timeout = max(30, shredPasses * 2)
-            
-                logMessage(f"Shredding file with {shredPasses} passes: {absoluteFilePath} (timeout: {timeout}s)")
-            
-                shredThread = threading.Thread(
-                    target=lambda: subprocess.run(
-                        f"shred -zun {shredPasses} {quotedFilePath}", 
-                        shell=True, capture_output=True
-                    )
-                )
-                shredThread.daemon = True
-                shredThread.start()
-            
-                shredThread.join(timeout=timeout)
-            
-                if shredThread.is_alive():
-                    logMessage(f"Shredding file {absoluteFilePath} is taking longer than {timeout}s. Continuing with other tasks.")
-                else:
-                    logMessage(f"File securely shredded: {absoluteFilePath}")
-            else:
-                logMessage(f"File not found: {absoluteFilePath}")
-        except Exception as e:
-            logMessage(f"Error overwriting file {filePath}: {str(e)}")
+        
+        try:
+            absoluteFilePath = os.path.abspath(filePath)
+            if os.path.isfile(absoluteFilePath):
+                fileTimeout = estimateShredTimeout(absoluteFilePath)
+                if deadline is not None:
+                    fileTimeout = min(fileTimeout, deadline - time.monotonic())
+                    if fileTimeout <= 0:
+                        logMessage(f"Shred budget exhausted. Abandoning remaining files from {absoluteFilePath}")
+                        return False
+            
+                logMessage(f"Shredding file with {shredPasses} passes: {absoluteFilePath} (timeout: {fileTimeout:.0f}s)")
+            
+                shredProcess = subprocess.Popen(["shred", "-zun", str(shredPasses), absoluteFilePath],
+                                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    shredProcess.wait(timeout=fileTimeout)
+                    logMessage(f"File securely shredded: {absoluteFilePath}")
+                except subprocess.TimeoutExpired:
+                    # Cancel instead of leaving shred competing for I/O with the remaining actions
+                    shredProcess.kill()
+                    completed = False
+                    logMessage(f"Shredding file {absoluteFilePath} is taking longer than {fileTimeout:.0f}s. Cancelled to continue with other tasks.")
+            else:
+                logMessage(f"File not found: {absoluteFilePath}")
+        except Exception as e:
+            logMessage(f"Error overwriting file {filePath}: {str(e)}")
+    return completed
+
+screenOffMethods = [
+    "xset dpms force off",
+    "vbetool dpms off",
+    "xrandr --output $(xrandr | grep ' connected' | head -n 1 | cut -d ' ' -f1) --off"
+]
+
+lockCommands = {
+    'gnome': ["gnome-screensaver-command -l", "dbus-send --type=method_call --dest=org.gnome.ScreenSaver /org/gnome/ScreenSaver org.gnome.ScreenSaver.Lock"],
+    'kde': ["loginctl lock-session"],
+    'xfce': ["xflock4"],
+    'cinnamon': ["cinnamon-screensaver-command -l"],
+    'mate': ["mate-screensaver-command -l"],
+    'lxde': ["lxlock"],
+    'i3': ["i3lock"],
+    'sway': ["swaylock"],
+    'unity': ["gnome-screensaver-command -l"]
+}
+
+genericLockCommands = [
+    "xdg-screensaver lock",
+    "loginctl lock-session",
+    "light-locker-command -l"
+]
+
+def runBackendsInParallel(backends, timeout):
+    results = queue.Queue()
+    
+    def runBackend(name, backend):
+        try:
+            results.put((name, bool(backend())))
+        except Exception as e:
+            logMessage(f"{name} failed: {str(e)}")
+            results.put((name, False))
+    
+    for name, backend in backends:
+        threading.Thread(target=runBackend, args=(name, backend), daemon=True).start()
+    
+    deadline = time.monotonic() + timeout
+    for _ in backends:
+        try:
+            name, succeeded = results.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if succeeded:
+            return name
+    return None
+
+def runCommandBackend(command, timeout):
+    # Only a zero exit status counts, subprocess.run never raises on failure by itself
+    return subprocess.run(command, shell=True, capture_output=True, timeout=timeout).returncode == 0
+
+def pad4(data):
+    return data + b"\0" * (-len(data) % 4)
+
+def readXauthorityCookies(displayNumber):
+    candidates = [os.environ.get("XAUTHORITY", "")]
+    sudoUser = os.environ.get("SUDO_USER")
+    if sudoUser:
+        candidates.append(os.path.expanduser(f"~{sudoUser}/.Xauthority"))
+    candidates += [os.path.expanduser("~/.Xauthority")] + glob.glob("/run/user/*/gdm/Xauthority") + glob.glob("/run/user/*/.mutter-Xwaylandauth.*")
+    
+    cookies = []
+    for candidate in candidates:
+        try:
+            with open(candidate, "rb") as authFile:
+                data = authFile.read()
+        except OSError:
+            continue
+        offset = 2
+        while offset + 2 <= len(data):
+            fields = []
+            for _ in range(4):
+                length = struct.unpack_from(">H", data, offset)[0]
+                fields.append(data[offset + 2:offset + 2 + length])
+                offset += 2 + length
+            _, number, name, cookie = fields
+            if name == b"MIT-MAGIC-COOKIE-1" and number.decode(errors="replace") in (str(displayNumber), ""):
+                cookies.append(cookie)
+            offset += 2
+    return cookies
+
+def x11Connect(display):
+    displayNumber = display.split(":")[-1].split(".")[0] or "0"
+    for cookie in readXauthorityCookies(displayNumber) + [b""]:
+        for address in (f"\0/tmp/.X11-unix/X{displayNumber}", f"/tmp/.X11-unix/X{displayNumber}"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(2)
+            try:
+                sock.connect(address)
+                authName = b"MIT-MAGIC-COOKIE-1" if cookie else b""
+                sock.sendall(struct.pack("<BxHHHHxx", 0x6C, 11, 0, len(authName), len(cookie)) + pad4(authName) + pad4(cookie))
+                header = receiveExact(sock, 8)
+                receiveExact(sock, struct.unpack_from("<H", header, 6)[0] * 4)
+                if header[0] == 1:
+                    return sock
+            except OSError:
+                pass
+            sock.close()
+    raise ConnectionError(f"Cannot connect to X display {display}")
+
+def x11ReadReply(sock):
+    while True:
+        reply = receiveExact(sock, 32)
+        if reply[0] == 0:
+            raise RuntimeError(f"X11 error code {reply[1]}")
+        if reply[0] == 1:
+            return reply + receiveExact(sock, struct.unpack_from("<I", reply, 4)[0] * 4)
+
+def x11DpmsOff():
+    with x11Connect(os.environ.get("DISPLAY", ":0")) as sock:
+        name = b"DPMS"
+        sock.sendall(struct.pack("<BxHHxx", 98, 2 + len(pad4(name)) // 4, len(name)) + pad4(name))
+        reply = x11ReadReply(sock)
+        if not reply[8]:
+            return False
+        majorOpcode = reply[9]
+        
+        # DPMSEnable, DPMSForceLevel(off), then DPMSInfo to confirm the monitor really went off
+        sock.sendall(struct.pack("<BBH", majorOpcode, 4, 1) +
+                     struct.pack("<BBHHxx", majorOpcode, 6, 2, DPMS_MODE_OFF) +
+                     struct.pack("<BBH", majorOpcode, 7, 1))
+        reply = x11ReadReply(sock)
+        return struct.unpack_from("<H", reply, 8)[0] == DPMS_MODE_OFF
+
+def drmConnectorProperties(cardFd, connectorId):
+    modeBuffer = ctypes.create_string_buffer(68)
+    connector = bytearray(80)
+    # One mode slot keeps count_modes non-zero, which would otherwise force a slow connector probe
+    struct.pack_into("<Q", connector, 8, ctypes.addressof(modeBuffer))
+    struct.pack_into("<I", connector, 32, 1)
+    struct.pack_into("<I", connector, 48, connectorId)
+    fcntl.ioctl(cardFd, DRM_IOCTL_MODE_GETCONNECTOR, connector, True)
+    propertyCount = struct.unpack_from("<I", connector, 36)[0]
+    connection = struct.unpack_from("<I", connector, 60)[0]
+    
+    propertyIds = (ctypes.c_uint32 * propertyCount)()
+    propertyValues = (ctypes.c_uint64 * propertyCount)()
+    connector = bytearray(80)
+    struct.pack_into("<QQQ", connector, 8, ctypes.addressof(modeBuffer), ctypes.addressof(propertyIds), ctypes.addressof(propertyValues))
+    struct.pack_into("<II", connector, 32, 1, propertyCount)
+    struct.pack_into("<I", connector, 48, connectorId)
+    fcntl.ioctl(cardFd, DRM_IOCTL_MODE_GETCONNECTOR, connector, True)
+    return connection, dict(zip(propertyIds, propertyValues))
+
+def drmPropertyName(cardFd, propertyId):
+    propertyInfo = bytearray(64)
+    struct.pack_into("<I", propertyInfo, 16, propertyId)
+    fcntl.ioctl(cardFd, DRM_IOCTL_MODE_GETPROPERTY, propertyInfo, True)
+    return bytes(propertyInfo[24:56]).split(b"\0")[0].decode()
+
+def drmDpmsOff(cardPath):
+    cardFd = os.open(cardPath, os.O_RDWR | os.O_CLOEXEC)
+    try:
+        resources = bytearray(64)
+        fcntl.ioctl(cardFd, DRM_IOCTL_MODE_GETRESOURCES, resources, True)
+        connectorCount = struct.unpack_from("<I", resources, 40)[0]
+        connectorIds = (ctypes.c_uint32 * connectorCount)()
+        resources = bytearray(64)
+        struct.pack_into("<Q", resources, 16, ctypes.addressof(connectorIds))
+        struct.pack_into("<I", resources, 40, connectorCount)
+        fcntl.ioctl(cardFd, DRM_IOCTL_MODE_GETRESOURCES, resources, True)
+        
+        switchedOff = False
+        for connectorId in connectorIds:
+            connection, properties = drmConnectorProperties(cardFd, connectorId)
+            if connection != 1:
+                continue
+            for propertyId in properties:
+                if drmPropertyName(cardFd, propertyId) == "DPMS":
+                    fcntl.ioctl(cardFd, DRM_IOCTL_MODE_SETPROPERTY, struct.pack("<QII", DRM_MODE_DPMS_OFF, propertyId, connectorId))
+                    switchedOff = drmConnectorProperties(cardFd, connectorId)[1].get(propertyId) == DRM_MODE_DPMS_OFF or switchedOff
+        return switchedOff
+    finally:
+        os.close(cardFd)
+
+def turnOffScreen(timeout=None):
+    timeout = timeout or 15
+    logMessage("Turning off screen...")
+    
+    backends = [("X11 DPMS", x11DpmsOff)]
+    backends += [(f"DRM DPMS on {cardPath}", lambda cardPath=cardPath: drmDpmsOff(cardPath))
+                 for cardPath in sorted(glob.glob("/dev/dri/card[0-9]*"))]
+    backends += [(method, lambda method=method: runCommandBackend(method, min(5, timeout)))
+                 for method in screenOffMethods]
+    
+    winner = runBackendsInParallel(backends, timeout)
+    if winner:
+        logMessage(f"Screen turned off using: {winner}")
+        return True
+    logMessage("Failed to turn off screen after trying all methods")
+    return False
+
+def logindSessionLocked(sessionPath):
+    return bool(dbusCallSystemBus("org.freedesktop.login1", sessionPath, "org.freedesktop.DBus.Properties",
+                                  "Get", "ss", ("org.freedesktop.login1.Session", "LockedHint"))[0])
+
+def logindSessionsLocked():
+    # Another seat's locked screen says nothing about ours, so the session we run in has to be the locked one
+    try:
+        sessionPaths = [dbusCallSystemBus("org.freedesktop.login1", "/org/freedesktop/login1",
+                                          "org.freedesktop.login1.Manager", "GetSessionByPID", "u", (os.getpid(),))[0]]
+    except RuntimeError:
+        # Started outside a session, so every seated session that LockSessions asked to lock must report it
+        sessions = dbusCallSystemBus("org.freedesktop.login1", "/org/freedesktop/login1",
+                                     "org.freedesktop.login1.Manager", "ListSessions")[0]
+        sessionPaths = [sessionPath for _, _, _, seat, sessionPath in sessions if seat]
+    return bool(sessionPaths) and all(logindSessionLocked(sessionPath) for sessionPath in sessionPaths)
+
+def lockWithLogind():
+    dbusCallSystemBus("org.freedesktop.login1", "/org/freedesktop/login1",
+                      "org.freedesktop.login1.Manager", "LockSessions")
+    # LockSessions only asks the lockers, the LockedHint they set is the confirmation
+    deadline = time.monotonic() + lockVerifyTimeout
+    while time.monotonic() < deadline:
+        if logindSessionsLocked():
+            return True
+        time.sleep(0.05)
+    return False
+
+def lockComputer(timeout=None):
+    timeout = timeout or 25
+    logMessage("Locking computer...")
+    desktopEnv = os.environ.get('XDG_CURRENT_DESKTOP', '').lower()
+    
+    backends = [("logind LockSessions", lockWithLogind)]
+    for cmd in lockCommands.get(desktopEnv, []) + genericLockCommands:
+        backends.append((cmd, lambda cmd=cmd: runCommandBackend(cmd, min(5, timeout))))
+    
+    winner = runBackendsInParallel(backends, timeout)
+    if winner:
+        logMessage(f"Screen locked using: {winner}")
+        return True
+    logMessage("Failed to lock screen after trying all methods")
+    return False
+
+def runCustomCommands(timeout=None):
+    deadline = time.monotonic() + (timeout or 30 * len(customCommands))
+    completed = True
+    for command in customCommands:
+        if not command:
+            continue
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logMessage(f"Custom command budget exhausted before: {command}")
+            return False
+            
+        try:
+            logMessage(f"Executing command: {command}")
+            cmdThread = threading.Thread(
+                target=lambda command=command: subprocess.run(
+                    command, shell=True, capture_output=True
+                )
+            )
+            cmdThread.daemon = True
+            cmdThread.start()
+            
+            cmdThread.join(timeout=min(30, remaining))
+            
+            if cmdThread.is_alive():
+                completed = False
+                logMessage(f"Command is taking too long: {command}. Continuing with other tasks.")
+            else:
+                logMessage(f"Command executed: {command}")
+        except Exception as e:
+            logMessage(f"Error executing command '{command}': {str(e)}")
+    return completed
+
+def registerAction(name, run=None, priority=None, estimate=0, preflight=None, concurrent=False, after=(),
+                   default=False, selectWhen=None, entryPoint=None):
+    # A fixed estimate is wrapped so the scheduler can always call it
+    if not callable(estimate):
+        estimate = (lambda seconds: lambda: seconds)(estimate)
+    actionRegistry[name] = {
+        "run": run,
+        "priority": lowPriorityCutoff if priority is None else priority,
+        "estimate": estimate,
+        "preflight": preflight,
+        "concurrent": concurrent,
+        "after": tuple(after),
+        "default": default,
+        "selectWhen": selectWhen,
+        "entryPoint": entryPoint
+    }
+
+def registerBuiltinActions():
+    # Lower priority numbers run first and get a larger share of the budget when time is short
+    registerAction("Dismount VeraCrypt Volumes", dismountVeracryptVolumes, 1, lambda: veracryptTimeout,
+                   preflightVeracryptVolumes, default=True)
+    registerAction("Dismount USB Volumes", dismountUsbVolumes, 2, lambda: usbTimeout,
+                   preflightUsbVolumes, default=True)
+    registerAction("End Process", killProcess, 1, lambda: 5 * len(processesToKill),
+                   preflightProcesses, default=True)
+    registerAction("Delete File", deleteFiles, 3, lambda: 10 * len([path for path in fileToDelete.split("; ") if path]),
+                   lambda warnings: preflightFiles(warnings, False), default=True)
+    registerAction("Overwrite File", overwriteFiles, 5,
+                   lambda: sum(estimateShredTimeout(os.path.abspath(path)) for path in fileToDelete.split("; ") if path),
+                   lambda warnings: preflightFiles(warnings, True), default=True)
+    registerAction("Turn Off Screen", turnOffScreen, 2, 15, preflightScreenOff, concurrent=True, default=True)
+    registerAction("Lock Computer", lockComputer, 2, 25, preflightLockComputer, concurrent=True, default=True)
+    registerAction("Crypto-Erase Directories", cryptoEraseDirectories, 0, 5, preflightCryptoErase)
+    registerAction("Wipe Block Devices", wipeBlockDevices, 3, 60, preflightBlockDevices,
+                   after=("Dismount VeraCrypt Volumes", "Dismount USB Volumes"))
+    registerAction("Sanitize Memory and Swap", sanitizeMemoryAndSwap, 3, estimateSanitizeTime, preflightSanitizeMemory,
+                   after=("Dismount VeraCrypt Volumes", "Dismount USB Volumes", "Delete File", "Overwrite File",
+                          "Wipe Block Devices"))
+    registerAction("Custom Commands", runCustomCommands, 4, lambda: 30 * len(customCommands),
+                   preflightCustomCommands, selectWhen=lambda: bool(customCommands))
+
+def discoverPluginActions():
+    # Only the installed package metadata is read here, plugin modules are imported when an armed schedule needs them
+    try:
+        from importlib.metadata import entry_points
+        try:
+            entryPoints = entry_points(group=actionEntryPointGroup)
+        except TypeError:
+            entryPoints = entry_points().get(actionEntryPointGroup, [])
+    except Exception as e:
+        logMessage(f"Error reading action plugins: {str(e)}")
+        return
+    
+    for entryPoint in entryPoints:
+        if entryPoint.name in actionRegistry or entryPoint.name == "Shutdown":
+            continue
+        registerAction(entryPoint.name, entryPoint=entryPoint)
+
+def loadAction(name):
+    action = actionRegistry[name]
+    if action["run"] is not None:
+        return True
+    
+    try:
+        loaded = action["entryPoint"].load()
+        # A plugin is either a plain callable taking the timeout, or a dict of the registerAction arguments
+        spec = {"run": loaded} if callable(loaded) else dict(loaded)
+        if not callable(spec.get("run")):
+            raise ValueError("plugin does not provide a callable run")
+        spec.pop("selectWhen", None)
+        registerAction(name, entryPoint=action["entryPoint"], **spec)
+        logMessage(f"Loaded action plugin '{name}' from {action['entryPoint'].value}")
+        return True
+    except Exception as e:
+        logMessage(f"Error loading action plugin '{name}': {str(e)}")
+        return False
+
+def estimateTaskTime(task):
+    return actionRegistry[task]["estimate"]()
+
+def buildTaskSchedule():
+    selected = [task for task in selectedTasks if task in actionRegistry]
+    selected += [name for name, action in actionRegistry.items()
+                 if action["selectWhen"] is not None and action["selectWhen"]() and name not in selected]
+    selected = [task for task in selected if loadAction(task)]
+    
+    # Lowest priority number first, but never ahead of a selected action it has to run after
+    scheduledTasks = []
+    pending = sorted(selected, key=lambda task: actionRegistry[task]["priority"])
+    while pending:
+        ready = [task for task in pending
+                 if not any(dependency in pending for dependency in actionRegistry[task]["after"])]
+        if not ready:
+            logMessage(f"Action dependency cycle between {', '.join(pending)}. Running them by priority.")
+            ready = pending
+        scheduledTasks.append(ready[0])
+        pending.remove(ready[0])
+    return scheduledTasks
+
+def buildDispatchTable():
+    global dispatchTable
+    
+    # Neighbouring actions that are safe to run concurrently at the same priority share a stage
+    stages = []
+    for task in buildTaskSchedule():
+        action = actionRegistry[task]
+        previousStage = stages[-1] if stages else []
+        if action["concurrent"] and previousStage and all(
+                actionRegistry[other]["concurrent"] and actionRegistry[other]["priority"] == action["priority"]
+                and other not in action["after"] for other in previousStage):
+            previousStage.append(task)
+        else:
+            stages.append([task])
+    dispatchTable = stages
+    return stages
+
+def taskPriorityWeight(task):
+    # Priority 0 (the crypto-erase) would divide by zero, so weigh it as half a step ahead of priority 1
+    priority = actionRegistry[task]["priority"]
+    return priority if priority > 0 else 0.5
+
+def allocateTaskBudget(task, pendingTasks, requestedTimes, reserve):
+    available = lockdownDeadline - time.monotonic() - reserve
+    if available <= 0:
+        return 0
+    
+    if sum(requestedTimes[pending] for pending in pendingTasks) <= available:
+        return requestedTimes[task]
+    
+    # Not everything fits, so split what is left by requested time weighted towards high priority
+    weights = {pending: requestedTimes[pending] / taskPriorityWeight(pending) for pending in pendingTasks}
+    share = available * weights[task] / (sum(weights.values()) or 1)
+    budget = min(requestedTimes[task], share)
+    
+    if budget < minimumTaskBudget:
+        if actionRegistry[task]["priority"] >= lowPriorityCutoff:
+            return 0
+        budget = min(requestedTimes[task], available)
+    return budget
+
+def recordTaskBudget(task, budget, used, outcome):
+    lockdownBudgetReport.append({"task": task, "budget": budget, "used": used, "outcome": outcome})
+    actionLabels = (("action", task),)
+    metricObserve("usb_killswitch_action_duration_seconds", used, actionLabels)
+    metricSet("usb_killswitch_action_budget_seconds", budget, actionLabels)
+    metricInc("usb_killswitch_action_outcomes", actionLabels + (("outcome", outcome),))
+    logMessage(f"Budget for '{task}': allotted {budget:.1f}s, used {used:.1f}s ({outcome})")
+
+def runTask(task, budget):
+    start = time.monotonic()
+    try:
+        outcome = "incomplete" if actionRegistry[task]["run"](budget) is False else "ok"
+    except Exception as e:
+        outcome = "error"
+        logMessage(f"Error executing task '{task}': {str(e)}")
+    recordTaskBudget(task, budget, time.monotonic() - start, outcome)
+
+def runStage(stage, budgets):
+    if not stage:
+        return
+    if len(stage) == 1:
+        runTask(stage[0], budgets[stage[0]])
+        return
+    
+    stageThreads = []
+    for task in stage:
+        taskThread = threading.Thread(target=runTask, args=(task, budgets[task]))
+        taskThread.daemon = True
+        taskThread.start()
+        stageThreads.append((task, taskThread))
+    stageDeadline = time.monotonic() + max(budgets.values()) + 1
+    for task, taskThread in stageThreads:
+        taskThread.join(timeout=max(stageDeadline - time.monotonic(), 0))
+        if taskThread.is_alive():
+            logMessage(f"Task '{task}' overran its budget. Continuing without it.")
+
+def metricInc(name, labels=(), value=1):
+    with metricsLock:
+        metricsCounters[(name, labels)] = metricsCounters.get((name, labels), 0) + value
+
+def metricSet(name, value, labels=()):
+    with metricsLock:
+        metricsGauges[(name, labels)] = value
+
+def metricObserve(name, value, labels=()):
+    with metricsLock:
+        histogram = metricsHistograms.get((name, labels))
+        if histogram is None:
+            histogram = metricsHistograms[(name, labels)] = [[0] * len(histogramBuckets), 0.0, 0]
+        for index, bound in enumerate(histogramBuckets):
+            if value <= bound:
+                histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+def formatMetricLabels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in pairs]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+def renderMetrics(openMetrics=True):
+    with metricsLock:
+        counters = dict(metricsCounters)
+        gauges = dict(metricsGauges)
+        histograms = {key: (list(value[0]), value[1], value[2]) for key, value in metricsHistograms.items()}
+    
+    lines = []
+    for name, (metricType, helpText) in metricsHelp.items():
+        # Plain Prometheus text (textfile collector) wants the _total suffix on the family name too
+        familyName = name if openMetrics or metricType != "counter" else f"{name}_total"
+        lines.append(f"# HELP {familyName} {helpText}")
+        lines.append(f"# TYPE {familyName} {metricType}")
+        
+        if metricType == "counter":
+            for (metricName, labels), value in sorted(counters.items()):
+                if metricName == name:
+                    lines.append(f"{name}_total{formatMetricLabels(labels)} {value}")
+        elif metricType == "gauge":
+            for (metricName, labels), value in sorted(gauges.items()):
+                if metricName == name:
+                    lines.append(f"{name}{formatMetricLabels(labels)} {value}")
+        else:
+            for (metricName, labels), (bucketCounts, total, count) in sorted(histograms.items()):
+                if metricName != name:
+                    continue
+                for bound, bucketCount in zip(histogramBuckets, bucketCounts):
+                    lines.append(f"{name}_bucket{formatMetricLabels(labels, [('le', bound)])} {bucketCount}")
+                lines.append(f"{name}_bucket{formatMetricLabels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{formatMetricLabels(labels)} {total}")
+                lines.append(f"{name}_count{formatMetricLabels(labels)} {count}")
+    
+    if openMetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = renderMetrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+def writeMetricsTextfile():
+    if not metricsTextfileDir:
+        return
+    try:
+        targetPath = os.path.join(metricsTextfileDir, "usb_killswitch.prom")
+        temporaryPath = f"{targetPath}.{os.getpid()}.tmp"
+        with open(temporaryPath, "w") as textfile:
+            textfile.write(renderMetrics(openMetrics=False))
+        os.replace(temporaryPath, targetPath)
+    except OSError as e:
+        logMessage(f"Error writing metrics textfile: {str(e)}")
+
+def metricsTextfileLoop():
+    while metricsTextfileDir:
+        writeMetricsTextfile()
+        time.sleep(metricsTextfileInterval)
+
+def stopMetricsServer():
+    global metricsServer, metricsServerAddress
+    
+    metricsServer.shutdown()
+    metricsServer.server_close()
+    if metricsServerAddress[0] == "unix" and os.path.lexists(metricsServerAddress[1]):
+        os.remove(metricsServerAddress[1])
+    logMessage("Stopped the OpenMetrics endpoint.")
+    metricsServer = None
+    metricsServerAddress = None
+
+def startMetricsExporter():
+    global metricsServer, metricsServerAddress, metricsTextfileThread
+    
+    address = ("unix", metricsSocketPath) if metricsSocketPath else ("tcp", metricsPort) if metricsPort else None
+    try:
+        # A changed port or socket path takes effect right away instead of after a restart
+        if metricsServer is not None and address != metricsServerAddress:
+            stopMetricsServer()
+        if metricsServer is None and metricsSocketPath:
+            # Only clear a stale socket left by a previous run, never an arbitrary file at the configured path
+            if os.path.lexists(metricsSocketPath):
+                if not stat.S_ISSOCK(os.lstat(metricsSocketPath).st_mode):
+                    raise OSError(f"{metricsSocketPath} exists and is not a socket")
+                os.remove(metricsSocketPath)
+            # Create the socket owner-only from the start instead of narrowing it after bind
+            oldMask = os.umask(0o177)
+            try:
+                metricsServer = UnixMetricsServer(metricsSocketPath, MetricsRequestHandler)
+            finally:
+                os.umask(oldMask)
+            metricsServerAddress = address
+            threading.Thread(target=metricsServer.serve_forever, daemon=True).start()
+            logMessage(f"Serving OpenMetrics on unix socket {metricsSocketPath}")
+        elif metricsServer is None and metricsPort:
+            # Loopback only, the metrics reveal whether and how the killswitch is armed
+            metricsServer = http.server.ThreadingHTTPServer(("127.0.0.1", metricsPort), MetricsRequestHandler)
+            metricsServer.daemon_threads = True
+            metricsServerAddress = address
+            threading.Thread(target=metricsServer.serve_forever, daemon=True).start()
+            logMessage(f"Serving OpenMetrics on http://127.0.0.1:{metricsPort}/metrics")
+    except OSError as e:
+        logMessage(f"Error starting metrics endpoint: {str(e)}")
+    
+    if metricsTextfileDir and (metricsTextfileThread is None or not metricsTextfileThread.is_alive()):
+        metricsTextfileThread = threading.Thread(target=metricsTextfileLoop, daemon=True)
+        metricsTextfileThread.start()
+        logMessage(f"Writing node-exporter textfile metrics to {metricsTextfileDir}")
+
+def commandBinary(command):
+    try:
+        return shlex.split(command)[0]
+    except (ValueError, IndexError):
+        return ""
+
+def probeWriteThroughput(directory):
+    probePath = os.path.join(directory, f".usb-killswitch-probe-{os.getpid()}")
+    sample = os.urandom(preflightProbeSize)
+    try:
+        start = time.perf_counter()
+        probeFd = os.open(probePath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.write(probeFd, sample)
+            os.fsync(probeFd)
+        finally:
+            os.close(probeFd)
+        return preflightProbeSize / max(time.perf_counter() - start, 1e-6)
+    finally:
+        try:
+            os.remove(probePath)
+        except OSError:
+            pass
+
+def findMatchingPids(pattern):
+    try:
+        expression = re.compile(pattern)
+    except re.error:
+        expression = re.compile(re.escape(pattern))
+    pids = []
+    for commPath in glob.glob("/proc/[0-9]*/comm"):
+        if expression.search(readSysfsValue(commPath)):
+            pids.append(int(commPath.split("/")[2]))
+    return pids
+
+def preflightCryptoErase(warnings):
+    for directory in fscryptDirectories:
+        try:
+            directoryFd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                getFscryptKeySpecifier(directoryFd)
+            finally:
+                os.close(directoryFd)
+        except OSError as e:
+            warnings.append(f"{directory} is not an fscrypt directory: {str(e)}")
+    return 0.05 * len(fscryptDirectories) + 0.5
+
+def preflightVeracryptVolumes(warnings):
+    if not shutil.which("veracrypt"):
+        warnings.append("veracrypt binary not found")
+        return 0
+    mounts = readSysfsValue("/proc/mounts")
+    volumeCount = len(re.findall(r"^/dev/mapper/veracrypt", mounts, re.MULTILINE))
+    return 1 + 2 * volumeCount
+
+def preflightUsbVolumes(warnings):
+    volumes = []
+    for device, mountPoint in getMountedUsbVolumes():
+        if volumesToDismount:
+            if device in volumesToDismount or mountPoint in volumesToDismount:
+                volumes.append(device)
+        elif not isSystemVolume(device, mountPoint):
+            volumes.append(device)
+    if not volumes:
+        warnings.append("No USB volumes to dismount are mounted right now")
+    return 0.5 * len(volumes)
+
+def preflightProcesses(warnings):
+    predicted = 0
+    for process in processesToKill:
+        if isCgroupTarget(process):
+            paths = resolveCgroupTarget(process)
+            if not paths:
+                warnings.append(f"Kill target {process} matches no cgroup")
+            for path in paths:
+                if containsOwnCgroup(path):
+                    warnings.append(f"Kill target {process} contains the killswitch's own cgroup {path} and will be skipped")
+            predicted += 0.01
+        else:
+            if not findMatchingPids(process):
+                warnings.append(f"No running process matches {process}")
+            predicted += 0.05
+    return predicted
+
+def preflightFiles(warnings, overwrite):
+    if overwrite and not shutil.which("shred"):
+        warnings.append("shred binary not found")
+    throughputs = {}
+    predicted = 0
+    for filePath in [path for path in fileToDelete.split("; ") if path]:
+        absoluteFilePath = os.path.abspath(filePath)
+        try:
+            fileStat = os.stat(absoluteFilePath)
+        except OSError:
+            warnings.append(f"File not found: {absoluteFilePath}")
+            continue
+        if not overwrite:
+            predicted += 0.01
+            continue
+        if fileStat.st_dev not in throughputs:
+            try:
+                throughputs[fileStat.st_dev] = probeWriteThroughput(os.path.dirname(absoluteFilePath))
+            except OSError as e:
+                warnings.append(f"Could not probe write speed next to {absoluteFilePath}: {str(e)}")
+                throughputs[fileStat.st_dev] = None
+        throughput = throughputs[fileStat.st_dev]
+        if throughput is None:
+            predicted += estimateShredTimeout(absoluteFilePath)
+            continue
+        # shred -z adds one zeroing pass on top of the random passes
+        filePredicted = fileStat.st_size * (shredPasses + 1) / throughput
+        if filePredicted > estimateShredTimeout(absoluteFilePath):
+            warnings.append(f"Shredding {absoluteFilePath} needs about {filePredicted:.0f}s, more than its {estimateShredTimeout(absoluteFilePath)}s timeout")
+        predicted += filePredicted
+    return predicted
 
-def turnOffScreen():
-    logMessage("Turning off screen...")
-    methods = [
-        "xset dpms force off",
-        "vbetool dpms off",
-        "xrandr --output $(xrandr | grep ' connected' | head -n 1 | cut -d ' ' -f1) --off"
-    ]
-    
-    for method in methods:
+def preflightBlockDevices(warnings):
+    predicted = 0
+    for device in blockDevicesToWipe:
+        deviceName = os.path.basename(os.path.realpath(device))
+        queueDir = os.path.join("/sys/class/block", deviceName, "queue")
         try:
-            subprocess.run(method, shell=True, timeout=5)
-            logMessage(f"Screen turned off using: {method}")
-            return
-        except:
+            size = int(readSysfsValue(os.path.join("/sys/class/block", deviceName, "size"))) * 512
+        except ValueError:
+            warnings.append(f"{device} is not a block device")
             continue
-            
-    logMessage("Failed to turn off screen after trying all methods")
+        if readSysfsValue(os.path.join(queueDir, "discard_max_bytes"), "0") != "0":
+            predicted = max(predicted, 0.5)
+        else:
+            warnings.append(f"{device} does not support discard, zero-out will be slow")
+            predicted = max(predicted, size / assumedZeroOutThroughput)
+    return predicted
 
-def lockComputer():
-    logMessage("Locking computer...")
+def preflightScreenOff(warnings):
+    if not any(shutil.which(commandBinary(method)) for method in screenOffMethods):
+        warnings.append("No screen blanking command found")
+    return 0.2
+
+def preflightLockComputer(warnings):
     desktopEnv = os.environ.get('XDG_CURRENT_DESKTOP', '').lower()
+    candidates = lockCommands.get(desktopEnv, []) + genericLockCommands
+    if not any(shutil.which(commandBinary(command)) for command in candidates):
+        warnings.append("No screen lock command found")
+    return 0.5
+
+def preflightCustomCommands(warnings):
+    for command in customCommands:
+        if not shutil.which(commandBinary(command)):
+            warnings.append(f"Custom command binary not found: {command}")
+    # Custom commands cannot be run without side effects, so assume they use their whole timeout
+    return estimateTaskTime("Custom Commands")
+
+def preflightTask(task, warnings):
+    preflight = actionRegistry[task]["preflight"]
+    # Actions without a preflight check, such as most plugins, are predicted from their estimate
+    return preflight(warnings) if preflight is not None else estimateTaskTime(task)
+
+def runPreflight():
+    global preflightReport
     
-    lockCommands = {
-        'gnome': ["gnome-screensaver-command -l", "dbus-send --type=method_call --dest=org.gnome.ScreenSaver /org/gnome/ScreenSaver org.gnome.ScreenSaver.Lock"],
-        'kde': ["loginctl lock-session"],
-        'xfce': ["xflock4"],
-        'cinnamon': ["cinnamon-screensaver-command -l"],
-        'mate': ["mate-screensaver-command -l"],
-        'lxde': ["lxlock"],
-        'i3': ["i3lock"],
-        'sway': ["swaylock"],
-        'unity': ["gnome-screensaver-command -l"]
-    }
+    logMessage("Preflight: predicting lockdown duration...")
+    preflightReport = []
+    warnings = []
+    total = 0
     
-    if desktopEnv in lockCommands:
-        for cmd in lockCommands[desktopEnv]:
+    # Walk the same stages a lockdown would run, a stage takes as long as its slowest action
+    for stage in dispatchTable or buildDispatchTable():
+        stagePredicted = 0
+        for task in stage:
+            start = time.perf_counter()
             try:
-                subprocess.run(cmd, shell=True, timeout=5)
-                logMessage(f"Screen locked using: {cmd}")
-                return
-            except:
-                continue
+                predicted = preflightTask(task, warnings)
+            except Exception as e:
+                warnings.append(f"Preflight of '{task}' failed: {str(e)}")
+                predicted = estimateTaskTime(task)
+            # Actions never run past their own timeout, so that is the worst case
+            predicted = min(predicted, estimateTaskTime(task))
+            stagePredicted = max(stagePredicted, predicted)
+            preflightReport.append({"task": task, "predicted": predicted})
+            metricSet("usb_killswitch_preflight_predicted_seconds", predicted, (("action", task),))
+            logMessage(f"Preflight: '{task}' predicted {predicted:.2f}s (checked in {time.perf_counter() - start:.2f}s)")
+        total += stagePredicted
+    
+    if "Shutdown" in selectedTasks:
+        # Measuring the tiers has side effects, so only a measurement the user asked for is reused
+        latencies = shutdownTierLatencies or predictShutdownTiers()
+        if shutdownTierLatencies is None:
+            logMessage("Preflight: shutdown tiers not measured yet, using assumed latencies (see Measure Shutdown Latency)")
+        available = [latency for latency in latencies.values() if latency is not None]
+        if not available:
+            warnings.append("No shutdown method is available")
+        shutdownPredicted = min(available) if available else 0
+        total += shutdownPredicted
+        preflightReport.append({"task": "Shutdown", "predicted": shutdownPredicted})
+        metricSet("usb_killswitch_preflight_predicted_seconds", shutdownPredicted, (("action", "Shutdown"),))
+        logMessage(f"Preflight: 'Shutdown' predicted {shutdownPredicted:.3f}s")
     
-    genericCommands = [
-        "xdg-screensaver lock",
-        "loginctl lock-session",
-        "light-locker-command -l"
-    ]
+    if total > lockdownBudget:
+        warnings.append(f"Predicted lockdown time {total:.1f}s is over the {lockdownBudget}s budget, low priority actions will be cut short")
     
-    for cmd in genericCommands:
+    for warning in warnings:
+        logMessage(f"Preflight warning: {warning}")
+    logMessage(f"Preflight: total predicted lockdown time {total:.1f}s of {lockdownBudget}s budget, {len(warnings)} warnings")
+    return total, warnings
+
+def writeSysrq(key):
+    # In dry run mode the keys are appended to a sink file instead of reaching the kernel
+    if shutdownDryRun:
+        # The sink lives in a shared directory, so never follow a planted symlink or append to someone else's file
+        sinkFd = os.open(sysrqDryRunPath, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_NOFOLLOW, 0o600)
         try:
-            subprocess.run(cmd, shell=True, timeout=5)
-            logMessage(f"Screen locked using generic method: {cmd}")
-            return
-        except:
-            continue
-            
-    logMessage("Failed to lock screen after trying all methods")
+            sinkStat = os.fstat(sinkFd)
+            if not stat.S_ISREG(sinkStat.st_mode) or sinkStat.st_uid != os.geteuid():
+                raise OSError(f"refusing to write sysrq keys to {sysrqDryRunPath}, not a regular file owned by us")
+            os.write(sinkFd, key.encode())
+        finally:
+            os.close(sinkFd)
+    else:
+        with open(sysrqTriggerPath, "w") as trigger:
+            trigger.write(key)
 
-def runCustomCommands():
-    for command in customCommands:
-        if not command:
-            continue
-            
+def sysrqEmergencyWatchdog(completeEvent, budget):
+    if completeEvent.wait(timeout=budget):
+        return
+    
+    logMessage(f"Lockdown budget of {budget}s exceeded. Firing sysrq emergency sync, read-only remount and power off...")
+    for key, delay in (("s", sysrqStepDelay), ("u", sysrqStepDelay), ("o", 0)):
         try:
-            logMessage(f"Executing command: {command}")
-            cmdThread = threading.Thread(
-                target=lambda: subprocess.run(
-                    command, shell=True, capture_output=True
-                )
-            )
-            cmdThread.daemon = True
-            cmdThread.start()
-            
-            cmdThread.join(timeout=30)
-            
-            if cmdThread.is_alive():
-                logMessage(f"Command is taking too long: {command}. Continuing with other tasks.")
-            else:
-                logMessage(f"Command executed: {command}")
-        except Exception as e:
-            logMessage(f"Error executing command '{command}': {str(e)}")
+            writeSysrq(key)
+        except OSError as e:
+            logMessage(f"Failed to write sysrq '{key}': {str(e)}")
+        time.sleep(delay)
+
+def startSysrqWatchdog():
+    completeEvent = threading.Event()
+    watchdogThread = threading.Thread(target=sysrqEmergencyWatchdog, args=(completeEvent, lockdownBudget))
+    watchdogThread.daemon = True
+    watchdogThread.start()
+    logMessage(f"Sysrq emergency watchdog armed with a {lockdownBudget}s budget.")
+    return completeEvent
+
+def parsePeerDestination(destination):
+    host, separator, port = destination.rpartition(":")
+    if separator and port.isdigit():
+        return host, int(port)
+    return destination, peerPort
+
+def buildPeerDatagram(reason, nonce=None, sentAt=None):
+    payload = struct.pack(peerHeaderFormat, peerMagic, peerNodeId, nonce or os.urandom(16),
+                          sentAt if sentAt is not None else time.time()) + reason.encode()[:64]
+    return payload + hmac.new(peerSecret.encode(), payload, hashlib.sha256).digest()
+
+def verifyPeerDatagram(datagram):
+    headerSize = struct.calcsize(peerHeaderFormat)
+    if len(datagram) < headerSize + 32:
+        return "malformed", None
+    
+    payload, tag = datagram[:-32], datagram[-32:]
+    if not hmac.compare_digest(tag, hmac.new(peerSecret.encode(), payload, hashlib.sha256).digest()):
+        return "bad_hmac", None
+    
+    magic, nodeId, nonce, sentAt = struct.unpack_from(peerHeaderFormat, payload)
+    if magic != peerMagic:
+        return "malformed", None
+    if nodeId == peerNodeId:
+        return "own", None
+    now = time.time()
+    if abs(now - sentAt) > peerMaxAge:
+        return "stale", None
+    
+    for seenNonce, expiry in list(peerSeenNonces.items()):
+        if expiry < now:
+            del peerSeenNonces[seenNonce]
+    if nonce in peerSeenNonces:
+        return "duplicate", None
+    # A nonce only has to be remembered for as long as its timestamp would still be accepted
+    peerSeenNonces[nonce] = now + 2 * peerMaxAge
+    
+    return "accepted", {"node": nodeId.hex(), "sentAt": sentAt, "reason": payload[headerSize:].decode(errors="replace")}
+
+def sendPeerTrigger(reason):
+    datagram = buildPeerDatagram(reason)
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as peerSocket:
+            peerSocket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            for _ in range(peerSendCopies):
+                for destination in peerDestinations:
+                    peerSocket.sendto(datagram, parsePeerDestination(destination))
+        logMessage(f"Lockdown propagated to peers: {', '.join(peerDestinations)}")
+    except (OSError, ValueError) as e:
+        logMessage(f"Error propagating lockdown to peers: {str(e)}")
+
+def openPeerListener():
+    peerSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    peerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        peerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    peerSocket.bind(("", peerPort))
+    
+    for destination in peerDestinations:
+        host, _ = parsePeerDestination(destination)
+        try:
+            if ipaddress.ip_address(host).is_multicast:
+                membership = struct.pack("4s4s", socket.inet_aton(host), socket.inet_aton("0.0.0.0"))
+                peerSocket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        except ValueError:
+            continue
+    peerSocket.setblocking(False)
+    return peerSocket
+
+def handlePeerDatagram(datagram, address):
+    receivedAt = time.perf_counter()
+    result, trigger = verifyPeerDatagram(datagram)
+    metricInc("usb_killswitch_peer_datagrams", (("result", result),))
+    if result != "accepted":
+        if result not in ("own", "duplicate"):
+            logMessage(f"Rejected peer trigger from {address[0]}: {result}")
+        return
+    
+    networkLatency = time.time() - trigger["sentAt"]
+    metricObserve("usb_killswitch_peer_network_seconds", max(networkLatency, 0))
+    logMessage(f"Peer {trigger['node']} at {address[0]} triggered ({trigger['reason']}), "
+               f"network latency {networkLatency * 1000:.2f} ms. Executing tasks...")
+    recordTrigger("peer")
+    executeTasks(fromPeer=True, detectedAt=receivedAt)
+
+def monitorPeerTriggers():
+    try:
+        peerSocket = openPeerListener()
+    except OSError as e:
+        logMessage(f"Error opening peer trigger listener: {str(e)}")
+        return
+    
+    selector = selectors.DefaultSelector()
+    selector.register(peerSocket, selectors.EVENT_READ)
+    logMessage(f"Listening for peer triggers on UDP port {peerPort}")
+    try:
+        while monitoring or usbMonitoring:
+            for _ in selector.select(timeout=1):
+                while True:
+                    try:
+                        datagram, address = peerSocket.recvfrom(2048)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    try:
+                        handlePeerDatagram(datagram, address)
+                    except Exception as e:
+                        logMessage(f"Error handling peer trigger: {str(e)}")
+    finally:
+        selector.close()
+        peerSocket.close()
+
+def startPeerListener():
+    global peerListenerThread
+    
+    if not peerTriggerEnabled:
+        return
+    if not peerSecret:
+        logMessage("Peer triggers need a shared secret. Peer listener not started.")
+        return
+    if peerListenerThread is not None and peerListenerThread.is_alive():
+        return
+    peerListenerThread = threading.Thread(target=monitorPeerTriggers)
+    peerListenerThread.daemon = True
+    peerListenerThread.start()
+
+def recordTrigger(monitorName):
+    metricInc("usb_killswitch_triggers", (("monitor", monitorName),))
+    metricSet("usb_killswitch_last_trigger_timestamp_seconds", time.time())
 
 def monitorUsbIdentifier():
     global monitoring, identifierRemoved
     
     while monitoring:
+        cycleStart = time.perf_counter()
         try:
-            if not identifierRemoved and not checkIdentifierUsbPresence():
+            removed = not identifierRemoved and not checkIdentifierUsbPresence()
+            metricObserve("usb_killswitch_detection_cycle_seconds", time.perf_counter() - cycleStart, (("monitor", "identifier"),))
+            if removed:
                 logMessage(f"{usbIdentifier} identifier USB drive removed. Executing tasks...")
                 identifierRemoved = True
+                requestDeviceSnapshot("identifier")
+                recordTrigger("identifier")
                 executeTasks()
         except Exception as e:
             logMessage(f"Error in USB identifier monitoring: {str(e)}")
@@ -416,67 +2951,131 @@ def onUsbChange():
     global usbMonitoring
     
     while usbMonitoring:
+        cycleStart = time.perf_counter()
         try:
-            if checkUsbChanges():
+            changed = checkUsbChanges()
+            metricObserve("usb_killswitch_detection_cycle_seconds", time.perf_counter() - cycleStart, (("monitor", "usb_change"),))
+            if changed:
                 logMessage("USB device change detected. Executing tasks...")
+                recordTrigger("usb_change")
                 executeTasks()
         except Exception as e:
             logMessage(f"Error in USB change monitoring: {str(e)}")
         time.sleep(1)
 
-def executeTasks():
-    global monitoring, usbMonitoring
+def executeTasks(fromPeer=False, detectedAt=None):
+    # Several monitors can see the same event, only the first one runs the actions
+    if not lockdownLock.acquire(blocking=False):
+        logMessage("Lockdown already in progress. Ignoring duplicate trigger.")
+        return
+    try:
+        if detectedAt is not None:
+            dispatchLatency = time.perf_counter() - detectedAt
+            metricObserve("usb_killswitch_dispatch_seconds", dispatchLatency)
+            logMessage(f"Dispatch latency: {dispatchLatency * 1000000:.0f} us")
+        # Peers are told first so they lock down in parallel, but a peer trigger is never forwarded
+        if peerTriggerEnabled and peerSecret and not fromPeer:
+            sendPeerTrigger(platform.node())
+        runLockdown()
+    finally:
+        lockdownLock.release()
+
+def runLockdown():
+    global monitoring, usbMonitoring, lockdownDeadline, lockdownBudgetReport
     
     shutdownRequired = "Shutdown" in selectedTasks
+    watchdogEvent = startSysrqWatchdog() if sysrqEmergencyEnabled else None
+    lockdownDeadline = time.monotonic() + lockdownBudget
+    lockdownBudgetReport = []
     
-    for task in selectedTasks:
-        if not monitoring and not usbMonitoring:
-            logMessage("Monitoring stopped. Aborting remaining tasks.")
-            return
-            
-        try:
-            if task == "Dismount VeraCrypt Volumes":
-                dismountVeracryptVolumes()
-            elif task == "Dismount USB Volumes":
-                dismountUsbVolumes()
-            elif task == "End Process":
-                killProcess()
-            elif task == "Delete File":
-                deleteFiles()
-            elif task == "Overwrite File":
-                overwriteFiles()
-            elif task == "Turn Off Screen":
-                turnOffScreen()
-            elif task == "Lock Computer":
-                lockComputer()
-        except Exception as e:
-            logMessage(f"Error executing task '{task}': {str(e)}")
+    stages = dispatchTable or buildDispatchTable()
+    scheduledTasks = [task for stage in stages for task in stage]
+    requestedTimes = {task: estimateTaskTime(task) for task in scheduledTasks}
+    reserve = shutdownReserve if shutdownRequired else 0
     
     try:
-        runCustomCommands()
-    except Exception as e:
-        logMessage(f"Error running custom commands: {str(e)}")
-    
-    if shutdownRequired:
-        shutdownSystem()
+        for stage in stages:
+            if not monitoring and not usbMonitoring:
+                logMessage("Monitoring stopped. Aborting remaining tasks.")
+                shutdownRequired = False
+                return
+            
+            pendingTasks = scheduledTasks[scheduledTasks.index(stage[0]):]
+            budgets = {}
+            for task in stage:
+                try:
+                    budget = allocateTaskBudget(task, pendingTasks, requestedTimes, reserve)
+                except Exception as e:
+                    # A broken allocation must not cost the rest of the lockdown, so run the task with what it asked for
+                    logMessage(f"Error allocating a time budget for {task}: {str(e)}")
+                    budget = requestedTimes[task]
+                if budget <= 0:
+                    recordTaskBudget(task, 0, 0, "abandoned")
+                else:
+                    budgets[task] = budget
+            runStage([task for task in stage if task in budgets], budgets)
+        
+        if fscryptBusyDirectories:
+            # Files that were open during the crypto-erase should be closed now that processes are gone
+            logMessage("Retrying crypto-erase for directories that had files in use...")
+            cryptoEraseDirectories()
+        
+        # Last chance to publish the action outcomes and device history before the machine goes down.
+        # The history writer commits in the background while the shutdown starts, nothing waits for it.
+        writeMetricsTextfile()
+        flushDeviceHistory(0)
+        
+        if shutdownRequired:
+            logMessage(f"Shutdown starting with {lockdownDeadline - time.monotonic():.1f}s of the lockdown budget left.")
+            shutdownSystem()
+    finally:
+        # Keep the watchdog running while a shutdown is pending, so a hung shutdown still gets a hard poweroff
+        if watchdogEvent is not None and not shutdownRequired:
+            watchdogEvent.set()
 
 def startMonitoring():
     global monitoring, identifierRemoved, monitorThread
     
     identifierRemoved = False
     monitoring = True
+    resolveCgroupTargets()
+    buildDispatchTable()
+    preloadTriggerModules()
+    metricSet("usb_killswitch_armed", 1, (("monitor", "identifier"),))
     monitorThread = threading.Thread(target=monitorUsbIdentifier)
     monitorThread.daemon = True
     monitorThread.start()
+    startEventSources()
+    startPeerListener()
+    startDeviceHistory()
 
 def startUsbMonitoring():
     global usbMonitoring, usbDevices, usbMonitorThread
     
     usbDevices = getCurrentUsbDevices()
     usbMonitoring = True
+    resolveCgroupTargets()
+    buildDispatchTable()
+    preloadTriggerModules()
+    metricSet("usb_killswitch_armed", 1, (("monitor", "usb_change"),))
     usbMonitorThread = threading.Thread(target=onUsbChange)
     usbMonitorThread.daemon = True
     usbMonitorThread.start()
+    startEventSources()
+    startPeerListener()
+    startDeviceHistory()
+    
+    if usbAuthorizationGate:
+        # The socket is bound before the gate closes, so no device can arrive unseen in between
+        try:
+            ueventSocket = openUsbUeventSocket()
+        except OSError as e:
+            logMessage(f"Error opening uevent socket, USB authorization gate left open: {str(e)}")
+        else:
+            armUsbAuthorizationGate()
+            ueventThread = threading.Thread(target=monitorUsbUevents, args=(ueventSocket,))
+            ueventThread.daemon = True
+            ueventThread.start()
     
     updateVolumeCache()
 
@@ -487,6 +3086,7 @@ def togglePause():
     if pauseCounter == 5:
         pauseCounter = 0
         monitoring = False
+        metricSet("usb_killswitch_armed", 0, (("monitor", "identifier"),))
         startButton.config(state=tk.NORMAL)
         pauseButton.config(state=tk.DISABLED)
 
@@ -497,17 +3097,24 @@ def toggleUsbPause():
     if usbPauseCounter == 5:
         usbPauseCounter = 0
         usbMonitoring = False
+        metricSet("usb_killswitch_armed", 0, (("monitor", "usb_change"),))
+        disarmUsbAuthorizationGate()
         usbStartButton.config(state=tk.NORMAL)
         usbPauseButton.config(state=tk.DISABLED)
 
-def onStartButtonClick():
-    global selectedTasks, customCommands, fileToDelete, processesToKill
+def applyGuiSettings():
+    global selectedTasks, customCommands, fileToDelete, processesToKill, fscryptDirectories, blockDevicesToWipe
     global veracryptTimeout, usbTimeout, shredPasses, shutdownMode, volumesToDismount
+    global shutdownSync, shutdownDryRun, lockdownBudget, sysrqEmergencyEnabled
+    global metricsPort, metricsSocketPath, metricsTextfileDir, usbAuthorizationGate
+    global eventTriggerLinkLoss, eventTriggerPowerLoss, eventTriggerLidClose, eventTriggerInterfaces
+    global peerTriggerEnabled, peerSecret, peerDestinations, peerPort
+    global deviceHistoryPath, deviceHistoryRetentionDays, ramResidentImage
     
     selectedTasks = [task.get() for task in tasks if task.get()]
     if not selectedTasks:
         messagebox.showerror("Error", "Please select at least one task")
-        return
+        return False
     
     customCommands = []
     for commandEntry in commandEntries:
@@ -520,6 +3127,7 @@ def onStartButtonClick():
             processesToKill.append(processEntry.get().strip())
     
     fileToDelete = fileEntry.get()
+    fscryptDirectories = [directory for directory in fscryptEntry.get().split("; ") if directory.strip()]
     
     try:
         veracryptTimeoutValue = int(veracryptTimeoutEntry.get())
@@ -542,15 +3150,80 @@ def onStartButtonClick():
     except ValueError:
         pass
     
+    try:
+        lockdownBudgetValue = int(lockdownBudgetEntry.get())
+        if lockdownBudgetValue > 0:
+            lockdownBudget = lockdownBudgetValue
+    except ValueError:
+        pass
+    
+    sysrqEmergencyEnabled = sysrqEmergencyVar.get()
+    
     shutdownMode = shutdownModeVar.get()
+    shutdownSync = shutdownSyncVar.get()
+    shutdownDryRun = shutdownDryRunVar.get()
     
     volumesToDismount = volumesEntry.get().split(";")
     volumesToDismount = [vol.strip() for vol in volumesToDismount if vol.strip()]
+    blockDevicesToWipe = [device.strip() for device in wipeDevicesEntry.get().split(";") if device.strip()]
+    
+    try:
+        metricsPort = int(metricsPortEntry.get()) if metricsPortEntry.get().strip() else 0
+    except ValueError:
+        pass
+    metricsSocketPath = metricsSocketEntry.get().strip()
+    metricsTextfileDir = metricsTextfileEntry.get().strip()
+    usbAuthorizationGate = usbAuthorizationGateVar.get()
+    eventTriggerLinkLoss = linkLossVar.get()
+    eventTriggerPowerLoss = powerLossVar.get()
+    eventTriggerLidClose = lidCloseVar.get()
+    eventTriggerInterfaces = [interface.strip() for interface in interfacesEntry.get().split(";") if interface.strip()]
+    
+    peerTriggerEnabled = peerTriggerVar.get()
+    peerSecret = peerSecretEntry.get()
+    peerDestinations = [destination.strip() for destination in peerDestinationsEntry.get().split(";") if destination.strip()]
+    try:
+        peerPortValue = int(peerPortEntry.get())
+        if 0 < peerPortValue < 65536:
+            peerPort = peerPortValue
+    except ValueError:
+        pass
+    
+    ramResidentImage = ramResidentVar.get()
+    deviceHistoryPath = deviceHistoryPathEntry.get().strip()
+    try:
+        retentionValue = int(deviceHistoryRetentionEntry.get())
+        if retentionValue > 0:
+            deviceHistoryRetentionDays = retentionValue
+    except ValueError:
+        pass
+    startMetricsExporter()
+    return True
+
+def onPreflightButtonClick():
+    if not applyGuiSettings():
+        return
+    # Settings may have changed the selected actions, so preflight the schedule a lockdown would now run
+    buildDispatchTable()
+    startPreflight()
+
+def startPreflight():
+    preflightThread = threading.Thread(target=runPreflight)
+    preflightThread.daemon = True
+    preflightThread.start()
+
+def onStartButtonClick():
+    if not applyGuiSettings():
+        return
     
     if monitoring:
         statusLabel.config(text="Monitoring started...")
     else:
+        if ramResidentImage and not runningFromRamImage:
+            # Only returns if the image could not be built or executed
+            execRamImage(["identifier"] + (["usb"] if usbMonitoring else []))
         startMonitoring()
+        startPreflight()
         pauseButton.config(state=tk.NORMAL)
         startButton.config(state=tk.DISABLED)
         statusLabel.config(text="Monitoring started...")
@@ -566,56 +3239,16 @@ def onPauseButtonClick():
             logMessage(f"{usbIdentifier} identifier monitoring disarmed.")
 
 def onUsbStartButtonClick():
-    global selectedTasks, customCommands, fileToDelete, processesToKill
-    global veracryptTimeout, usbTimeout, shredPasses, shutdownMode, volumesToDismount
-    
-    selectedTasks = [task.get() for task in tasks if task.get()]
-    if not selectedTasks:
-        messagebox.showerror("Error", "Please select at least one task")
+    if not applyGuiSettings():
         return
     
-    customCommands = []
-    for commandEntry in commandEntries:
-        if commandEntry.get().strip():
-            customCommands.append(commandEntry.get().strip())
-    
-    processesToKill = []
-    for processEntry in processEntries:
-        if processEntry.get().strip():
-            processesToKill.append(processEntry.get().strip())
-    
-    fileToDelete = fileEntry.get()
-    
-    try:
-        veracryptTimeoutValue = int(veracryptTimeoutEntry.get())
-        if veracryptTimeoutValue > 0:
-            veracryptTimeout = veracryptTimeoutValue
-    except ValueError:
-        pass
-    
-    try:
-        usbTimeoutValue = int(usbTimeoutEntry.get())
-        if usbTimeoutValue > 0:
-            usbTimeout = usbTimeoutValue
-    except ValueError:
-        pass
-    
-    try:
-        shredPassesValue = int(shredPassesEntry.get())
-        if shredPassesValue > 0:
-            shredPasses = shredPassesValue
-    except ValueError:
-        pass
-    
-    shutdownMode = shutdownModeVar.get()
-    
-    volumesToDismount = volumesEntry.get().split(";")
-    volumesToDismount = [vol.strip() for vol in volumesToDismount if vol.strip()]
-    
     if usbMonitoring:
         usbStatusLabel.config(text="USB Monitoring started...")
     else:
+        if ramResidentImage and not runningFromRamImage:
+            execRamImage(["usb"] + (["identifier"] if monitoring else []))
         startUsbMonitoring()
+        startPreflight()
         usbPauseButton.config(state=tk.NORMAL)
         usbStartButton.config(state=tk.DISABLED)
         usbStatusLabel.config(text="USB Monitoring started...")
@@ -639,50 +3272,87 @@ def selectFiles():
     except Exception as e:
         messagebox.showerror("Error", f"Failed to select files: {str(e)}")
 
+def selectFscryptDirectory():
+    try:
+        directory = filedialog.askdirectory()
+        if directory:
+            existing = fscryptEntry.get().strip()
+            fscryptEntry.delete(0, tk.END)
+            fscryptEntry.insert(0, f"{existing}; {directory}" if existing else directory)
+    except Exception as e:
+        messagebox.showerror("Error", f"Failed to select directory: {str(e)}")
+
+def formatSize(size):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
 def selectVolumes():
     try:
-        mountedVolumes = getMountedUsbVolumes()
-        
-        if not mountedVolumes:
-            messagebox.showinfo("No Volumes", "No USB volumes currently mounted")
-            return
+        startVolumeInventory()
         
         volumeSelect = tk.Toplevel()
         volumeSelect.title("Select USB Volumes")
-        volumeSelect.geometry("500x400")
+        volumeSelect.geometry("760x400")
         
-        ttk.Label(volumeSelect, text="Select volumes to dismount:").pack(pady=10)
+        ttk.Label(volumeSelect, text="Select volumes to dismount (Ctrl or Shift click for several):").pack(pady=10)
+        pickerStatusLabel = ttk.Label(volumeSelect, text="Scanning volumes...")
+        pickerStatusLabel.pack(fill=tk.X, padx=10)
         
         volumeFrame = ttk.Frame(volumeSelect)
         volumeFrame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        volumeScrollbar = ttk.Scrollbar(volumeFrame)
+        volumeScrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        volumeColumns = ("device", "mountPoint", "label", "uuid", "size", "fstype", "identifier")
+        volumeTree = ttk.Treeview(volumeFrame, columns=volumeColumns, show="headings", selectmode="extended", 
+                                  yscrollcommand=volumeScrollbar.set)
+        for column, heading, width in zip(volumeColumns, 
+                                          ("Device", "Mount Point", "Label", "UUID", "Size", "Type", "Identifier"), 
+                                          (120, 170, 90, 120, 70, 60, 70)):
+            volumeTree.heading(column, text=heading)
+            volumeTree.column(column, width=width)
+        volumeTree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        volumeScrollbar.config(command=volumeTree.yview)
         
-        volumeVars = []
-        for device, mountPoint in mountedVolumes:
-            if not isSystemVolume(device, mountPoint):
-                var = tk.BooleanVar(value=False)
-                volumeVars.append((var, device, mountPoint))
-                cb = ttk.Checkbutton(volumeFrame, 
-                                    text=f"{device} mounted at {mountPoint}", 
-                                    variable=var)
-                cb.pack(anchor='w', padx=5, pady=2)
+        preselected = {volume.strip() for volume in volumesEntry.get().split(";") if volume.strip()}
+        shownVersion = [0]
+        
+        def refreshRows():
+            if not volumeSelect.winfo_exists():
+                return
+            with volumeInventoryLock:
+                version = volumeInventoryVersion
+                volumes = volumeInventory
+            # Rows are updated in place by device, so the selection survives volumes coming and going
+            if version != shownVersion[0]:
+                shownVersion[0] = version
+                candidates = {device: volume for device, volume in volumes.items() if not volume["system"]}
+                for device in volumeTree.get_children():
+                    if device not in candidates:
+                        volumeTree.delete(device)
+                for device, volume in sorted(candidates.items()):
+                    values = (device, volume["mountPoint"], volume["label"], volume["uuid"], formatSize(volume["size"]), 
+                              volume["fstype"], "yes" if volume["identifier"] else "")
+                    if volumeTree.exists(device):
+                        volumeTree.item(device, values=values)
+                        continue
+                    volumeTree.insert("", tk.END, iid=device, values=values)
+                    if device in preselected or volume["mountPoint"] in preselected:
+                        volumeTree.selection_add(device)
+                pickerStatusLabel.config(text=f"{len(candidates)} volumes, {len(volumes) - len(candidates)} system volumes hidden")
+            volumeSelect.after(500, refreshRows)
         
         def onSelect():
-            selected = []
-            for var, device, mountPoint in volumeVars:
-                if var.get():
-                    selected.append(device)
-            
             volumesEntry.delete(0, tk.END)
-            volumesEntry.insert(0, "; ".join(selected))
+            volumesEntry.insert(0, "; ".join(volumeTree.selection()))
             volumeSelect.destroy()
         
         def selectAll():
-            for var, _, _ in volumeVars:
-                var.set(True)
+            volumeTree.selection_set(volumeTree.get_children())
         
         def deselectAll():
-            for var, _, _ in volumeVars:
-                var.set(False)
+            volumeTree.selection_set(())
         
         buttonFrame = ttk.Frame(volumeSelect)
         buttonFrame.pack(fill=tk.X, padx=10, pady=10)
@@ -691,9 +3361,50 @@ def selectVolumes():
         ttk.Button(buttonFrame, text="Deselect All", command=deselectAll).pack(side=tk.LEFT, padx=5)
         ttk.Button(buttonFrame, text="OK", command=onSelect).pack(side=tk.RIGHT, padx=5)
         ttk.Button(buttonFrame, text="Cancel", command=volumeSelect.destroy).pack(side=tk.RIGHT, padx=5)
+        
+        refreshRows()
     except Exception as e:
         messagebox.showerror("Error", f"Failed to show volume selection: {str(e)}")
 
+def formatHistoryTime(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+def showDeviceEvents(events):
+    historyTree.delete(*historyTree.get_children())
+    for timestamp, action, vendor, product, serial, port, source in events:
+        historyTree.insert("", tk.END, values=(formatHistoryTime(timestamp), action, f"{vendor}:{product}", serial, port, source))
+
+def refreshDeviceHistory():
+    try:
+        showDeviceEvents(getDeviceEvents())
+    except sqlite3.Error as e:
+        historyResultLabel.config(text=f"Device history unavailable: {str(e)}")
+
+def checkDeviceHistory(event=None):
+    identity = parseDeviceIdentity(historyLookupEntry.get())
+    if identity is None:
+        historyResultLabel.config(text="Enter a device as vendor:product or vendor:product:serial")
+        return
+    try:
+        known = lookupDevice(identity)
+        if known is None:
+            historyResultLabel.config(text=f"{identity[0]}:{identity[1]} {identity[2]} has never been seen here")
+            showDeviceEvents([])
+            return
+        description, firstSeen, lastSeen, count = known
+        historyResultLabel.config(text=f"{description or 'Device'} seen {count} times, first {formatHistoryTime(firstSeen)}, "
+                                       f"last {formatHistoryTime(lastSeen)}")
+        showDeviceEvents(getDeviceEvents(identity))
+    except sqlite3.Error as e:
+        historyResultLabel.config(text=f"Device history unavailable: {str(e)}")
+
+def compactDeviceHistoryNow():
+    if deviceHistoryThread is not None and deviceHistoryThread.is_alive():
+        deviceHistoryQueue.put("compact")
+        logMessage("Device history compaction requested.")
+    else:
+        messagebox.showinfo("Device History", "Device history is compacted by the recorder, arm a monitor first")
+
 def logMessage(message):
     try:
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -735,13 +3446,166 @@ def changeUsbIdentifier(event=None):
 def onTabChanged(event):
     notebook.focus_set()
 
+def preloadTriggerModules():
+    # Modules the stdlib imports lazily on the trigger path, imported up front so nothing is read from disk later
+    for name in triggerPathModules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logMessage(f"Could not preload {name}: {str(e)}")
+    # subprocess decodes text output with the locale codec, which is imported on first use
+    codecs.lookup(locale.getpreferredencoding(False))
+
+def compileImageModule(name, module):
+    spec = getattr(module, "__spec__", None)
+    if spec is None or not isinstance(spec.origin, str) or not spec.origin.endswith(".py"):
+        return None
+    code = spec.loader.get_code(name)
+    if code is None:
+        return None
+    isPackage = spec.submodule_search_locations is not None
+    archiveName = name.replace(".", "/") + ("/__init__.pyc" if isPackage else ".pyc")
+    # Timestamp pyc header with no source next to it in the archive, so zipimport takes the bytecode as is
+    header = importlib.util.MAGIC_NUMBER + struct.pack("<III", 0, 0, 0)
+    return archiveName, header + marshal.dumps(code)
+
+def buildRamImage():
+    imageFd = os.memfd_create("usb-killswitch-image", os.MFD_ALLOW_SEALING)
+    with open(imageFd, "wb", closefd=False) as imageFile:
+        with zipfile.ZipFile(imageFile, "w", zipfile.ZIP_STORED) as image:
+            with open(os.path.abspath(__file__), "rb") as scriptFile:
+                image.writestr("__main__.py", scriptFile.read())
+            moduleCount = 0
+            for name, module in sorted(sys.modules.items()):
+                if name in ("__main__", "killswitch"):
+                    continue
+                try:
+                    compiled = compileImageModule(name, module)
+                except Exception as e:
+                    logMessage(f"Could not add {name} to the RAM image: {str(e)}")
+                    continue
+                if compiled:
+                    image.writestr(*compiled)
+                    moduleCount += 1
+    # Nothing can change the image once it is sealed, not even this process
+    fcntl.fcntl(imageFd, fcntl.F_ADD_SEALS, fcntl.F_SEAL_WRITE | fcntl.F_SEAL_GROW | fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_SEAL)
+    os.set_inheritable(imageFd, True)
+    return imageFd, moduleCount, os.fstat(imageFd).st_size
+
+def writeRestoreSettings(settings):
+    settingsFd = os.memfd_create("usb-killswitch-settings", 0)
+    os.write(settingsFd, json.dumps(settings).encode())
+    os.lseek(settingsFd, 0, os.SEEK_SET)
+    os.set_inheritable(settingsFd, True)
+    return settingsFd
+
+def readRestoreSettings():
+    settingsFd = os.environ.pop(restoreSettingsVariable, None)
+    if settingsFd is None:
+        return None
+    try:
+        with open(int(settingsFd), "rb") as settingsFile:
+            return json.loads(settingsFile.read())
+    except (OSError, ValueError) as e:
+        logMessage(f"Could not read the armed settings handed over to the RAM image: {str(e)}")
+        return None
+
+def lockProcessMemory():
+    if libc is None or libc.mlockall(MCL_CURRENT) != 0:
+        logMessage(f"Could not lock the armed process in memory: {os.strerror(ctypes.get_errno()) if libc else 'no libc'}")
+        return False
+    return True
+
+def execRamImage(armedMonitors):
+    try:
+        buildDispatchTable()
+        preloadTriggerModules()
+        settings = snapshotGuiSettings()
+        settings["armed"] = armedMonitors
+        start = time.perf_counter()
+        imageFd, moduleCount, imageSize = buildRamImage()
+        settingsFd = writeRestoreSettings(settings)
+    except Exception as e:
+        logMessage(f"Could not build the RAM image, arming from disk instead: {str(e)}")
+        return False
+    
+    logMessage(f"RAM image built with {moduleCount} modules ({imageSize // 1024} KiB) in {time.perf_counter() - start:.2f}s. Re-executing from memory...")
+    environment = dict(os.environ)
+    environment[restoreSettingsVariable] = str(settingsFd)
+    environment[ramImageVariable] = "1"
+    try:
+        os.execve(sys.executable, [sys.executable, f"/proc/self/fd/{imageFd}"], environment)
+    except OSError as e:
+        logMessage(f"Could not re-execute from the RAM image, arming from disk instead: {str(e)}")
+        os.close(imageFd)
+        os.close(settingsFd)
+        return False
+
+def getSettingsWidgets():
+    return {name: globals()[name] for name in settingsWidgetNames}
+
+def snapshotGuiSettings():
+    return {
+        "widgets": {name: widget.get() for name, widget in getSettingsWidgets().items()},
+        "tasks": [task.get() for task in tasks],
+        "processes": [entry.get() for entry in processEntries],
+        "commands": [entry.get() for entry in commandEntries],
+        "usbAuthorizedDefaults": usbAuthorizedDefaults
+    }
+
+def setWidgetValue(widget, value):
+    if isinstance(widget, tk.Variable):
+        widget.set(value)
+    else:
+        widget.delete(0, tk.END)
+        widget.insert(0, value)
+
+def restoreGuiSettings(settings):
+    widgets = getSettingsWidgets()
+    for name, value in settings.get("widgets", {}).items():
+        if name in widgets:
+            setWidgetValue(widgets[name], value)
+    for task, value in zip(tasks, settings.get("tasks", [])):
+        task.set(value)
+    for entries, addEntry, values in ((processEntries, addProcessEntry, settings.get("processes", [])),
+                                      (commandEntries, addCommandEntry, settings.get("commands", []))):
+        while len(entries) < len(values):
+            addEntry()
+        for entry, value in zip(entries, values):
+            setWidgetValue(entry, value)
+    changeUsbIdentifier()
+
+def restoreArmedSession():
+    global inheritedUsbAuthorizedDefaults
+    
+    settings = readRestoreSettings()
+    if settings is None:
+        return
+    
+    restoreGuiSettings(settings)
+    inheritedUsbAuthorizedDefaults = settings.get("usbAuthorizedDefaults", {})
+    logMessage("Running from the RAM image. Restoring armed monitors...")
+    if "identifier" in settings.get("armed", []):
+        onStartButtonClick()
+    if "usb" in settings.get("armed", []):
+        onUsbStartButtonClick()
+    # Everything the trigger path runs is imported by now, pin it so nothing pages in from disk either
+    if lockProcessMemory():
+        logMessage("Armed process locked in memory.")
+
 def createGui():
     global startButton, pauseButton, statusLabel
     global usbStartButton, usbPauseButton, usbStatusLabel
-    global tasks, commandEntries, fileEntry, processEntries
+    global tasks, commandEntries, fileEntry, processEntries, fscryptEntry, wipeDevicesEntry
     global logText, usbIdentifierEntry, veracryptTimeoutEntry, usbTimeoutEntry
     global notebook, processEntriesFrame, commandEntriesFrame
     global shutdownModeVar, volumesEntry, shredPassesEntry
+    global shutdownSyncVar, shutdownDryRunVar, lockdownBudgetEntry, sysrqEmergencyVar
+    global metricsPortEntry, metricsSocketEntry, metricsTextfileEntry, usbAuthorizationGateVar
+    global linkLossVar, powerLossVar, lidCloseVar, interfacesEntry
+    global peerTriggerVar, peerSecretEntry, peerDestinationsEntry, peerPortEntry
+    global deviceHistoryPathEntry, deviceHistoryRetentionEntry, historyLookupEntry, historyResultLabel, historyTree
+    global ramResidentVar
 
     try:
         root = tk.Tk()
@@ -773,6 +3637,9 @@ def createGui():
         logTab = ttk.Frame(notebook, style='TFrame')
         notebook.add(logTab, text="Logs")
         
+        historyTab = ttk.Frame(notebook, style='TFrame')
+        notebook.add(historyTab, text="Device History")
+        
         docsTab = ttk.Frame(notebook, style='TFrame')
         notebook.add(docsTab, text="Documentation")
 
@@ -807,6 +3674,16 @@ def createGui():
         shredPassesEntry.insert(0, "10")
         shredPassesEntry.pack(side=tk.LEFT, padx=5)
         
+        budgetFrame = ttk.Frame(configFrame)
+        budgetFrame.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(budgetFrame, text="Total Lockdown Budget (sec):").pack(side=tk.LEFT)
+        lockdownBudgetEntry = ttk.Entry(budgetFrame, width=5)
+        lockdownBudgetEntry.insert(0, "120")
+        lockdownBudgetEntry.pack(side=tk.LEFT, padx=5)
+        sysrqEmergencyVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(budgetFrame, text="Sysrq emergency poweroff when exceeded", 
+                        variable=sysrqEmergencyVar).pack(side=tk.LEFT, padx=5)
+        
         shutdownFrame = ttk.LabelFrame(configFrame, text="Shutdown Options")
         shutdownFrame.pack(fill=tk.X, padx=10, pady=5)
         
@@ -816,6 +3693,15 @@ def createGui():
         ttk.Radiobutton(shutdownFrame, text="Forced (poweroff -f)", 
                        variable=shutdownModeVar, value="forced").pack(anchor='w', padx=5, pady=2)
         
+        shutdownSyncVar = tk.BooleanVar(value=True)
+        ttk.Checkbutton(shutdownFrame, text="Sync disks before forced poweroff", 
+                        variable=shutdownSyncVar).pack(anchor='w', padx=5, pady=2)
+        shutdownDryRunVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(shutdownFrame, text="Dry run (measure shutdown latency, do not power off)", 
+                        variable=shutdownDryRunVar).pack(anchor='w', padx=5, pady=2)
+        ttk.Button(shutdownFrame, text="Measure Shutdown Latency", 
+                   command=lambda: threading.Thread(target=reportShutdownLatency, daemon=True).start()).pack(anchor='e', padx=5, pady=5)
+        
         volumeFrame = ttk.LabelFrame(configFrame, text="USB Volume Dismounting")
         volumeFrame.pack(fill=tk.X, padx=10, pady=5)
         
@@ -827,6 +3713,26 @@ def createGui():
         volumeButton = ttk.Button(volumeSelectionFrame, text="Select Volumes", command=selectVolumes)
         volumeButton.pack(side=tk.LEFT, padx=5)
         
+        ttk.Label(volumeFrame, text="Whole block devices to wipe (e.g. /dev/sdb; /dev/loop0):").pack(anchor='w', padx=5, pady=2)
+        wipeDevicesEntry = ttk.Entry(volumeFrame)
+        wipeDevicesEntry.pack(fill=tk.X, padx=5, pady=2)
+        
+        metricsFrame = ttk.LabelFrame(configFrame, text="Metrics (local only, leave empty to disable)")
+        metricsFrame.pack(fill=tk.X, padx=10, pady=5)
+        metricsEndpointFrame = ttk.Frame(metricsFrame)
+        metricsEndpointFrame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(metricsEndpointFrame, text="HTTP port:").pack(side=tk.LEFT)
+        metricsPortEntry = ttk.Entry(metricsEndpointFrame, width=6)
+        metricsPortEntry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(metricsEndpointFrame, text="or Unix socket:").pack(side=tk.LEFT, padx=(10,0))
+        metricsSocketEntry = ttk.Entry(metricsEndpointFrame)
+        metricsSocketEntry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        metricsTextfileFrame = ttk.Frame(metricsFrame)
+        metricsTextfileFrame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(metricsTextfileFrame, text="Textfile collector directory:").pack(side=tk.LEFT)
+        metricsTextfileEntry = ttk.Entry(metricsTextfileFrame)
+        metricsTextfileEntry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        
         taskFrame = ttk.LabelFrame(configFrame, text="Select Tasks to Execute")
         taskFrame.pack(fill=tk.X, padx=10, pady=10)
 
@@ -835,58 +3741,20 @@ def createGui():
         taskGrid = ttk.Frame(taskFrame)
         taskGrid.pack(fill=tk.X, padx=5, pady=5)
 
-        taskDismount = tk.StringVar(value="Dismount VeraCrypt Volumes")
-        taskDismountCheckbox = ttk.Checkbutton(taskGrid, text="Dismount VeraCrypt Volumes", 
-                                                 variable=taskDismount, onvalue="Dismount VeraCrypt Volumes", offvalue="")
-        taskDismountCheckbox.grid(row=0, column=0, sticky='w', padx=5, pady=2)
-        tasks.append(taskDismount)
-        
-        taskDismountUsb = tk.StringVar(value="Dismount USB Volumes")
-        taskDismountUsbCheckbox = ttk.Checkbutton(taskGrid, text="Dismount USB Volumes", 
-                                                   variable=taskDismountUsb, onvalue="Dismount USB Volumes", offvalue="")
-        taskDismountUsbCheckbox.grid(row=0, column=1, sticky='w', padx=5, pady=2)
-        tasks.append(taskDismountUsb)
-
-        taskEndProcess = tk.StringVar(value="End Process")
-        taskEndProcessCheckbox = ttk.Checkbutton(taskGrid, text="End Process", 
-                                                   variable=taskEndProcess, onvalue="End Process", offvalue="")
-        taskEndProcessCheckbox.grid(row=1, column=0, sticky='w', padx=5, pady=2)
-        tasks.append(taskEndProcess)
-
-        taskDeleteFile = tk.StringVar(value="Delete File")
-        taskDeleteFileCheckbox = ttk.Checkbutton(taskGrid, text="Delete File", 
-                                                   variable=taskDeleteFile, onvalue="Delete File", offvalue="")
-        taskDeleteFileCheckbox.grid(row=1, column=1, sticky='w', padx=5, pady=2)
-        tasks.append(taskDeleteFile)
-
-        taskOverwriteFile = tk.StringVar(value="Overwrite File")
-        taskOverwriteFileCheckbox = ttk.Checkbutton(taskGrid, text="Overwrite File", 
-                                                      variable=taskOverwriteFile, onvalue="Overwrite File", offvalue="")
-        taskOverwriteFileCheckbox.grid(row=2, column=0, sticky='w', padx=5, pady=2)
-        tasks.append(taskOverwriteFile)
-
-        taskTurnOffScreen = tk.StringVar(value="Turn Off Screen")
-        taskTurnOffScreenCheckbox = ttk.Checkbutton(taskGrid, text="Turn Off Screen", 
-                                                       variable=taskTurnOffScreen, onvalue="Turn Off Screen", offvalue="")
-        taskTurnOffScreenCheckbox.grid(row=2, column=1, sticky='w', padx=5, pady=2)
-        tasks.append(taskTurnOffScreen)
-
-        taskLockComputer = tk.StringVar(value="Lock Computer")
-        taskLockComputerCheckbox = ttk.Checkbutton(taskGrid, text="Lock Computer", 
-                                                     variable=taskLockComputer, onvalue="Lock Computer", offvalue="")
-        taskLockComputerCheckbox.grid(row=3, column=0, sticky='w', padx=5, pady=2)
-        tasks.append(taskLockComputer)
-
-        taskShutdown = tk.StringVar(value="Shutdown")
-        taskShutdownCheckbox = ttk.Checkbutton(taskGrid, text="Shutdown", 
-                                                variable=taskShutdown, onvalue="Shutdown", offvalue="")
-        taskShutdownCheckbox.grid(row=3, column=1, sticky='w', padx=5, pady=2)
-        tasks.append(taskShutdown)
+        # Checkboxes come from the action registry, actions that select themselves (custom commands) get none
+        discoverPluginActions()
+        taskNames = [name for name, action in actionRegistry.items() if action["selectWhen"] is None] + ["Shutdown"]
+        for index, taskName in enumerate(taskNames):
+            isDefault = actionRegistry[taskName]["default"] if taskName in actionRegistry else True
+            taskVar = tk.StringVar(value=taskName if isDefault else "")
+            ttk.Checkbutton(taskGrid, text=taskName, variable=taskVar, onvalue=taskName, 
+                            offvalue="").grid(row=index // 2, column=index % 2, sticky='w', padx=5, pady=2)
+            tasks.append(taskVar)
 
         processFrame = ttk.LabelFrame(configFrame, text="Process Management")
         processFrame.pack(fill=tk.X, padx=10, pady=5)
         
-        ttk.Label(processFrame, text="Processes to Kill:").pack(anchor='w', padx=5, pady=2)
+        ttk.Label(processFrame, text="Processes to Kill (name, or unit:/slice:/cgroup: to kill a whole cgroup):").pack(anchor='w', padx=5, pady=2)
         
         processEntriesFrame = ttk.Frame(processFrame)
         processEntriesFrame.pack(fill=tk.X, padx=5, pady=2)
@@ -909,6 +3777,14 @@ def createGui():
         fileEntry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         fileButton = ttk.Button(fileSelectionFrame, text="Select Files", command=selectFiles)
         fileButton.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(fileFrame, text="Encrypted (fscrypt) Directories to Crypto-Erase:").pack(anchor='w', padx=5, pady=2)
+        fscryptSelectionFrame = ttk.Frame(fileFrame)
+        fscryptSelectionFrame.pack(fill=tk.X, padx=5, pady=2)
+        fscryptEntry = ttk.Entry(fscryptSelectionFrame)
+        fscryptEntry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        fscryptButton = ttk.Button(fscryptSelectionFrame, text="Add Directory", command=selectFscryptDirectory)
+        fscryptButton.pack(side=tk.LEFT, padx=5)
 
         commandFrame = ttk.LabelFrame(configFrame, text="Custom Commands")
         commandFrame.pack(fill=tk.X, padx=10, pady=5)
@@ -928,6 +3804,10 @@ def createGui():
 
         monitorFrame = ttk.Frame(monitoringTab)
         monitorFrame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        ramResidentVar = tk.BooleanVar(value=runningFromRamImage)
+        ttk.Checkbutton(monitorFrame, text="Arm from a RAM image (the drive holding this script can be pulled)", 
+                        variable=ramResidentVar).pack(anchor='w', padx=10, pady=(10,0))
 
         identifierMonitorFrame = ttk.LabelFrame(monitorFrame, text="USB Identifier Monitoring")
         identifierMonitorFrame.pack(fill=tk.X, padx=10, pady=10)
@@ -959,9 +3839,53 @@ def createGui():
                                       command=onUsbPauseButtonClick, state=tk.DISABLED)
         usbPauseButton.pack(side=tk.LEFT, padx=5)
         
+        usbAuthorizationGateVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(usbMonitorFrame, text="Kernel authorization gate (hold new USB devices unauthorized)", 
+                        variable=usbAuthorizationGateVar).pack(anchor='w', padx=5, pady=2)
+        
         usbStatusLabel = ttk.Label(usbMonitorFrame, text="Status: Not Armed")
         usbStatusLabel.pack(fill=tk.X, padx=5, pady=5)
 
+        eventTriggerFrame = ttk.LabelFrame(monitorFrame, text="Event Triggers (active while any monitor is armed)")
+        eventTriggerFrame.pack(fill=tk.X, padx=10, pady=10)
+        
+        linkLossVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(eventTriggerFrame, text="Network link lost (cable pulled, Wi-Fi disassociated)", 
+                        variable=linkLossVar).pack(anchor='w', padx=5, pady=2)
+        interfacesFrame = ttk.Frame(eventTriggerFrame)
+        interfacesFrame.pack(fill=tk.X, padx=25, pady=2)
+        ttk.Label(interfacesFrame, text="Interfaces (empty for all connected):").pack(side=tk.LEFT)
+        interfacesEntry = ttk.Entry(interfacesFrame)
+        interfacesEntry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        powerLossVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(eventTriggerFrame, text="Switched from AC power to battery", 
+                        variable=powerLossVar).pack(anchor='w', padx=5, pady=2)
+        lidCloseVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(eventTriggerFrame, text="Laptop lid closed", 
+                        variable=lidCloseVar).pack(anchor='w', padx=5, pady=2)
+
+        peerFrame = ttk.LabelFrame(monitorFrame, text="Peer Triggers (LAN)")
+        peerFrame.pack(fill=tk.X, padx=10, pady=10)
+        
+        peerTriggerVar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(peerFrame, text="Propagate lockdowns to armed peers and accept theirs", 
+                        variable=peerTriggerVar).pack(anchor='w', padx=5, pady=2)
+        peerSettingsFrame = ttk.Frame(peerFrame)
+        peerSettingsFrame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(peerSettingsFrame, text="Shared secret:").pack(side=tk.LEFT)
+        peerSecretEntry = ttk.Entry(peerSettingsFrame, show="*", width=16)
+        peerSecretEntry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(peerSettingsFrame, text="UDP port:").pack(side=tk.LEFT, padx=(10,0))
+        peerPortEntry = ttk.Entry(peerSettingsFrame, width=6)
+        peerPortEntry.insert(0, str(peerPort))
+        peerPortEntry.pack(side=tk.LEFT, padx=5)
+        peerDestinationsFrame = ttk.Frame(peerFrame)
+        peerDestinationsFrame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(peerDestinationsFrame, text="Multicast group or peers (host[:port]; ...):").pack(side=tk.LEFT)
+        peerDestinationsEntry = ttk.Entry(peerDestinationsFrame)
+        peerDestinationsEntry.insert(0, "; ".join(peerDestinations))
+        peerDestinationsEntry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
         logFrame = ttk.Frame(logTab)
         logFrame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
@@ -982,6 +3906,53 @@ def createGui():
                                                      logText.config(state=tk.DISABLED)])
         clearLogButton.pack(side=tk.RIGHT, padx=5, pady=5)
         
+        preflightButton = ttk.Button(logFrame, text="Run Preflight", 
+                                     command=onPreflightButtonClick)
+        preflightButton.pack(side=tk.RIGHT, padx=5, pady=5)
+        
+        historyFrame = ttk.Frame(historyTab)
+        historyFrame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        historySettingsFrame = ttk.LabelFrame(historyFrame, text="Recording (empty path to disable)")
+        historySettingsFrame.pack(fill=tk.X, pady=5)
+        historyPathFrame = ttk.Frame(historySettingsFrame)
+        historyPathFrame.pack(fill=tk.X, padx=5, pady=2)
+        ttk.Label(historyPathFrame, text="Database:").pack(side=tk.LEFT)
+        deviceHistoryPathEntry = ttk.Entry(historyPathFrame)
+        deviceHistoryPathEntry.insert(0, deviceHistoryPath)
+        deviceHistoryPathEntry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(historyPathFrame, text="Keep days:").pack(side=tk.LEFT, padx=(10,0))
+        deviceHistoryRetentionEntry = ttk.Entry(historyPathFrame, width=6)
+        deviceHistoryRetentionEntry.insert(0, str(deviceHistoryRetentionDays))
+        deviceHistoryRetentionEntry.pack(side=tk.LEFT, padx=5)
+        
+        historyLookupFrame = ttk.Frame(historyFrame)
+        historyLookupFrame.pack(fill=tk.X, pady=5)
+        ttk.Label(historyLookupFrame, text="Device (vendor:product[:serial]):").pack(side=tk.LEFT)
+        historyLookupEntry = ttk.Entry(historyLookupFrame)
+        historyLookupEntry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        historyLookupEntry.bind("<Return>", checkDeviceHistory)
+        ttk.Button(historyLookupFrame, text="Check", command=checkDeviceHistory).pack(side=tk.LEFT, padx=5)
+        
+        historyResultLabel = ttk.Label(historyFrame, text="")
+        historyResultLabel.pack(fill=tk.X, pady=5)
+        
+        historyTreeFrame = ttk.Frame(historyFrame)
+        historyTreeFrame.pack(fill=tk.BOTH, expand=True)
+        historyScrollbar = ttk.Scrollbar(historyTreeFrame)
+        historyScrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        historyColumns = ("time", "action", "device", "serial", "port", "source")
+        historyTree = ttk.Treeview(historyTreeFrame, columns=historyColumns, show="headings", 
+                                   yscrollcommand=historyScrollbar.set)
+        for column, width in zip(historyColumns, (140, 70, 90, 120, 60, 90)):
+            historyTree.heading(column, text=column.capitalize())
+            historyTree.column(column, width=width)
+        historyTree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
+        historyScrollbar.config(command=historyTree.yview)
+        
+        ttk.Button(historyFrame, text="Compact Now", command=compactDeviceHistoryNow).pack(side=tk.RIGHT, padx=5, pady=5)
+        ttk.Button(historyFrame, text="Show Recent", command=refreshDeviceHistory).pack(side=tk.RIGHT, padx=5, pady=5)
+        
         docsFrame = ttk.Frame(docsTab)
         docsFrame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
@@ -997,6 +3968,18 @@ specific USB events occur, such as a device being removed or any USB device chan
 MONITORING MODES:
 1. USB Identifier Monitoring - Triggers actions when a specific USB drive (identified by name) is removed
 2. USB Change Monitoring - Triggers actions when any USB device change is detected
+   With the kernel authorization gate enabled, authorized_default is set to 0 on every USB host
+   controller while armed. New devices stay unauthorized (no driver binds) and the trigger fires
+   from the kernel uevent. Devices present at arm time are allowlisted and re-authorized
+   automatically by vendor, product and serial
+3. Event Triggers - While either monitor is armed, optional event sources also trigger the actions:
+   network link loss (rtnetlink RTMGRP_LINK), switching from AC power to battery (power_supply
+   uevents) and closing the laptop lid (evdev SW_LID). They are read from non-blocking sockets and
+   file descriptors without polling
+4. Peer Triggers - When enabled, a local trigger first sends an HMAC-SHA256 signed datagram to the
+   configured multicast group or unicast peers, and datagrams from armed peers with the same shared
+   secret trigger the local actions. Timestamps older than 5 seconds and repeated nonces are
+   rejected, and peer triggers are never forwarded again
 
 CONFIGURATION OPTIONS:
 
@@ -1004,23 +3987,100 @@ CONFIGURATION OPTIONS:
 - VeraCrypt Timeout: Maximum time (in seconds) to wait for VeraCrypt volumes to dismount
 - USB Dismount Timeout: Maximum time (in seconds) to wait for USB volumes to dismount
 - Shred Overwrites: Number of passes when securely overwriting files
-- Shutdown Options: Choose between immediate or forced shutdown
-- Volumes to Dismount: Specify which volumes to dismount, or leave empty for all non-system USB volumes
+- Total Lockdown Budget: Upper bound (in seconds) for a whole trigger. Actions run in priority order
+  (process kills and VeraCrypt first, shredding last) and share the budget. When everything no longer
+  fits, low priority work such as shredding and custom commands is cancelled or skipped, and the last
+  10 seconds are always kept for the shutdown. Per-action budget use is written to the log. With the sysrq emergency tier
+  enabled, a watchdog writes s (sync), u (read-only remount) and o (power off) to /proc/sysrq-trigger
+  once the budget is exceeded, even if an action or the shutdown itself is hung. In dry run mode the
+  keys go to /tmp/usb-killswitch-sysrq-dry-run instead
+- Shutdown Options: Choose between immediate or forced shutdown. Forced shutdown calls reboot(2)
+  directly when running with CAP_SYS_BOOT, otherwise logind is asked over D-Bus, and the
+  poweroff/shutdown commands are used as a last resort. Dry run measures each tier without powering off
+- Volumes to Dismount: Specify which volumes to dismount, or leave empty for all non-system USB volumes.
+  The picker lists mounted non-system volumes with label, UUID, size, filesystem type and whether the
+  volume is the identifier USB. It is filled from a volume inventory that a background thread keeps
+  current from /proc/self/mountinfo, woken by the kernel on every mount change, so it opens at once
+  and updates live
+
+- Metrics: Optional OpenMetrics endpoint on 127.0.0.1 (HTTP port) or a Unix socket, and/or a
+  node-exporter textfile collector directory. Exposes armed state, detection cycle time, devices
+  seen, triggers and per-action duration, budget and outcome
 
 AVAILABLE TASKS:
 - Dismount VeraCrypt Volumes: Safely dismounts all VeraCrypt encrypted volumes
 - Dismount USB Volumes: Safely dismounts USB drives
-- End Process: Terminates specified processes
+- End Process: Terminates specified processes. Plain names are killed with pkill -9. Entries written as
+  unit:firefox.service, slice:user-1000.slice or cgroup:/sys/fs/cgroup/some/group are resolved at arm
+  time and the whole cgroup v2 tree is frozen through cgroup.freeze, then killed through cgroup.kill.
+  A cgroup that contains the killswitch itself (often the case for slice:user-1000.slice) is skipped,
+  since freezing it would stop the lockdown; run the killswitch from its own unit to kill such a slice
 - Delete File: Deletes specified files
 - Overwrite File: Securely overwrites files using the shred command
-- Turn Off Screen: Turns off the display
-- Lock Computer: Locks the computer screen
+- Crypto-Erase Directories: Removes the ext4/f2fs native encryption (fscrypt) key of each configured
+  directory and drops the page caches, which makes the plaintext unreachable in constant time no matter
+  how much data there is. Runs before every other task, and again after the other tasks if some
+  files were still open
+- Wipe Block Devices: Wipes whole USB sticks or scratch partitions with the BLKSECDISCARD or BLKDISCARD
+  ioctl, falling back to BLKZEROOUT, so the device does the work. Devices are wiped in parallel after
+  the dismount tasks and the throughput of each one is logged
+- Sanitize Memory and Swap: Runs after the dismount, delete, overwrite and wipe tasks. Syncs the
+  filesystems of the configured files with syncfs, evicts the files that are left from the page cache
+  with posix_fadvise, drops the page caches, then takes every swap device off in parallel. dm-crypt
+  swap is re-keyed with a fresh random key (dmsetup), swap partitions are wiped with discard or
+  zero-out and swap files are zeroed in place. Without a shutdown selected, swap is recreated with
+  its old UUID and label and turned back on. Each step is timed in the log
+- Turn Off Screen: Turns off the display. X11 DPMS over the X socket, the DRM connector DPMS property
+  on the console and the xset/vbetool/xrandr commands are tried in parallel, and the first one that
+  confirms the display is off wins
+- Lock Computer: Locks the computer screen. logind LockSessions over the system bus (confirmed through
+  the session LockedHint) and the desktop lock commands (confirmed by their exit status) are tried in
+  parallel, and the first confirmed lock wins
 - Shutdown: Shuts down the system (runs last after all other tasks)
 
+Every action declares a priority, an estimated cost, whether it is safe to run concurrently and
+which actions it has to run after. The run order is built once at arm time: lowest priority number
+first, never ahead of a selected dependency, and neighbouring concurrency-safe actions of the same
+priority (turning off the screen and locking) run together.
+
+ACTION PLUGINS:
+Site-specific actions can be installed as Python packages that declare an entry point in the
+"usb_killswitch.actions" group. The entry point name is the checkbox label, and it points to a
+function taking the timeout in seconds, or to a dict with "run" and optionally "priority" (0 runs
+first, 4 and up can be skipped when the budget is short), "estimate" (seconds), "concurrent",
+"after" (action names) and "preflight" (takes a warnings list and returns predicted seconds).
+Only the package metadata is read at startup; a plugin is imported when an armed schedule selects it.
+
+PREFLIGHT:
+Arming runs a preflight in the background that walks every selected task without side effects. It
+resolves binaries, stats files and devices, probes write throughput with a small sample file next to
+the files to shred, counts matching processes and volumes, and logs a predicted time per action and
+in total, with warnings when something is missing or the prediction is over the lockdown budget.
+Actions that share a dispatch stage run concurrently, so a stage is predicted by its slowest action.
+The shutdown tiers are not measured here, since that syncs the disks, probes reboot(2) and runs
+sudo. Preflight uses the latencies from the last "Measure Shutdown Latency" run, or assumed
+latencies for the tiers that are available. The "Run Preflight" button on the Logs tab runs it
+without arming.
+
+DEVICE HISTORY:
+From the first arm on, every USB device arrival and departure is recorded by vendor, product and
+serial in an SQLite database (default /var/lib/usb-killswitch/device-history.sqlite3). Kernel uevents
+and the monitor checks only queue a request, and a background writer diffs the sysfs device list and
+writes bursts as one WAL transaction. The Device History tab answers whether a device has ever been
+seen here and lists its arrivals and departures. Events and devices older than the retention period
+are compacted away every 6 hours, and at most 100000 events are kept.
+
+RAM IMAGE:
+With "Arm from a RAM image" ticked, arming packs the script and the bytecode of every module it has
+loaded (the GUI, the trigger path and any action plugins) into a sealed in-memory file (memfd) and
+re-executes from it. The window reopens with the same settings and arms itself again, and the
+process memory is locked with mlockall. From then on no code is read from the script's drive or
+from the disk, so the identifier USB holding the script can be pulled.
+
 FAILSAFES AND EDGE CASES:
 - All operations have timeouts to prevent hanging
 - Each task is handled separately so failure in one won't stop others
-- Multiple methods are tried for screen locking and turning off the display
+- Multiple methods are tried in parallel for screen locking and turning off the display
 - Secure dismounting of volumes with fallback to lazy unmount if needed
 - System volumes are protected from accidental dismounting
 - Custom commands run with timeouts to prevent hanging
@@ -1043,6 +4103,8 @@ https://github.com/nthpyrodev/usb-killswitch
         docsText.config(state=tk.DISABLED)
 
         logMessage("USB Killswitch Monitor started. Configure and arm to begin monitoring.")
+        startVolumeInventory()
+        restoreArmedSession()
 
         notebook.focus_set()
 
@@ -1065,4 +4127,7 @@ def launchGuiWithElevatedPrivileges():
         print(f"Error launching application: {str(e)}")
         createGui()
 
-launchGuiWithElevatedPrivileges()
+registerBuiltinActions()
+
+if __name__ == "__main__":
+    launchGuiWithElevatedPrivileges()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+class ZeroOutRangeTest(unittest.TestCase):
+    def testRangesCoverTheDeviceContiguously(self):
+        for size, chunkSize in ((10, 3), (9, 3), (1, 4096), (4096, 4096), (2 ** 40 + 512, 256 * 1024 * 1024)):
+            ranges = killswitch.planZeroOutRanges(size, chunkSize)
+            offset = 0
+            for start, length in ranges:
+                self.assertEqual(start, offset)
+                self.assertTrue(0 < length <= chunkSize)
+                offset += length
+            self.assertEqual(offset, size)
+
+    def testLastRangeIsCutShort(self):
+        self.assertEqual(killswitch.planZeroOutRanges(10, 4), [(0, 4), (4, 4), (8, 2)])
+
+    def testEmptyDeviceNeedsNoRanges(self):
+        self.assertEqual(killswitch.planZeroOutRanges(0, 4096), [])
+
+@unittest.skipUnless(os.geteuid() == 0 and shutil.which("losetup"), "needs root and losetup")
+class LoopDeviceWipeTest(unittest.TestCase):
+    size = 4 * 1024 * 1024
+
+    def setUp(self):
+        self.saved = (killswitch.logMessage, killswitch.metricSet, killswitch.zeroOutChunkSize,
+                      killswitch.BLKSECDISCARD, killswitch.BLKDISCARD)
+        killswitch.logMessage = lambda message: None
+        killswitch.metricSet = lambda *args, **kwargs: None
+        handle, self.backingFile = tempfile.mkstemp()
+        os.write(handle, os.urandom(self.size))
+        os.close(handle)
+        try:
+            self.device = subprocess.run(["losetup", "--find", "--show", self.backingFile],
+                                         capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError) as e:
+            os.remove(self.backingFile)
+            self.skipTest(f"no loop device available: {e}")
+
+    def tearDown(self):
+        (killswitch.logMessage, killswitch.metricSet, killswitch.zeroOutChunkSize,
+         killswitch.BLKSECDISCARD, killswitch.BLKDISCARD) = self.saved
+        subprocess.run(["losetup", "--detach", self.device], check=False)
+        os.remove(self.backingFile)
+
+    def assertDeviceIsZero(self):
+        with open(self.device, "rb") as device:
+            self.assertEqual(device.read().count(0), self.size)
+
+    def testWipeLeavesOnlyZeroes(self):
+        results = {}
+        killswitch.wipeBlockDevice(self.device, time.monotonic() + 30, results)
+        self.assertEqual(results, {self.device: True})
+        self.assertDeviceIsZero()
+
+    def testZeroOutFallbackWhenDiscardIsRefused(self):
+        # Invalid ioctl numbers make both discard variants fail, as on devices without discard support
+        killswitch.BLKSECDISCARD = killswitch.BLKDISCARD = 0
+        killswitch.zeroOutChunkSize = 1024 * 1024 + 4096
+        results = {}
+        killswitch.wipeBlockDevice(self.device, time.monotonic() + 30, results)
+        self.assertEqual(results, {self.device: True})
+        self.assertDeviceIsZero()
+
+    def testExpiredDeadlineStopsZeroOut(self):
+        killswitch.BLKSECDISCARD = killswitch.BLKDISCARD = 0
+        results = {}
+        killswitch.wipeBlockDevice(self.device, time.monotonic() - 1, results)
+        self.assertEqual(results, {self.device: False})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+class OwnCgroupTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (killswitch.cgroupRoot, killswitch.selfCgroupPath, killswitch.processesToKill,
+                      killswitch.cgroupKillPaths, killswitch.logMessage)
+        self.messages = []
+        killswitch.logMessage = self.messages.append
+        killswitch.cgroupRoot = tempfile.mkdtemp()
+        open(os.path.join(killswitch.cgroupRoot, "cgroup.controllers"), "w").close()
+        self.userSlice = os.path.join(killswitch.cgroupRoot, "user.slice/user-1000.slice")
+        self.service = os.path.join(killswitch.cgroupRoot, "system.slice/app.service")
+        os.makedirs(os.path.join(self.userSlice, "session-2.scope"))
+        os.makedirs(self.service)
+        killswitch.selfCgroupPath = os.path.join(killswitch.cgroupRoot, "self-cgroup")
+        with open(killswitch.selfCgroupPath, "w") as selfCgroup:
+            selfCgroup.write("0::/user.slice/user-1000.slice/session-2.scope\n")
+
+    def tearDown(self):
+        shutil.rmtree(killswitch.cgroupRoot)
+        (killswitch.cgroupRoot, killswitch.selfCgroupPath, killswitch.processesToKill,
+         killswitch.cgroupKillPaths, killswitch.logMessage) = self.saved
+
+    def testOwnCgroupAndAncestorsAreDetected(self):
+        self.assertTrue(killswitch.containsOwnCgroup(self.userSlice))
+        self.assertTrue(killswitch.containsOwnCgroup(os.path.join(self.userSlice, "session-2.scope")))
+        self.assertTrue(killswitch.containsOwnCgroup(killswitch.cgroupRoot))
+        self.assertFalse(killswitch.containsOwnCgroup(self.service))
+        # A sibling whose name only shares a prefix is not an ancestor
+        self.assertFalse(killswitch.containsOwnCgroup(self.userSlice[:-len(".slice")]))
+
+    def testTargetContainingOwnCgroupIsRejected(self):
+        killswitch.processesToKill = ["slice:user-1000.slice", "unit:app.service"]
+        killswitch.resolveCgroupTargets()
+        self.assertEqual(killswitch.cgroupKillPaths, {"slice:user-1000.slice": [], "unit:app.service": [self.service]})
+        
+        killswitch.cgroupKillPaths = {}
+        killswitch.killCgroupTargets(killswitch.processesToKill, time.monotonic() + 0.1)
+        self.assertFalse(os.path.exists(os.path.join(self.userSlice, "cgroup.freeze")))
+        self.assertFalse(os.path.exists(os.path.join(self.userSlice, "cgroup.kill")))
+        with open(os.path.join(self.service, "cgroup.freeze")) as freeze:
+            self.assertEqual(freeze.read(), "1")
+        self.assertTrue(any("Refusing" in message for message in self.messages))
+
+    def testPreflightWarnsAboutOwnCgroup(self):
+        killswitch.processesToKill = ["slice:user-1000.slice"]
+        warnings = []
+        killswitch.preflightProcesses(warnings)
+        self.assertTrue(any("own cgroup" in warning for warning in warnings))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+import ast
+import builtins
+import inspect
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+class GuiBindingTest(unittest.TestCase):
+    def testEveryNameCreateGuiUsesExists(self):
+        # Widgets are bound to handlers by name, a missing one only shows up as a NameError at launch
+        tree = ast.parse(inspect.getsource(killswitch.createGui))
+        assigned = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load)}
+        assigned |= {node.arg for node in ast.walk(tree) if isinstance(node, ast.arg)}
+        assigned |= {node.name for node in ast.walk(tree) if isinstance(node, ast.ExceptHandler) and node.name}
+        loaded = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+        missing = sorted(name for name in loaded - assigned if not hasattr(killswitch, name) and not hasattr(builtins, name))
+        self.assertEqual(missing, [])
+
+if __name__ == "__main__":
+    unittest.main()
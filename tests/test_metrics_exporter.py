@@ -0,0 +1,75 @@
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+class MetricsExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved = (killswitch.metricsPort, killswitch.metricsSocketPath, killswitch.metricsTextfileDir,
+                      killswitch.logMessage)
+        self.messages = []
+        killswitch.logMessage = self.messages.append
+        killswitch.metricsTextfileDir = ""
+        killswitch.metricsPort = 0
+
+    def tearDown(self):
+        if killswitch.metricsServer is not None:
+            killswitch.stopMetricsServer()
+        (killswitch.metricsPort, killswitch.metricsSocketPath, killswitch.metricsTextfileDir,
+         killswitch.logMessage) = self.saved
+        shutil.rmtree(self.directory)
+
+    def scrape(self, address):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        with socket.socket(family, socket.SOCK_STREAM) as client:
+            client.connect(address)
+            client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+            return b"".join(iter(lambda: client.recv(65536), b""))
+
+    def testSocketIsOwnerOnlyAndStaleSocketIsReplaced(self):
+        killswitch.metricsSocketPath = os.path.join(self.directory, "metrics.sock")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(killswitch.metricsSocketPath)
+        killswitch.startMetricsExporter()
+        self.assertEqual(stat.S_IMODE(os.stat(killswitch.metricsSocketPath).st_mode), 0o600)
+        self.assertIn(b"200", self.scrape(killswitch.metricsSocketPath).split(b"\r\n")[0])
+
+    def testRegularFileAtSocketPathIsKept(self):
+        killswitch.metricsSocketPath = os.path.join(self.directory, "important")
+        with open(killswitch.metricsSocketPath, "w") as important:
+            important.write("keep me")
+        killswitch.startMetricsExporter()
+        self.assertIsNone(killswitch.metricsServer)
+        with open(killswitch.metricsSocketPath) as important:
+            self.assertEqual(important.read(), "keep me")
+
+    def testChangedAddressRebinds(self):
+        firstPath = os.path.join(self.directory, "first.sock")
+        killswitch.metricsSocketPath = firstPath
+        killswitch.startMetricsExporter()
+        
+        killswitch.metricsSocketPath = os.path.join(self.directory, "second.sock")
+        killswitch.startMetricsExporter()
+        self.assertFalse(os.path.exists(firstPath))
+        self.assertIn(b"200", self.scrape(killswitch.metricsSocketPath).split(b"\r\n")[0])
+        
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.bind(("127.0.0.1", 0))
+            killswitch.metricsPort = probe.getsockname()[1]
+        killswitch.metricsSocketPath = ""
+        killswitch.startMetricsExporter()
+        self.assertIn(b"200", self.scrape(("127.0.0.1", killswitch.metricsPort)).split(b"\r\n")[0])
+        
+        killswitch.metricsPort = 0
+        killswitch.startMetricsExporter()
+        self.assertIsNone(killswitch.metricsServer)
+
+if __name__ == "__main__":
+    unittest.main()
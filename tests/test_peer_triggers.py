@@ -0,0 +1,118 @@
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+repoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoRoot)
+import killswitch
+
+class PeerTriggerTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (killswitch.peerSecret, killswitch.peerNodeId, killswitch.peerDestinations, killswitch.peerPort,
+                      killswitch.peerMaxAge, dict(killswitch.peerSeenNonces), killswitch.logMessage, killswitch.executeTasks)
+        killswitch.peerSecret = "shared secret"
+        killswitch.peerNodeId = os.urandom(8)
+        killswitch.peerMaxAge = 5
+        killswitch.peerSeenNonces.clear()
+        killswitch.logMessage = lambda message: None
+
+    def tearDown(self):
+        (killswitch.peerSecret, killswitch.peerNodeId, killswitch.peerDestinations, killswitch.peerPort,
+         killswitch.peerMaxAge, seenNonces, killswitch.logMessage, killswitch.executeTasks) = self.saved
+        killswitch.peerSeenNonces.clear()
+        killswitch.peerSeenNonces.update(seenNonces)
+
+    def buildFromPeer(self, reason="peer-b", **kwargs):
+        # A datagram from another node, as verifyPeerDatagram drops our own
+        ownNodeId = killswitch.peerNodeId
+        killswitch.peerNodeId = os.urandom(8)
+        try:
+            return killswitch.buildPeerDatagram(reason, **kwargs)
+        finally:
+            killswitch.peerNodeId = ownNodeId
+
+    def testRoundTripIsAccepted(self):
+        result, trigger = killswitch.verifyPeerDatagram(self.buildFromPeer("lid closed"))
+        self.assertEqual(result, "accepted")
+        self.assertEqual(trigger["reason"], "lid closed")
+
+    def testWrongSecretIsRejected(self):
+        datagram = self.buildFromPeer()
+        killswitch.peerSecret = "other secret"
+        self.assertEqual(killswitch.verifyPeerDatagram(datagram)[0], "bad_hmac")
+
+    def testTamperedPayloadIsRejected(self):
+        datagram = bytearray(self.buildFromPeer())
+        datagram[-40] ^= 1
+        self.assertEqual(killswitch.verifyPeerDatagram(bytes(datagram))[0], "bad_hmac")
+
+    def testTruncatedDatagramIsMalformed(self):
+        self.assertEqual(killswitch.verifyPeerDatagram(b"USBKS1")[0], "malformed")
+
+    def testOwnDatagramIsIgnored(self):
+        self.assertEqual(killswitch.verifyPeerDatagram(killswitch.buildPeerDatagram("self"))[0], "own")
+
+    def testTimestampOutsideTheWindowIsStale(self):
+        for offset in (-6, 6):
+            datagram = self.buildFromPeer(sentAt=time.time() + offset)
+            self.assertEqual(killswitch.verifyPeerDatagram(datagram)[0], "stale")
+        datagram = self.buildFromPeer(sentAt=time.time() - 4)
+        self.assertEqual(killswitch.verifyPeerDatagram(datagram)[0], "accepted")
+
+    def testReplayedNonceIsDuplicate(self):
+        datagram = self.buildFromPeer(nonce=b"n" * 16)
+        self.assertEqual(killswitch.verifyPeerDatagram(datagram)[0], "accepted")
+        self.assertEqual(killswitch.verifyPeerDatagram(datagram)[0], "duplicate")
+        # A fresh datagram reusing the nonce is still a replay
+        self.assertEqual(killswitch.verifyPeerDatagram(self.buildFromPeer(nonce=b"n" * 16))[0], "duplicate")
+
+    def testNoncesAreForgottenAfterTheWindow(self):
+        killswitch.peerSeenNonces[b"old" + b"\0" * 13] = time.time() - 1
+        killswitch.verifyPeerDatagram(self.buildFromPeer())
+        self.assertNotIn(b"old" + b"\0" * 13, killswitch.peerSeenNonces)
+
+    def testParsePeerDestination(self):
+        killswitch.peerPort = 47474
+        self.assertEqual(killswitch.parsePeerDestination("239.77.77.77"), ("239.77.77.77", 47474))
+        self.assertEqual(killswitch.parsePeerDestination("10.0.0.2:5000"), ("10.0.0.2", 5000))
+        self.assertEqual(killswitch.parsePeerDestination("host:port"), ("host:port", 47474))
+
+    def testLoopbackPeerInstance(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind(("127.0.0.1", 0))
+            killswitch.peerPort = probe.getsockname()[1]
+        killswitch.peerDestinations = [f"127.0.0.1:{killswitch.peerPort}"]
+        triggers = []
+        killswitch.executeTasks = lambda fromPeer=False, detectedAt=None: triggers.append(fromPeer)
+        
+        listener = killswitch.openPeerListener()
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        try:
+            # The second instance runs in its own interpreter, with its own node id
+            sender = (f"import sys; sys.path.insert(0, {repoRoot!r}); import killswitch; "
+                      f"killswitch.logMessage = lambda message: None; "
+                      f"killswitch.peerSecret = {killswitch.peerSecret!r}; "
+                      f"killswitch.peerDestinations = {killswitch.peerDestinations!r}; "
+                      f"killswitch.sendPeerTrigger('instance b')")
+            subprocess.run([sys.executable, "-c", sender], check=True, timeout=30)
+            
+            received = 0
+            while received < killswitch.peerSendCopies and selector.select(timeout=5):
+                datagram, address = listener.recvfrom(2048)
+                killswitch.handlePeerDatagram(datagram, address)
+                received += 1
+        finally:
+            selector.close()
+            listener.close()
+        
+        self.assertEqual(received, killswitch.peerSendCopies)
+        # Every copy arrived, but only the first one triggers a lockdown
+        self.assertEqual(triggers, [True])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+repoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repoRoot)
+import killswitch
+
+class InheritedGateTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (killswitch.usbSysfsRoot, killswitch.logMessage, killswitch.usbAuthorizedDefaults,
+                      killswitch.inheritedUsbAuthorizedDefaults)
+        killswitch.logMessage = lambda message: None
+        killswitch.usbSysfsRoot = tempfile.mkdtemp()
+        self.rootHub = os.path.join(killswitch.usbSysfsRoot, "bus/usb/devices/usb1")
+        os.makedirs(self.rootHub)
+        with open(os.path.join(self.rootHub, "idVendor"), "w") as idFile:
+            idFile.write("1d6b")
+        self.controlPath = os.path.join(self.rootHub, "authorized_default")
+
+    def tearDown(self):
+        shutil.rmtree(killswitch.usbSysfsRoot)
+        (killswitch.usbSysfsRoot, killswitch.logMessage, killswitch.usbAuthorizedDefaults,
+         killswitch.inheritedUsbAuthorizedDefaults) = self.saved
+
+    def readControl(self):
+        with open(self.controlPath) as controlFile:
+            return controlFile.read()
+
+    def testSettingsHandOverKeepsTheOriginalDefaults(self):
+        with open(self.controlPath, "w") as controlFile:
+            controlFile.write("1")
+        killswitch.armUsbAuthorizationGate()
+        self.assertEqual(self.readControl(), "0")
+        
+        # What the old process hands over through the settings memfd, as seen by the new one
+        settingsFd = killswitch.writeRestoreSettings({"usbAuthorizedDefaults": killswitch.usbAuthorizedDefaults})
+        os.environ[killswitch.restoreSettingsVariable] = str(settingsFd)
+        settings = killswitch.readRestoreSettings()
+        killswitch.usbAuthorizedDefaults = {}
+        killswitch.inheritedUsbAuthorizedDefaults = settings["usbAuthorizedDefaults"]
+        
+        # Re-arming in the new process sees the closed controller but must still restore the original value
+        killswitch.armUsbAuthorizationGate()
+        self.assertEqual(killswitch.usbAuthorizedDefaults, {self.controlPath: "1"})
+        self.assertEqual(killswitch.inheritedUsbAuthorizedDefaults, {})
+        killswitch.disarmUsbAuthorizationGate()
+        self.assertEqual(self.readControl(), "1")
+
+# Runs from the copy on the tmpfs and arms through the real execRamImage, only the exec itself is faked
+driverScript = textwrap.dedent("""
+    import json, os, subprocess, sys
+    sourceDir, armedScript = sys.argv[1], sys.argv[2]
+    sys.path.insert(0, sourceDir)
+    import killswitch
+    killswitch.logMessage = lambda message: None
+    killswitch.usbAuthorizedDefaults = {"/sys/bus/usb/devices/usb1/authorized_default": "1"}
+    # There are no widgets without a display, the rest of the snapshot is what the GUI would hand over
+    killswitch.snapshotGuiSettings = lambda: {"widgets": {}, "tasks": [], "processes": [], "commands": [],
+                                              "usbAuthorizedDefaults": killswitch.usbAuthorizedDefaults}
+    
+    def fakeExecve(path, argv, environment):
+        # The source disappears between building the image and running it
+        subprocess.run(["umount", "-l", sourceDir], check=True)
+        sourceGone = not os.path.exists(os.path.join(sourceDir, "killswitch.py"))
+        imageFd = int(argv[1].rsplit("/", 1)[1])
+        settingsFd = int(environment[killswitch.restoreSettingsVariable])
+        result = subprocess.run([path, "-c", armedScript, argv[1]], env=environment, pass_fds=(imageFd, settingsFd),
+                                capture_output=True, text=True)
+        sys.stderr.write(result.stderr)
+        report = json.loads(result.stdout.splitlines()[-1]) if result.returncode == 0 else {}
+        report["sourceGone"] = sourceGone
+        print(json.dumps(report))
+        sys.stdout.flush()
+        # A real exec never returns
+        os._exit(result.returncode)
+    
+    os.execve = fakeExecve
+    killswitch.execRamImage(["identifier"])
+    sys.exit("execRamImage returned instead of re-executing")
+""")
+
+# What the re-executed image runs, minus the GUI: the real settings handoff, restore and memory lock
+armedScript = textwrap.dedent("""
+    import json, sys, zipimport
+    image = sys.argv[1]
+    sys.path.insert(0, image)
+    namespace = {"__name__": "killswitch", "__file__": image + "/__main__.py"}
+    exec(zipimport.zipimporter(image).get_code("__main__"), namespace)
+    messages = []
+    restored = []
+    namespace["logMessage"] = messages.append
+    namespace["restoreGuiSettings"] = restored.append
+    namespace["onStartButtonClick"] = lambda: namespace.update(monitoring=True)
+    namespace["restoreArmedSession"]()
+    
+    namespace["selectedTasks"][:] = ["End Process", "Delete File"]
+    namespace["processesToKill"][:] = ["usb-killswitch-test-no-such-process"]
+    namespace["fileToDelete"] = "/nonexistent/usb-killswitch-test"
+    opened = []
+    sys.addaudithook(lambda event, args: opened.append(args[0]) if event == "open" and isinstance(args[0], str)
+                     and args[0].endswith((".py", ".pyc", ".so")) else None)
+    before = set(sys.modules)
+    namespace["executeTasks"]()
+    print(json.dumps({"fromImage": namespace["runningFromRamImage"], "restored": len(restored),
+                      "monitoring": namespace["monitoring"], "inherited": namespace["inheritedUsbAuthorizedDefaults"],
+                      "locked": "Armed process locked in memory." in messages,
+                      "opened": opened, "imported": sorted(set(sys.modules) - before)}))
+""")
+
+@unittest.skipUnless(os.geteuid() == 0 and shutil.which("mount"), "needs root to mount a tmpfs")
+class UnmountedSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.sourceDir = tempfile.mkdtemp()
+        if subprocess.run(["mount", "-t", "tmpfs", "tmpfs", self.sourceDir], capture_output=True).returncode != 0:
+            os.rmdir(self.sourceDir)
+            self.skipTest("cannot mount a tmpfs")
+        shutil.copy(os.path.join(repoRoot, "killswitch.py"), self.sourceDir)
+
+    def tearDown(self):
+        subprocess.run(["umount", "-l", self.sourceDir], capture_output=True)
+        os.rmdir(self.sourceDir)
+
+    def testReexecutedImageRunsWithTheSourceUnmounted(self):
+        result = subprocess.run([sys.executable, "-c", driverScript, self.sourceDir, armedScript],
+                                capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout.splitlines()[-1])
+        self.assertTrue(report["sourceGone"])
+        self.assertTrue(report["fromImage"])
+        self.assertEqual(report["restored"], 1)
+        self.assertTrue(report["monitoring"])
+        self.assertTrue(report["locked"])
+        self.assertEqual(report["inherited"], {"/sys/bus/usb/devices/usb1/authorized_default": "1"})
+        self.assertEqual(report["opened"], [])
+        self.assertEqual(report["imported"], [])
+
+if __name__ == "__main__":
+    unittest.main()
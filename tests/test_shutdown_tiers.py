@@ -0,0 +1,84 @@
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+class GarbageBus:
+    # Accepts the D-Bus handshake, then answers with a reply whose body is too short for its signature
+    def __init__(self, path):
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        try:
+            connection, _ = self.server.accept()
+        except OSError:
+            return
+        with connection:
+            connection.recv(256)
+            connection.sendall(b"OK 0123456789abcdef0123456789abcdef\r\n")
+            received = b""
+            while b"BEGIN\r\n" not in received:
+                chunk = connection.recv(4096)
+                if not chunk:
+                    return
+                received += chunk
+            # A method return for the PowerOff call whose signature promises a uint32 but whose body has two bytes
+            fields = b"\x05\x01u\x00" + struct.pack("<I", 2) + b"\x08\x01g\x00\x01u\x00"
+            connection.sendall(b"l\x02\x01\x01" + struct.pack("<III", 2, 2, len(fields)) + fields + b"\x00" + b"\x00\x00")
+            while connection.recv(4096):
+                pass
+
+    def close(self):
+        self.server.close()
+
+class ShutdownTierTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.busPath = os.path.join(self.directory, "system_bus_socket")
+        self.saved = (killswitch.logMessage, killswitch.shutdownMode, killswitch.shutdownDryRun,
+                      os.environ.get("DBUS_SYSTEM_BUS_ADDRESS"))
+        killswitch.logMessage = lambda message: None
+        killswitch.shutdownMode = "normal"
+        killswitch.shutdownDryRun = False
+        os.environ["DBUS_SYSTEM_BUS_ADDRESS"] = f"unix:path={self.busPath}"
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        killswitch.logMessage, killswitch.shutdownMode, killswitch.shutdownDryRun, busAddress = self.saved
+        if busAddress is None:
+            os.environ.pop("DBUS_SYSTEM_BUS_ADDRESS", None)
+        else:
+            os.environ["DBUS_SYSTEM_BUS_ADDRESS"] = busAddress
+
+    def testGarbageLogindReplyFallsThroughToCommand(self):
+        commands = []
+        bus = GarbageBus(self.busPath)
+        try:
+            with mock.patch.object(killswitch.subprocess, "run",
+                                   side_effect=lambda command, **kwargs: commands.append(command)):
+                killswitch.shutdownSystem()
+        finally:
+            bus.close()
+        self.assertEqual(commands, ["sudo shutdown -h now"])
+
+    def testAnyTierErrorFallsThrough(self):
+        commands = []
+        with mock.patch.object(killswitch, "powerOffWithLogind", side_effect=IndexError("short reply")), \
+             mock.patch.object(killswitch.subprocess, "run",
+                               side_effect=lambda command, **kwargs: commands.append(command)):
+            killswitch.shutdownSystem()
+        self.assertEqual(commands, ["sudo shutdown -h now"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+# Looked up by its function, so a renamed action cannot leave the tests selecting nothing
+sanitizeAction = next(name for name, action in killswitch.actionRegistry.items()
+                      if action["run"] is killswitch.sanitizeMemoryAndSwap)
+cryptTable = "0 1048576 crypt aes-xts-plain64 {key} 0 8:3 4096 1 allow_discards\n"
+
+class FakeLibc:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def swapoff(self, path):
+        self.calls.append(["swapoff", path.decode()])
+        return 0
+
+    def swapon(self, path, flags):
+        self.calls.append(["swapon", path.decode()])
+        return 0
+
+class SwapStepPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (killswitch.logMessage, killswitch.libc, killswitch.selectedTasks, killswitch.swapsPath)
+        killswitch.logMessage = lambda message: None
+
+    def tearDown(self):
+        (killswitch.logMessage, killswitch.libc, killswitch.selectedTasks, killswitch.swapsPath) = self.saved
+
+    def testSanitizeActionIsScheduled(self):
+        killswitch.selectedTasks = [sanitizeAction]
+        self.assertEqual(killswitch.buildTaskSchedule(), [sanitizeAction])
+
+    def testPageCachesAreDroppedThroughTheSharedHelper(self):
+        with mock.patch.object(killswitch, "getSanitizeFilesystems", return_value=[]), \
+             mock.patch.object(killswitch, "evictFiles"), \
+             mock.patch.object(killswitch, "listSwapDevices", return_value=[]), \
+             mock.patch.object(killswitch, "dropPageCaches", return_value=True) as dropPageCaches:
+            self.assertTrue(killswitch.sanitizeMemoryAndSwap(5))
+        dropPageCaches.assert_called_once_with()
+
+    def testRekeyPlanSuspendsReloadsAndResumes(self):
+        oldKey = "ab" * 64
+        commands = killswitch.buildRekeyCommands("cryptswap", cryptTable.format(key=oldKey))
+        self.assertEqual([command for command, _ in commands],
+                         [["dmsetup", "suspend", "cryptswap"], ["dmsetup", "reload", "cryptswap"],
+                          ["dmsetup", "resume", "cryptswap"]])
+        self.assertEqual([tableInput is None for _, tableInput in commands], [True, False, True])
+        
+        newFields = commands[1][1].split()
+        oldFields = cryptTable.format(key=oldKey).split()
+        self.assertEqual(len(newFields[4]), len(oldKey))
+        self.assertNotEqual(newFields[4], oldKey)
+        self.assertEqual(newFields[:4] + newFields[5:], oldFields[:4] + oldFields[5:])
+        # The key only ever travels through stdin
+        self.assertFalse(any(newFields[4] in " ".join(command) for command, _ in commands))
+
+    def testRekeyPlanKeepsKeyringKeyLength(self):
+        commands = killswitch.buildRekeyCommands("cryptswap", cryptTable.format(key=":32:logon:cryptsetup:swap"))
+        self.assertEqual(len(commands[1][1].split()[4]), 64)
+
+    def testRekeyPlanRefusesOtherTargets(self):
+        self.assertIsNone(killswitch.buildRekeyCommands("vg-swap", "0 1048576 linear 8:3 0\n"))
+        self.assertIsNone(killswitch.buildRekeyCommands("cryptswap", ""))
+
+    def testMkswapKeepsIdentity(self):
+        uuid = "0a1b2c3d-0000-4000-8000-0123456789ab"
+        self.assertEqual(killswitch.buildMkswapCommand("/dev/sda3", uuid, "swap"),
+                         ["mkswap", "-U", uuid, "-L", "swap", "/dev/sda3"])
+        self.assertEqual(killswitch.buildMkswapCommand("/swapfile", None, None), ["mkswap", "/swapfile"])
+
+    def testCryptSwapStepOrder(self):
+        calls = []
+        killswitch.libc = FakeLibc(calls)
+        killswitch.selectedTasks = [sanitizeAction]
+        
+        def run(command, input=None, **kwargs):
+            calls.append(command)
+            stdout = cryptTable.format(key="cd" * 32) if command[:2] == ["dmsetup", "table"] else ""
+            return subprocess.CompletedProcess(command, 0, stdout, "")
+        
+        results = {}
+        with mock.patch.object(killswitch, "getCryptMapping", return_value="cryptswap"), \
+             mock.patch.object(killswitch, "readSwapIdentity", return_value=("0a1b2c3d-0000-4000-8000-0123456789ab", "swap")), \
+             mock.patch.object(killswitch.subprocess, "run", side_effect=run):
+            killswitch.sanitizeSwapDevice({"path": "/dev/mapper/cryptswap", "type": "partition"},
+                                          time.monotonic() + 30, results)
+        
+        self.assertEqual(results, {"/dev/mapper/cryptswap": True})
+        self.assertEqual([" ".join(call[:2]) for call in calls],
+                         ["swapoff /dev/mapper/cryptswap", "dmsetup table", "dmsetup suspend", "dmsetup reload",
+                          "dmsetup resume", "mkswap -U", "swapon /dev/mapper/cryptswap"])
+
+    def testShutdownSkipsReenabling(self):
+        calls = []
+        killswitch.libc = FakeLibc(calls)
+        killswitch.selectedTasks = [sanitizeAction, "Shutdown"]
+        results = {}
+        with mock.patch.object(killswitch, "getCryptMapping", return_value="cryptswap"), \
+             mock.patch.object(killswitch, "readSwapIdentity", return_value=(None, None)), \
+             mock.patch.object(killswitch.subprocess, "run",
+                               side_effect=lambda command, **kwargs: subprocess.CompletedProcess(
+                                   command, 0, cryptTable.format(key="cd" * 32), "")):
+            killswitch.sanitizeSwapDevice({"path": "/dev/dm-1", "type": "partition"}, time.monotonic() + 30, results)
+        self.assertEqual(results, {"/dev/dm-1": True})
+        self.assertNotIn(["swapon", "/dev/dm-1"], calls)
+
+    def testListSwapDevices(self):
+        with tempfile.NamedTemporaryFile("w", delete=False) as swapsFile:
+            swapsFile.write("Filename\t\t\t\tType\t\tSize\t\tUsed\t\tPriority\n"
+                            "/dev/dm-1                               partition\t8388604\t\t1024\t\t-2\n"
+                            "/swap\\040file                           file\t\t1048572\t\t0\t\t-3\n")
+        killswitch.swapsPath = swapsFile.name
+        try:
+            self.assertEqual(killswitch.listSwapDevices(),
+                             [{"path": "/dev/dm-1", "type": "partition", "size": 8388604 * 1024, "used": 1024 * 1024},
+                              {"path": "/swap file", "type": "file", "size": 1048572 * 1024, "used": 0}])
+        finally:
+            os.remove(swapsFile.name)
+
+    def testReadSwapIdentity(self):
+        pageSize = os.sysconf("SC_PAGE_SIZE")
+        header = bytearray(pageSize)
+        header[1036:1052] = bytes.fromhex("0a1b2c3d00004000800001234567890a")
+        header[1052:1058] = b"swap01"
+        header[pageSize - 10:] = b"SWAPSPACE2"
+        with tempfile.NamedTemporaryFile(delete=False) as swapFile:
+            swapFile.write(header)
+        try:
+            self.assertEqual(killswitch.readSwapIdentity(swapFile.name),
+                             ("0a1b2c3d-0000-4000-8000-01234567890a", "swap01"))
+            with open(swapFile.name, "r+b") as rewrite:
+                rewrite.seek(pageSize - 10)
+                rewrite.write(b"NOTASWAP!!")
+            self.assertEqual(killswitch.readSwapIdentity(swapFile.name), (None, None))
+        finally:
+            os.remove(swapFile.name)
+
+@unittest.skipUnless(os.geteuid() == 0 and shutil.which("losetup") and shutil.which("mkswap"),
+                     "needs root, losetup and mkswap")
+class LoopSwapTest(unittest.TestCase):
+    size = 16 * 1024 * 1024
+    uuid = "0a1b2c3d-0000-4000-8000-0123456789ab"
+
+    def setUp(self):
+        self.saved = (killswitch.logMessage, killswitch.selectedTasks)
+        killswitch.logMessage = lambda message: None
+        killswitch.selectedTasks = [sanitizeAction]
+        handle, self.backingFile = tempfile.mkstemp()
+        os.ftruncate(handle, self.size)
+        os.close(handle)
+        self.device = subprocess.run(["losetup", "--find", "--show", self.backingFile],
+                                     capture_output=True, text=True).stdout.strip()
+        if not self.device:
+            os.remove(self.backingFile)
+            self.skipTest("no loop device available")
+        subprocess.run(["mkswap", "-U", self.uuid, "-L", "kstest", self.device], capture_output=True, check=True)
+        if killswitch.libc is None or killswitch.libc.swapon(self.device.encode(), 0) != 0:
+            self.tearDown()
+            self.skipTest("swapon is not permitted here")
+
+    def tearDown(self):
+        if any(swap["path"] == self.device for swap in killswitch.listSwapDevices()):
+            killswitch.libc.swapoff(self.device.encode())
+        (killswitch.logMessage, killswitch.selectedTasks) = self.saved
+        subprocess.run(["losetup", "--detach", self.device], capture_output=True)
+        os.remove(self.backingFile)
+
+    def testLoopSwapIsWipedAndReenabled(self):
+        swap = next(swap for swap in killswitch.listSwapDevices() if swap["path"] == self.device)
+        results = {}
+        killswitch.sanitizeSwapDevice(swap, time.monotonic() + 30, results)
+        self.assertEqual(results, {self.device: True})
+        self.assertIn(self.device, [swap["path"] for swap in killswitch.listSwapDevices()])
+        self.assertEqual(killswitch.readSwapIdentity(self.device), (self.uuid, "kstest"))
+
+if __name__ == "__main__":
+    unittest.main()
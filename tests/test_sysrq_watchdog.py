@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+class SysrqWatchdogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved = (killswitch.shutdownDryRun, killswitch.sysrqDryRunPath, killswitch.sysrqStepDelay, killswitch.logMessage)
+        killswitch.shutdownDryRun = True
+        killswitch.sysrqDryRunPath = os.path.join(self.directory, "sysrq")
+        killswitch.sysrqStepDelay = 0
+        killswitch.logMessage = lambda message: None
+
+    def tearDown(self):
+        (killswitch.shutdownDryRun, killswitch.sysrqDryRunPath, killswitch.sysrqStepDelay, killswitch.logMessage) = self.saved
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def testExceededBudgetWritesSyncRemountPowerOff(self):
+        killswitch.sysrqEmergencyWatchdog(threading.Event(), 0.01)
+        with open(killswitch.sysrqDryRunPath) as sink:
+            self.assertEqual(sink.read(), "suo")
+        self.assertEqual(os.stat(killswitch.sysrqDryRunPath).st_mode & 0o777, 0o600)
+
+    def testCompletedLockdownWritesNothing(self):
+        completeEvent = threading.Event()
+        completeEvent.set()
+        killswitch.sysrqEmergencyWatchdog(completeEvent, 5)
+        self.assertFalse(os.path.exists(killswitch.sysrqDryRunPath))
+
+    def testSinkDoesNotFollowSymlinks(self):
+        target = os.path.join(self.directory, "target")
+        open(target, "w").close()
+        os.symlink(target, killswitch.sysrqDryRunPath)
+        with self.assertRaises(OSError):
+            killswitch.writeSysrq("s")
+        self.assertEqual(os.path.getsize(target), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+devicePath = "/devices/pci0000:00/0000:00:14.0/usb1/1-2"
+
+def buildUevent(action="add", devtype="usb_device", devpath=devicePath):
+    return (f"{action}@{devpath}\0ACTION={action}\0DEVPATH={devpath}\0SUBSYSTEM=usb\0"
+            f"DEVTYPE={devtype}\0SEQNUM=4242\0").encode()
+
+class UsbGateTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (killswitch.usbSysfsRoot, killswitch.usbAllowlist, killswitch.usbMonitoring,
+                      killswitch.usbAuthorizedDefaults, killswitch.logMessage)
+        killswitch.logMessage = lambda message: None
+        killswitch.usbSysfsRoot = tempfile.mkdtemp()
+        self.device = os.path.join(killswitch.usbSysfsRoot, devicePath.lstrip("/"))
+        os.makedirs(self.device)
+        for name, value in (("idVendor", "0781"), ("idProduct", "5581"), ("serial", "4C530001"), ("authorized", "0")):
+            with open(os.path.join(self.device, name), "w") as attribute:
+                attribute.write(value + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(killswitch.usbSysfsRoot)
+        (killswitch.usbSysfsRoot, killswitch.usbAllowlist, killswitch.usbMonitoring,
+         killswitch.usbAuthorizedDefaults, killswitch.logMessage) = self.saved
+
+    def readAuthorized(self):
+        return killswitch.readSysfsValue(os.path.join(self.device, "authorized"))
+
+    def testAllowlistedDeviceIsAuthorized(self):
+        killswitch.usbAllowlist = {("0781", "5581", "4C530001")}
+        self.assertFalse(killswitch.handleUsbUevent(killswitch.parseUevent(buildUevent())))
+        self.assertEqual(self.readAuthorized(), "1")
+
+    def testUnknownDeviceStaysInertAndTriggers(self):
+        killswitch.usbAllowlist = {("0781", "5581", "OTHERSERIAL")}
+        self.assertTrue(killswitch.handleUsbUevent(killswitch.parseUevent(buildUevent())))
+        self.assertEqual(self.readAuthorized(), "0")
+
+    def testOtherEventsAreIgnored(self):
+        killswitch.usbAllowlist = set()
+        for data in (buildUevent(action="remove"), buildUevent(devtype="usb_interface"), b"", b"libudev\0\xff\xfe",
+                     b"add@/devices\0ACTION\0DEVPATH\0", b"\0\0=\0=\0"):
+            self.assertFalse(killswitch.handleUsbUevent(killswitch.parseUevent(data)), data)
+        self.assertEqual(self.readAuthorized(), "0")
+
+    def testMonitorTriggersOnlyForUnknownDevices(self):
+        killswitch.usbAllowlist = set()
+        killswitch.usbMonitoring = True
+        killswitch.usbAuthorizedDefaults = {}
+        triggers = []
+        
+        def executeTasks():
+            triggers.append("usb_gate")
+            killswitch.usbMonitoring = False
+        
+        receiver, sender = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.settimeout(1)
+        with sender:
+            sender.send(b"\xff\x00garbage\x00")
+            sender.send(buildUevent(action="remove"))
+            sender.send(buildUevent())
+            with mock.patch.object(killswitch, "executeTasks", side_effect=executeTasks), \
+                 mock.patch.object(killswitch, "recordTrigger"):
+                killswitch.monitorUsbUevents(receiver)
+        self.assertEqual(triggers, ["usb_gate"])
+        self.assertEqual(receiver.fileno(), -1)
+
+if __name__ == "__main__":
+    unittest.main()
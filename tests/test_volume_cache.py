@@ -0,0 +1,59 @@
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import killswitch
+
+mounted = [("/dev/sda1", "/"), ("/dev/sdb1", "/media/user/STICK"), ("/dev/sdc1", "/mnt/scratch")]
+
+class VolumeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (killswitch.systemVolumesCache, killswitch.nonSystemVolumesCache, killswitch.lastCacheUpdate,
+                      killswitch.logMessage)
+        killswitch.logMessage = lambda message: None
+        self.patches = [mock.patch.object(killswitch, "getMountedUsbVolumes", return_value=mounted),
+                        mock.patch.object(killswitch, "isFstabVolume", return_value=False)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        (killswitch.systemVolumesCache, killswitch.nonSystemVolumesCache, killswitch.lastCacheUpdate,
+         killswitch.logMessage) = self.saved
+
+    def testUpdateSwapsInCompleteCaches(self):
+        killswitch.systemVolumesCache = ["/dev/stale", "/stale"]
+        killswitch.updateVolumeCache()
+        self.assertEqual(killswitch.systemVolumesCache, ["/dev/sda1", "/", "/dev/sdc1", "/mnt/scratch"])
+        self.assertEqual(killswitch.nonSystemVolumesCache, ["/dev/sdb1", "/media/user/STICK"])
+        with mock.patch.object(killswitch, "classifyVolume") as classify:
+            self.assertFalse(killswitch.isSystemVolume("/dev/sdb1", "/media/user/STICK"))
+            self.assertTrue(killswitch.isSystemVolume("/dev/sda1", "/"))
+            classify.assert_not_called()
+
+    def testConcurrentReadersAndUpdatesAgree(self):
+        errors = []
+        
+        def reader():
+            for _ in range(2000):
+                if killswitch.isSystemVolume("/dev/sdb1", "/media/user/STICK") or \
+                        not killswitch.isSystemVolume("/dev/sda1", "/"):
+                    errors.append("misclassified")
+        
+        def updater():
+            for _ in range(200):
+                killswitch.updateVolumeCache()
+        
+        threads = [threading.Thread(target=reader) for _ in range(4)] + [threading.Thread(target=updater)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+if __name__ == "__main__":
+    unittest.main()